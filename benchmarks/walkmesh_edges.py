@@ -0,0 +1,178 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Compares walkmesh edge adjacency and perimeter extraction against the
+# quadratic implementation BwmWriter.peek_edges used to have, on shuffled grid
+# walkmeshes with random holes. Runs outside Blender:
+#
+#   python benchmarks/walkmesh_edges.py [--sizes 16 32 48 64 100]
+
+import argparse
+import importlib.util
+import os
+import random
+import time
+
+MESHTOPOLOGY_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    "io_scene_kotor",
+    "meshtopology.py",
+)
+
+
+def load_meshtopology():
+    # Loaded by path, as importing the addon package requires Blender
+    spec = importlib.util.spec_from_file_location("meshtopology", MESHTOPOLOGY_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_grid_walkmesh(num_x, num_y, hole_chance, rng):
+    faces = []
+    for y in range(num_y):
+        for x in range(num_x):
+            if rng.random() < hole_chance:
+                continue
+            vert_idx = y * (num_x + 1) + x
+            faces.append([vert_idx, vert_idx + 1, vert_idx + num_x + 2])
+            faces.append([vert_idx, vert_idx + num_x + 2, vert_idx + num_x + 1])
+    rng.shuffle(faces)
+    return faces
+
+
+def generate_roomlinks(faces, rng):
+    return {rng.randrange(3 * len(faces) + 1): rng.randint(0, 3) for _ in range(5)}
+
+
+def legacy_edges(faces, roomlinks):
+    num_faces = len(faces)
+    adjacent_edges = [[-1, -1, -1] for _ in range(num_faces)]
+    for face_idx in range(num_faces):
+        face = faces[face_idx]
+        edges = [
+            tuple(sorted(edge))
+            for edge in [(face[0], face[1]), (face[1], face[2]), (face[2], face[0])]
+        ]
+        for other_face_idx in range(face_idx + 1, num_faces):
+            other_face = faces[other_face_idx]
+            other_edges = [
+                tuple(sorted(edge))
+                for edge in [
+                    (other_face[0], other_face[1]),
+                    (other_face[1], other_face[2]),
+                    (other_face[2], other_face[0]),
+                ]
+            ]
+            num_adj_edges = 0
+            for i in range(3):
+                if adjacent_edges[face_idx][i] != -1:
+                    num_adj_edges += 1
+                    continue
+                for j in range(3):
+                    if edges[i] == other_edges[j]:
+                        adjacent_edges[face_idx][i] = 3 * other_face_idx + j
+                        adjacent_edges[other_face_idx][j] = 3 * face_idx + i
+                        num_adj_edges += 1
+                        break
+            if num_adj_edges == 3:
+                break
+
+    outer_edges = []
+    perimeters = []
+    visited_edges = set()
+    for i in range(num_faces):
+        for j in range(3):
+            if adjacent_edges[i][j] != -1:
+                continue
+            edge_idx = 3 * i + j
+            if edge_idx in visited_edges:
+                continue
+            next_face = i
+            next_edge = j
+            while next_face != -1:
+                adj_edge_idx = adjacent_edges[next_face][next_edge]
+                if adj_edge_idx == -1:
+                    edge_idx = 3 * next_face + next_edge
+                    if not edge_idx in visited_edges:
+                        transition = roomlinks.get(edge_idx, -1)
+                        outer_edges.append((edge_idx, transition))
+                        visited_edges.add(edge_idx)
+                        next_edge = (next_edge + 1) % 3
+                    else:
+                        next_face = -1
+                        perimeters.append(len(outer_edges))
+                else:
+                    next_face = adj_edge_idx // 3
+                    next_edge = ((adj_edge_idx % 3) + 1) % 3
+
+    return adjacent_edges, outer_edges, perimeters
+
+
+def current_edges(meshtopology, faces, roomlinks):
+    adjacent_edges = meshtopology.compute_edge_adjacency(faces)
+    outer_edges, perimeters = meshtopology.compute_perimeters(adjacent_edges)
+    outer_edges = [(edge_idx, roomlinks.get(edge_idx, -1)) for edge_idx in outer_edges]
+    return adjacent_edges, outer_edges, perimeters
+
+
+def check_equal(meshtopology, num_cases, rng):
+    for _ in range(num_cases):
+        faces = generate_grid_walkmesh(
+            rng.randint(1, 8), rng.randint(1, 8), 0.4 * rng.random(), rng
+        )
+        roomlinks = generate_roomlinks(faces, rng)
+        if legacy_edges(faces, roomlinks) != current_edges(
+            meshtopology, faces, roomlinks
+        ):
+            raise RuntimeError("Edges differ from legacy implementation")
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 32, 48, 64, 100])
+    parser.add_argument("--holes", type=float, default=0.05)
+    parser.add_argument("--max-legacy-faces", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    meshtopology = load_meshtopology()
+    check_equal(meshtopology, 300, random.Random(args.seed))
+
+    print("{:>8} {:>10} {:>10}".format("faces", "legacy", "current"))
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        faces = generate_grid_walkmesh(size, size, args.holes, rng)
+        roomlinks = generate_roomlinks(faces, rng)
+        current = measure(current_edges, meshtopology, faces, roomlinks)
+        if len(faces) <= args.max_legacy_faces:
+            legacy = "{:.3f}s".format(measure(legacy_edges, faces, roomlinks))
+        else:
+            legacy = "-"
+        print("{:>8} {:>10} {:>9.3f}s".format(len(faces), legacy, current))
+
+
+if __name__ == "__main__":
+    main()
@@ -16,124 +16,230 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-from mathutils import Vector
+import hashlib
 
-from .utils import is_close
+import numpy as np
 
+BOUND = np.float32(100000.0)
+SAH_NUM_BINS = 16
+SAH_MIN_FACES = 16
 
-class BoundingBox:
-    def __init__(self, min, max, center):
-        self.min = min
-        self.max = max
-        self.center = center
 
-    def longest_axis(self):
-        size = self.max - self.min
-        if size.y > size.x and size.y > size.z:
-            return 1  # Y
-        elif size.z > size.x and size.z > size.y:
-            return 2  # Z
-        else:
-            return 0  # X
-
-
-def generate_tree(aabb_tree, faces, depth=0):
-    if depth > 128:
-        raise ValueError("depth must not exceed 128, but is equal to {}".format(depth))
-    if not faces:
+def generate_tree(verts, faces, sah=False):
+    verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if not len(faces):
         raise ValueError("faces must not be empty")
 
-    bounding_box = compute_bounding_box(faces)
-
-    # Only one face left - this node is a leaf
-    if len(faces) == 1:
-        face_idx = faces[0][0]
-        aabb_tree.append(new_aabb_node(bounding_box, -1, -1, face_idx, 0))
-        return
-
-    split_axis = find_split_axis(bounding_box, faces)
-    left_faces, right_faces, actual_split_axis = split_faces(
-        bounding_box, faces, split_axis
+    face_verts = verts[faces]
+    face_min = face_verts.min(axis=1)
+    face_max = face_verts.max(axis=1)
+    centroids = face_verts[:, 0] + face_verts[:, 1] + face_verts[:, 2]
+    centroids *= np.float32(1.0) / np.float32(3.0)
+
+    # Faces of every node occupy a contiguous range of this array, and child
+    # ranges are produced by partitioning the range of their parent
+    face_order = np.arange(len(faces))
+
+    # Nodes are split level by level, all nodes of a level at once. A subtree
+    # with N faces has 2N-1 nodes, which gives depth-first indices of children.
+    num_nodes = 2 * len(faces) - 1
+    boxes = np.zeros((num_nodes, 6), dtype=np.float32)
+    links = np.zeros((num_nodes, 4), dtype=np.int64)
+    starts = np.zeros(1, dtype=np.int64)
+    ends = np.full(1, len(faces), dtype=np.int64)
+    node_indices = np.zeros(1, dtype=np.int64)
+    while len(starts):
+        bb_min, bb_max, split_axes, num_left = split_level(
+            face_order, starts, ends, face_min, face_max, centroids, sah
+        )
+        boxes[node_indices, :3] = bb_min
+        boxes[node_indices, 3:] = bb_max
+
+        internal = num_left > 0
+        left_children = node_indices + 1
+        right_children = node_indices + 2 * num_left
+        links[node_indices, 0] = np.where(internal, left_children, -1)
+        links[node_indices, 1] = np.where(internal, right_children, -1)
+        links[node_indices, 2] = np.where(internal, -1, split_axes)
+        links[node_indices, 3] = np.where(internal, 1 + split_axes, 0)
+
+        mids = starts[internal] + num_left[internal]
+        starts = np.stack((starts[internal], mids), axis=1).ravel()
+        ends = np.stack((mids, ends[internal]), axis=1).ravel()
+        node_indices = np.stack(
+            (left_children[internal], right_children[internal]), axis=1
+        ).ravel()
+
+    return [box + link for box, link in zip(boxes.tolist(), links.tolist())]
+
+
+def split_level(face_order, starts, ends, face_min, face_max, centroids, sah):
+    # Returns bounding boxes of nodes given by ranges of face_order, their
+    # split axes (face indices for leaves) and numbers of faces in left
+    # children (zero for leaves). Partitions face_order ranges in place.
+    num_nodes = len(starts)
+    counts = ends - starts
+    offsets = np.cumsum(counts) - counts
+    node_of_face = np.repeat(np.arange(num_nodes), counts)
+    positions = starts[node_of_face] + np.arange(counts.sum()) - offsets[node_of_face]
+    faces = face_order[positions]
+
+    bb_min = np.minimum(np.minimum.reduceat(face_min[faces], offsets), BOUND)
+    bb_max = np.maximum(np.maximum.reduceat(face_max[faces], offsets), -BOUND)
+
+    # Only one face left - these nodes are leaves
+    split_axes = faces[offsets].copy()
+    num_left = np.zeros(num_nodes, dtype=np.int64)
+    internal = counts > 1
+    if not np.any(internal):
+        return bb_min, bb_max, split_axes, num_left
+
+    # Split plane passes through the average of face centroids. These are
+    # summed sequentially in single precision, grouping nodes of similar size.
+    centers = np.zeros((num_nodes, 3), dtype=np.float32)
+    face_rank = positions - starts[node_of_face]
+    size_class = np.ceil(np.log2(np.maximum(counts, 1))).astype(np.int64)
+    for cls in np.unique(size_class[internal]).tolist():
+        nodes = np.flatnonzero(internal & (size_class == cls))
+        local_idx = np.full(num_nodes, -1)
+        local_idx[nodes] = np.arange(len(nodes))
+        face_mask = local_idx[node_of_face] != -1
+        padded = np.zeros((1 << cls, len(nodes), 3), dtype=np.float32)
+        padded[face_rank[face_mask], local_idx[node_of_face[face_mask]]] = centroids[
+            faces[face_mask]
+        ]
+        centers[nodes] = np.cumsum(padded, axis=0)[-1]
+    centers *= np.float32(1.0) / counts.astype(np.float32)[:, None]
+
+    size = bb_max - bb_min
+    axes = np.where(
+        (size[:, 1] > size[:, 0]) & (size[:, 1] > size[:, 2]),
+        1,
+        np.where((size[:, 2] > size[:, 0]) & (size[:, 2] > size[:, 1]), 2, 0),
     )
 
-    node = new_aabb_node(bounding_box, 0, 0, -1, 1 + actual_split_axis)
-    aabb_tree.append(node)
-    node[6] = len(aabb_tree)
-    generate_tree(aabb_tree, left_faces, depth + 1)
-    node[7] = len(aabb_tree)
-    generate_tree(aabb_tree, right_faces, depth + 1)
-
-
-def compute_bounding_box(faces):
-    min = Vector((100000.0, 100000.0, 100000.0))
-    max = Vector((-100000.0, -100000.0, -100000.0))
-    center = Vector()
-    for face in faces:
-        verts = face[1]
-        for vert in verts:
-            for axis in range(3):
-                if min[axis] > vert[axis]:
-                    min[axis] = vert[axis]
-                if max[axis] < vert[axis]:
-                    max[axis] = vert[axis]
-        face_center = face[2]
-        center = center + face_center
-    center = center / len(faces)
-    return BoundingBox(min, max, center)
-
-
-def find_split_axis(bounding_box, faces):
-    axis = bounding_box.longest_axis()
-
     # Change axis in case points are coplanar with the split plane
-    change = True
-    for face in faces:
-        face_center = face[2]
-        change = change and is_close(face_center[axis], bounding_box.center[axis], 1e-4)
-    if change:
-        axis += 1
-        if axis == 3:
-            axis = 0
-
-    return axis
-
+    face_centroids = centroids[faces]
+    face_axes = axes[node_of_face]
+    distances = np.abs(
+        face_centroids[np.arange(len(faces)), face_axes].astype(np.float64)
+        - centers[node_of_face, face_axes].astype(np.float64)
+    )
+    not_coplanar = np.bincount(
+        node_of_face, weights=distances > 1e-4, minlength=num_nodes
+    )
+    axes = np.where(not_coplanar == 0, (axes + 1) % 3, axes)
 
-def split_faces(bounding_box, faces, split_axis):
     # Put faces on the left and right side of the split plane into separate
     # lists. Try all axises to prevent tree degeneration.
-    left_faces = []
-    right_faces = []
-    for i in range(4):
-        left_faces = []
-        right_faces = []
-        for face in faces:
-            face_center = face[2]
-            if face_center[split_axis] < bounding_box.center[split_axis]:
-                left_faces.append(face)
-            else:
-                right_faces.append(face)
-        if left_faces and right_faces:
-            break
-        # Tree is degenerate. Try another axis, or split into evenly sized
-        # lists if already tried all 3.
-        if i == 3:
-            non_empty_faces = left_faces if left_faces else right_faces
-            empty_faces = left_faces if not left_faces else right_faces
-            num_faces_to_move = int(len(non_empty_faces) / 2)
-            for _ in range(num_faces_to_move):
-                empty_faces.append(non_empty_faces.pop())
-        split_axis = (split_axis + 1) % 3
-    return (left_faces, right_faces, split_axis)
-
-
-def new_aabb_node(
-    bounding_box, left_child_idx, right_child_idx, face_idx, most_significant_plane
-):
-    return [
-        *bounding_box.min[:3],
-        *bounding_box.max[:3],
-        left_child_idx,
-        right_child_idx,
-        face_idx,
-        most_significant_plane,
-    ]
+    left = np.zeros(len(faces), dtype=bool)
+    unresolved = internal.copy()
+    for _ in range(4):
+        face_axes = axes[node_of_face]
+        is_left = (
+            face_centroids[np.arange(len(faces)), face_axes]
+            < centers[node_of_face, face_axes]
+        )
+        node_num_left = np.bincount(node_of_face, weights=is_left, minlength=num_nodes)
+        resolved = unresolved & (node_num_left > 0) & (node_num_left < counts)
+        left = np.where(resolved[node_of_face], is_left, left)
+        num_left[resolved] = node_num_left[resolved]
+        unresolved &= ~resolved
+        axes = np.where(unresolved, (axes + 1) % 3, axes)
+    split_axes[internal] = axes[internal]
+
+    # Tree is degenerate, split into evenly sized lists
+    for node_idx in np.flatnonzero(unresolved).tolist():
+        count = counts[node_idx]
+        num_moved = count // 2
+        moved = np.arange(count - 1, count - num_moved - 1, -1)
+        kept = np.arange(count - num_moved)
+        if node_num_left[node_idx]:
+            rank = np.concatenate((kept, moved))
+            num_left[node_idx] = count - num_moved
+        else:
+            rank = np.concatenate((moved, kept))
+            num_left[node_idx] = num_moved
+        node_faces = faces[offsets[node_idx] : offsets[node_idx] + count]
+        face_order[starts[node_idx] : ends[node_idx]] = node_faces[rank]
+
+    if sah:
+        for node_idx in np.flatnonzero(counts >= SAH_MIN_FACES).tolist():
+            face_range = slice(offsets[node_idx], offsets[node_idx] + counts[node_idx])
+            node_faces = faces[face_range]
+            split = find_sah_split(
+                centroids[node_faces], face_min[node_faces], face_max[node_faces]
+            )
+            if split:
+                split_axes[node_idx], left[face_range] = split
+                num_left[node_idx] = np.count_nonzero(left[face_range])
+                unresolved[node_idx] = False
+
+    # Stable partition of faces of every node into left and right
+    resolved = internal & ~unresolved
+    face_mask = resolved[node_of_face]
+    partition = np.argsort(
+        2 * node_of_face[face_mask] + ~left[face_mask], kind="stable"
+    )
+    face_order[positions[face_mask]] = faces[face_mask][partition]
+
+    return bb_min, bb_max, split_axes, num_left
+
+
+def find_sah_split(centroids, face_min, face_max, num_bins=SAH_NUM_BINS):
+    num_faces = len(centroids)
+    centroid_min = centroids.min(axis=0)
+    extent = centroids.max(axis=0) - centroid_min
+
+    best_cost = np.inf
+    best_split = None
+    for axis in range(3):
+        if extent[axis] <= 0.0:
+            continue
+        scale = num_bins / float(extent[axis])
+        bins = ((centroids[:, axis] - centroid_min[axis]) * scale).astype(np.int64)
+        bins = np.minimum(bins, num_bins - 1)
+
+        order = np.argsort(bins, kind="stable")
+        sorted_bins = bins[order]
+        bin_starts = np.flatnonzero(np.diff(sorted_bins, prepend=-1))
+        used_bins = sorted_bins[bin_starts]
+        bin_min = np.full((num_bins, 3), np.inf, dtype=np.float32)
+        bin_max = np.full((num_bins, 3), -np.inf, dtype=np.float32)
+        bin_min[used_bins] = np.minimum.reduceat(face_min[order], bin_starts)
+        bin_max[used_bins] = np.maximum.reduceat(face_max[order], bin_starts)
+
+        # Candidate split planes lie between neighbouring bins
+        left_counts = np.cumsum(np.bincount(bins, minlength=num_bins))[:-1]
+        right_counts = num_faces - left_counts
+        valid = (left_counts > 0) & (right_counts > 0)
+        if not np.any(valid):
+            continue
+        left_min = np.minimum.accumulate(bin_min)[:-1][valid]
+        left_max = np.maximum.accumulate(bin_max)[:-1][valid]
+        right_min = np.minimum.accumulate(bin_min[::-1])[::-1][1:][valid]
+        right_max = np.maximum.accumulate(bin_max[::-1])[::-1][1:][valid]
+        cost = half_surface_area(left_min, left_max) * left_counts[valid]
+        cost += half_surface_area(right_min, right_max) * right_counts[valid]
+
+        candidate = np.argmin(cost)
+        if cost[candidate] < best_cost:
+            best_cost = cost[candidate]
+            last_left_bin = np.flatnonzero(valid)[candidate]
+            best_split = (axis, bins <= last_left_bin)
+
+    return best_split
+
+
+def half_surface_area(bb_min, bb_max):
+    size = (bb_max - bb_min).astype(np.float64)
+    return size[:, 0] * size[:, 1] + size[:, 1] * size[:, 2] + size[:, 2] * size[:, 0]
+
+
+def compute_faces_hash(verts, faces):
+    # Stored trees and face adjacency depend only on face vertex positions, not
+    # on vertex indices
+    verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    return hashlib.sha1(verts[faces].tobytes()).hexdigest()
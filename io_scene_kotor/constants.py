@@ -128,3 +128,4 @@ class ExportOptions:
         self.export_animations = True
         self.export_walkmeshes = True
         self.compress_quaternions = False
+        self.cache_nodes = False
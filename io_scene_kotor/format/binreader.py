@@ -16,8 +16,11 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import mmap
 import struct
 
+import numpy as np
+
 
 class SeekOrigin:
     BEGIN = 0
@@ -26,69 +29,155 @@ class SeekOrigin:
 
 
 class BinaryReader:
-    def __init__(self, path, byteorder="little"):
-        self.file = open(path, "rb")
+    def __init__(self, source, byteorder="little"):
+        self.file = None
+        self.mmap = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.buffer = source
+        else:
+            self.file = open(source, "rb")
+            try:
+                self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.buffer = self.mmap
+            except ValueError:
+                # Empty files cannot be memory-mapped
+                self.buffer = b""
+        self.size = len(self.buffer)
+        self.pos = 0
         self.byteorder = byteorder
 
+        bo_literal = ">" if byteorder == "big" else "<"
+        self.unpack_int8 = struct.Struct(bo_literal + "b").unpack_from
+        self.unpack_int16 = struct.Struct(bo_literal + "h").unpack_from
+        self.unpack_int32 = struct.Struct(bo_literal + "i").unpack_from
+        self.unpack_uint8 = struct.Struct(bo_literal + "B").unpack_from
+        self.unpack_uint16 = struct.Struct(bo_literal + "H").unpack_from
+        self.unpack_uint32 = struct.Struct(bo_literal + "I").unpack_from
+        self.unpack_float = struct.Struct(bo_literal + "f").unpack_from
+
+        self.int16_dtype = np.dtype(bo_literal + "i2")
+        self.int32_dtype = np.dtype(bo_literal + "i4")
+        self.uint8_dtype = np.dtype(bo_literal + "u1")
+        self.uint16_dtype = np.dtype(bo_literal + "u2")
+        self.uint32_dtype = np.dtype(bo_literal + "u4")
+        self.float_dtype = np.dtype(bo_literal + "f4")
+        self.bo_literal = bo_literal
+
     def __del__(self):
-        self.file.close()
+        self.close()
+
+    def close(self):
+        if self.mmap:
+            self.mmap.close()
+            self.mmap = None
+        if self.file:
+            self.file.close()
+            self.file = None
 
     def seek(self, offset, origin=SeekOrigin.BEGIN):
-        self.file.seek(offset, origin)
+        if origin == SeekOrigin.CURRENT:
+            self.pos += offset
+        elif origin == SeekOrigin.END:
+            self.pos = self.size + offset
+        else:
+            self.pos = offset
 
     def skip(self, offset):
-        self.file.seek(offset, SeekOrigin.CURRENT)
+        self.pos += offset
 
     def tell(self):
-        return self.file.tell()
+        return self.pos
 
     def read_int8(self):
-        return int.from_bytes(self.file.read(1), self.byteorder, signed=True)
+        [val] = self.unpack_int8(self.buffer, self.pos)
+        self.pos += 1
+        return val
 
     def read_int16(self):
-        return int.from_bytes(self.file.read(2), self.byteorder, signed=True)
+        [val] = self.unpack_int16(self.buffer, self.pos)
+        self.pos += 2
+        return val
 
     def read_int32(self):
-        return int.from_bytes(self.file.read(4), self.byteorder, signed=True)
+        [val] = self.unpack_int32(self.buffer, self.pos)
+        self.pos += 4
+        return val
 
     def read_uint8(self):
-        return int.from_bytes(self.file.read(1), self.byteorder, signed=False)
+        [val] = self.unpack_uint8(self.buffer, self.pos)
+        self.pos += 1
+        return val
 
     def read_uint16(self):
-        return int.from_bytes(self.file.read(2), self.byteorder, signed=False)
+        [val] = self.unpack_uint16(self.buffer, self.pos)
+        self.pos += 2
+        return val
 
     def read_uint32(self):
-        return int.from_bytes(self.file.read(4), self.byteorder, signed=False)
+        [val] = self.unpack_uint32(self.buffer, self.pos)
+        self.pos += 4
+        return val
 
     def read_float(self):
-        bo_literal = ">" if self.byteorder == "big" else "<"
-        [val] = struct.unpack(bo_literal + "f", self.file.read(4))
+        [val] = self.unpack_float(self.buffer, self.pos)
+        self.pos += 4
         return val
 
+    def read_int16s(self, count):
+        return self.read_array(self.int16_dtype, count)
+
+    def read_int32s(self, count):
+        return self.read_array(self.int32_dtype, count)
+
+    def read_uint8s(self, count):
+        return self.read_array(self.uint8_dtype, count)
+
+    def read_uint16s(self, count):
+        return self.read_array(self.uint16_dtype, count)
+
+    def read_uint32s(self, count):
+        return self.read_array(self.uint32_dtype, count)
+
+    def read_floats(self, count):
+        return self.read_array(self.float_dtype, count)
+
+    def read_records(self, dtype, count):
+        return self.read_array(np.dtype(dtype).newbyteorder(self.bo_literal), count)
+
+    def read_array(self, dtype, count):
+        # Copy out of the buffer, so that arrays outlive the memory map
+        arr = np.frombuffer(self.buffer, dtype, count, self.pos).copy()
+        self.pos += dtype.itemsize * count
+        return arr
+
     def read_string(self, len):
-        return self.file.read(len).decode("utf-8")
+        return self.read_bytes(len).decode("utf-8")
 
     def read_c_string(self):
-        str = ""
-        while True:
-            ch = self.file.read(1).decode("utf-8")
-            if ch == "\0":
-                break
-            str += ch
+        end = self.find_null(self.pos, self.size)
+        if end == -1:
+            end = self.size
+        str = self.read_bytes(end - self.pos).decode("utf-8")
+        self.pos = min(end + 1, self.size)
         return str
 
     def read_c_string_up_to(self, max_len):
-        str = ""
-        len = max_len
-        while len > 0:
-            ch = self.file.read(1).decode("utf-8")
-            len -= 1
-            if ch == "\0":
-                break
-            str += ch
-        if len > 0:
-            self.file.seek(len, 1)
+        stop = min(self.pos + max_len, self.size)
+        end = self.find_null(self.pos, stop)
+        if end == -1:
+            end = stop
+        str = self.read_bytes(end - self.pos).decode("utf-8")
+        self.pos = stop
         return str
 
     def read_bytes(self, count):
-        return self.file.read(count)
+        start = self.pos
+        stop = min(start + count, self.size)
+        self.pos = stop
+        return bytes(self.buffer[start:stop])
+
+    def find_null(self, start, stop):
+        if isinstance(self.buffer, memoryview):
+            idx = bytes(self.buffer[start:stop]).find(b"\0")
+            return start + idx if idx != -1 else -1
+        return self.buffer.find(b"\0", start, stop)
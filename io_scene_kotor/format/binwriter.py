@@ -16,47 +16,101 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import os
 import struct
 
+import numpy as np
+
 
 class BinaryWriter:
     def __init__(self, path, byteorder):
-        self.file = open(path, "wb")
+        self.path = path
         self.byteorder = byteorder
+        self.buffer = bytearray()
+
+        bo_literal = ">" if byteorder == "big" else "<"
+        self.pack_int8 = struct.Struct(bo_literal + "b").pack
+        self.pack_int16 = struct.Struct(bo_literal + "h").pack
+        self.pack_int32 = struct.Struct(bo_literal + "i").pack
+        self.pack_uint8 = struct.Struct(bo_literal + "B").pack
+        self.pack_uint16 = struct.Struct(bo_literal + "H").pack
+        self.pack_uint32 = struct.Struct(bo_literal + "I").pack
+        self.pack_float = struct.Struct(bo_literal + "f").pack
+        self.pack_int32_into = struct.Struct(bo_literal + "i").pack_into
+        self.pack_uint32_into = struct.Struct(bo_literal + "I").pack_into
 
-    def __del__(self):
-        self.file.close()
+        self.uint16_dtype = np.dtype(bo_literal + "u2")
+        self.uint32_dtype = np.dtype(bo_literal + "u4")
+        self.float_dtype = np.dtype(bo_literal + "f4")
+        self.bo_literal = bo_literal
 
     def tell(self):
-        return self.tell()
+        return len(self.buffer)
 
     def write_int8(self, val):
-        self.file.write(val.to_bytes(1, byteorder=self.byteorder, signed=True))
+        self.buffer += self.pack_int8(val)
 
     def write_int16(self, val):
-        self.file.write(val.to_bytes(2, byteorder=self.byteorder, signed=True))
+        self.buffer += self.pack_int16(val)
 
     def write_int32(self, val):
-        self.file.write(val.to_bytes(4, byteorder=self.byteorder, signed=True))
+        self.buffer += self.pack_int32(val)
 
     def write_uint8(self, val):
-        self.file.write(val.to_bytes(1, byteorder=self.byteorder, signed=False))
+        self.buffer += self.pack_uint8(val)
 
     def write_uint16(self, val):
-        self.file.write(val.to_bytes(2, byteorder=self.byteorder, signed=False))
+        self.buffer += self.pack_uint16(val)
 
     def write_uint32(self, val):
-        self.file.write(val.to_bytes(4, byteorder=self.byteorder, signed=False))
+        self.buffer += self.pack_uint32(val)
 
     def write_float(self, val):
-        bo_literal = ">" if self.byteorder == "big" else "<"
-        self.file.write(struct.pack(bo_literal + "f", val))
+        self.buffer += self.pack_float(val)
 
     def write_string(self, val):
-        self.file.write(val.encode("utf-8"))
+        self.buffer += val.encode("utf-8")
 
     def write_c_string(self, val):
-        self.file.write((val + "\0").encode("utf-8"))
+        self.buffer += (val + "\0").encode("utf-8")
 
     def write_bytes(self, bytes):
-        self.file.write(bytes)
+        self.buffer += bytes
+
+    def write_array(self, arr):
+        arr = np.ascontiguousarray(arr, arr.dtype.newbyteorder(self.bo_literal))
+        self.buffer += arr.tobytes()
+
+    def reserve(self, size):
+        offset = len(self.buffer)
+        self.buffer += bytes(size)
+        return offset
+
+    def patch_int32(self, offset, val):
+        self.pack_int32_into(self.buffer, offset, val)
+
+    def patch_uint32(self, offset, val):
+        self.pack_uint32_into(self.buffer, offset, val)
+
+    def flush(self):
+        flush_writers(self)
+
+    def temp_path(self):
+        return self.path + ".tmp"
+
+
+def flush_writers(*writers):
+    # Write all files to temporary files first and only then move them into
+    # place, so that a failed export never leaves partially written files or
+    # files out of sync with each other behind
+    try:
+        for writer in writers:
+            with open(writer.temp_path(), "wb") as file:
+                file.write(writer.buffer)
+        for writer in writers:
+            os.replace(writer.temp_path(), writer.path)
+    except BaseException:
+        for writer in writers:
+            if os.path.exists(writer.temp_path()):
+                os.remove(writer.temp_path())
+        raise
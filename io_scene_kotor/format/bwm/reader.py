@@ -16,6 +16,8 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import numpy as np
+
 from ...constants import DummyType, RootType, WalkmeshType
 from ...scene.modelnode.aabb import AabbNode
 from ...scene.modelnode.dummy import DummyNode
@@ -28,22 +30,28 @@ from .types import *
 
 
 class BwmReader:
-    def __init__(self, path, model_name):
+    def __init__(self, path, model_name, keep_aabbs=False, keep_adjacency=False):
         self.path = path
         self.model_name = model_name
+        self.keep_aabbs = keep_aabbs
+        self.keep_adjacency = keep_adjacency
         self.bwm = BinaryReader(path, "little")
 
         self.position = [0.0] * 3
         self.verts = []
         self.facelist = FaceList()
+        self.aabbs = None
+        self.adj_edges = None
         self.outer_edges = []
 
     def load(self):
         self.load_header()
         self.load_vertices()
         self.load_faces()
-        self.load_aabbs()
-        self.load_adjacent_edges()
+        if self.keep_aabbs:
+            self.load_aabbs()
+        if self.keep_adjacency:
+            self.load_adjacent_edges()
         self.load_outer_edges()
         self.load_perimeters()
 
@@ -84,69 +92,44 @@ class BwmReader:
 
     def load_vertices(self):
         self.bwm.seek(self.off_verts)
-        for _ in range(self.num_verts):
-            vert = [self.bwm.read_float() - self.position[i] for i in range(3)]
-            self.verts.append(vert)
+        verts = self.bwm.read_floats(3 * self.num_verts).reshape(-1, 3)
+        self.verts = verts.astype(np.float64) - self.position
 
     def load_faces(self):
-        vert_indices = []
         self.bwm.seek(self.off_vert_indices)
-        for _ in range(self.num_faces):
-            vert_indices.append([self.bwm.read_uint32() for _ in range(3)])
+        vert_indices = self.bwm.read_uint32s(3 * self.num_faces).reshape(-1, 3)
 
         self.bwm.seek(self.off_material_ids)
-        material_ids = [self.bwm.read_uint32() for _ in range(self.num_faces)]
+        material_ids = self.bwm.read_uint32s(self.num_faces)
 
-        normals = []
         self.bwm.seek(self.off_normals)
-        for _ in range(self.num_faces):
-            normal = [self.bwm.read_float() for _ in range(3)]
-            normals.append(normal)
+        normals = self.bwm.read_floats(3 * self.num_faces).reshape(-1, 3)
 
         self.bwm.seek(self.off_distances)
-        distances = [self.bwm.read_float() for _ in range(self.num_faces)]
+        self.distances = self.bwm.read_floats(self.num_faces).astype(np.float64)
 
-        for i in range(self.num_faces):
-            self.facelist.vertices.append(vert_indices[i])
-            self.facelist.uv.append([0] * 3)
-            self.facelist.materials.append(material_ids[i])
+        self.facelist.vertices = vert_indices.astype(np.int32)
+        self.facelist.uv = np.zeros((self.num_faces, 3), np.int32)
+        self.facelist.materials = material_ids
+        self.facelist.normals = normals.astype(np.float64)
 
     def load_aabbs(self):
-        aabbs = []
         self.bwm.seek(self.off_aabbs)
-        for _ in range(self.num_aabbs):
-            bounding_box = [self.bwm.read_float() for _ in range(6)]
-            face_idx = self.bwm.read_int32()
-            self.bwm.skip(4)  # unknown
-            most_significant_plane = self.bwm.read_uint32()
-            child_idx1 = self.bwm.read_uint32()
-            child_idx2 = self.bwm.read_uint32()
-            aabbs.append(
-                AABB(
-                    bounding_box,
-                    face_idx,
-                    most_significant_plane,
-                    child_idx1,
-                    child_idx2,
-                )
-            )
+        self.aabbs = self.bwm.read_records(AABB_RECORD, self.num_aabbs)
 
     def load_adjacent_edges(self):
-        adj_edges = []
         self.bwm.seek(self.off_adj_edges)
-        for _ in range(self.num_adj_edges):
-            adj_edges.append([self.bwm.read_int32() for _ in range(3)])
+        self.adj_edges = self.bwm.read_int32s(3 * self.num_adj_edges).reshape(-1, 3)
 
     def load_outer_edges(self):
         self.bwm.seek(self.off_outer_edges)
-        for _ in range(self.num_outer_edges):
-            index = self.bwm.read_uint32()
-            transition = self.bwm.read_int32()
-            self.outer_edges.append((index, transition))
+        self.outer_edges = self.bwm.read_records(
+            OUTER_EDGE_RECORD, self.num_outer_edges
+        )
 
     def load_perimeters(self):
         self.bwm.seek(self.off_perimeters)
-        self.perimeters = [self.bwm.read_uint32() for _ in range(self.num_perimeters)]
+        self.perimeters = self.bwm.read_uint32s(self.num_perimeters)
 
     def new_walkmesh(self):
         if self.bwm_type == BWM_TYPE_WOK:
@@ -167,7 +150,7 @@ class BwmReader:
         geom_node.facelist = self.facelist
         geom_node.roomlinks = {
             edge_idx: transition
-            for edge_idx, transition in self.outer_edges
+            for edge_idx, transition in self.outer_edges.tolist()
             if transition != -1
         }
 
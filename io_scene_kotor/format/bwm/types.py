@@ -16,14 +16,20 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import numpy as np
+
 BWM_TYPE_PWK_DWK = 0
 BWM_TYPE_WOK = 1
 
+AABB_RECORD = np.dtype(
+    [
+        ("bounding_box", "6f4"),
+        ("face_idx", "i4"),
+        ("unknown", "u4"),
+        ("most_significant_plane", "u4"),
+        ("child_idx1", "i4"),
+        ("child_idx2", "i4"),
+    ]
+)
 
-class AABB:
-    def __init__(self, bounding_box, face_idx, most_significant_plane, child_idx1, child_idx2):
-        self.bounding_box = bounding_box
-        self.face_idx = face_idx
-        self.most_significant_plane = most_significant_plane
-        self.child_idx1 = child_idx1
-        self.child_idx2 = child_idx2
+OUTER_EDGE_RECORD = np.dtype([("index", "u4"), ("transition", "i4")])
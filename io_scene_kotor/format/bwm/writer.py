@@ -16,10 +16,12 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-from mathutils import Vector
+import numpy as np
 
 from ...aabb import generate_tree
 from ...constants import NON_WALKABLE, DummyType, WalkmeshType
+from ...meshgeometry import compute_plane_distances, weld_vertices
+from ...meshtopology import compute_edge_adjacency, compute_perimeters
 from ...scene.modelnode.aabb import AabbNode
 from ...scene.modelnode.dummy import DummyNode
 from ...scene.modelnode.trimesh import FaceList
@@ -28,18 +30,6 @@ from ..mdl.types import *
 from .types import *
 
 
-class SimilarVertex:
-    def __init__(self, coords):
-        self.coords = coords
-        self.value = tuple(int(val * 10000) for val in self.coords)
-
-    def __hash__(self):
-        return hash(self.value)
-
-    def __eq__(self, rhs):
-        return self.value == rhs.value
-
-
 class BwmWriter:
     def __init__(self, path, walkmesh):
         self.path = path
@@ -67,7 +57,7 @@ class BwmWriter:
         self.use_node2 = None
 
         self.verts = []
-        self.old_to_new_vert_idx = dict()
+        self.old_to_new_vert_idx = None
         self.facelist = FaceList()
         self.aabbs = []
         self.adjacent_edges = []
@@ -85,6 +75,8 @@ class BwmWriter:
         self.save_outer_edges()
         self.save_perimeters()
 
+        self.bwm.flush()
+
     def peek_walkmesh(self):
         self.bwm_type = (
             BWM_TYPE_WOK
@@ -154,156 +146,67 @@ class BwmWriter:
 
     def peek_vertices(self):
         # Merge vertices by distance
-        similar_to_new_vert_idx = dict()
-        for vert_idx, vert in enumerate(self.geom_node.verts):
-            similar = SimilarVertex(vert)
-            if similar in similar_to_new_vert_idx:
-                self.old_to_new_vert_idx[vert_idx] = similar_to_new_vert_idx[similar]
-            else:
-                num_verts = len(self.verts)
-                similar_to_new_vert_idx[similar] = num_verts
-                self.old_to_new_vert_idx[vert_idx] = num_verts
-                self.verts.append(vert)
+        verts, _, self.old_to_new_vert_idx = weld_vertices(self.geom_node.verts)
 
         # Offset by node and LYT position
-        for vert_idx, vert in enumerate(self.verts):
-            self.verts[vert_idx] = [
-                vert[i] + self.geom_node.position[i] + self.geom_node.lytposition[i]
-                for i in range(3)
-            ]
+        position = np.asarray(self.geom_node.position, np.float64)
+        lytposition = np.asarray(self.geom_node.lytposition, np.float64)
+        self.verts = verts + position + lytposition
 
     def peek_faces(self):
-        walkable_face_indices = []
-        non_walkable_face_indices = []
-        for face_idx, _ in enumerate(self.geom_node.facelist.vertices):
-            mat_id = self.geom_node.facelist.materials[face_idx]
-            if mat_id in NON_WALKABLE:
-                non_walkable_face_indices.append(face_idx)
-            else:
-                walkable_face_indices.append(face_idx)
-                self.num_walkable_faces += 1
-        face_indices = walkable_face_indices + non_walkable_face_indices
-        for face_idx in face_indices:
-            self.facelist.vertices.append(
-                [
-                    self.old_to_new_vert_idx[vert_idx]
-                    for vert_idx in self.geom_node.facelist.vertices[face_idx]
-                ]
-            )
-            self.facelist.materials.append(self.geom_node.facelist.materials[face_idx])
-            self.facelist.normals.append(self.geom_node.facelist.normals[face_idx])
+        # Walkable faces go first
+        materials = np.asarray(self.geom_node.facelist.materials, np.uint32)
+        walkable = ~np.isin(materials, NON_WALKABLE)
+        face_indices = np.concatenate(
+            [np.flatnonzero(walkable), np.flatnonzero(~walkable)]
+        )
+        self.num_walkable_faces = int(np.count_nonzero(walkable))
+
+        vert_map = np.asarray(self.old_to_new_vert_idx, np.int64)
+        faces = np.asarray(self.geom_node.facelist.vertices, np.int64).reshape(-1, 3)
+        normals = np.asarray(self.geom_node.facelist.normals, np.float64)
+        self.facelist.vertices = vert_map[faces[face_indices]]
+        self.facelist.materials = materials[face_indices]
+        self.facelist.normals = normals.reshape(-1, 3)[face_indices]
 
     def peek_aabbs(self):
         if self.bwm_type == BWM_TYPE_PWK_DWK:
+            self.aabbs = np.zeros(0, AABB_RECORD)
             return
 
-        face_list = []
-        face_idx = 0
-
-        for face in self.facelist.vertices:
-            v0 = Vector(self.verts[face[0]])
-            v1 = Vector(self.verts[face[1]])
-            v2 = Vector(self.verts[face[2]])
-            centroid = (v0 + v1 + v2) / 3
-            face_list.append((face_idx, [v0, v1, v2], centroid))
-            face_idx += 1
-
-        aabbs = []
-        generate_tree(aabbs, face_list)
-
-        for aabb_node in aabbs:
-            child_idx1 = aabb_node[6]
-            child_idx2 = aabb_node[7]
-            face_idx = aabb_node[8]
-            split_axis = aabb_node[9]
-
-            switch = {
-                -3: AABB_NEGATIVE_Z,
-                -2: AABB_NEGATIVE_Y,
-                -1: AABB_NEGATIVE_X,
-                0: AABB_NO_CHILDREN,
-                1: AABB_POSITIVE_X,
-                2: AABB_POSITIVE_Y,
-                3: AABB_POSITIVE_Z,
-            }
-            most_significant_plane = switch[split_axis]
-
-            self.aabbs.append(
-                AABB(
-                    aabb_node[:6],
-                    face_idx,
-                    most_significant_plane,
-                    child_idx1,
-                    child_idx2,
-                )
-            )
+        aabbs = generate_tree(self.verts, self.facelist.vertices)
+        tree = np.array(aabbs, np.float64).reshape(-1, 10)
+
+        # Indexed by split axis + 3
+        planes = np.array(
+            [
+                AABB_NEGATIVE_Z,
+                AABB_NEGATIVE_Y,
+                AABB_NEGATIVE_X,
+                AABB_NO_CHILDREN,
+                AABB_POSITIVE_X,
+                AABB_POSITIVE_Y,
+                AABB_POSITIVE_Z,
+            ]
+        )
+
+        self.aabbs = np.zeros(len(tree), AABB_RECORD)
+        self.aabbs["bounding_box"] = tree[:, :6]
+        self.aabbs["face_idx"] = tree[:, 8]
+        self.aabbs["unknown"] = 4
+        self.aabbs["most_significant_plane"] = planes[tree[:, 9].astype(int) + 3]
+        self.aabbs["child_idx1"] = tree[:, 6]
+        self.aabbs["child_idx2"] = tree[:, 7]
 
     def peek_edges(self):
-        # Adjacent Edges
-        for _ in range(self.num_walkable_faces):
-            self.adjacent_edges.append([-1, -1, -1])
-        for face_idx in range(self.num_walkable_faces):
-            face = self.facelist.vertices[face_idx]
-            edges = [
-                tuple(sorted(edge))
-                for edge in [(face[0], face[1]), (face[1], face[2]), (face[2], face[0])]
-            ]
-            for other_face_idx in range(face_idx + 1, self.num_walkable_faces):
-                other_face = self.facelist.vertices[other_face_idx]
-                other_edges = [
-                    tuple(sorted(edge))
-                    for edge in [
-                        (other_face[0], other_face[1]),
-                        (other_face[1], other_face[2]),
-                        (other_face[2], other_face[0]),
-                    ]
-                ]
-                num_adj_edges = 0
-                for i in range(3):
-                    if self.adjacent_edges[face_idx][i] != -1:
-                        num_adj_edges += 1
-                        continue
-                    for j in range(3):
-                        if edges[i] == other_edges[j]:
-                            self.adjacent_edges[face_idx][i] = 3 * other_face_idx + j
-                            self.adjacent_edges[other_face_idx][j] = 3 * face_idx + i
-                            num_adj_edges += 1
-                            break
-                if num_adj_edges == 3:
-                    break
-
-        # Outer Edges, Perimeters
-        visited_edges = set()
-        for i in range(self.num_walkable_faces):
-            for j in range(3):
-                # Outer edges must not have adjacent edges
-                if self.adjacent_edges[i][j] != -1:
-                    continue
-                # One visit per edge
-                edge_idx = 3 * i + j
-                if edge_idx in visited_edges:
-                    continue
-                next_face = i
-                next_edge = j
-                while next_face != -1:
-                    adj_edge_idx = self.adjacent_edges[next_face][next_edge]
-                    if adj_edge_idx == -1:
-                        edge_idx = 3 * next_face + next_edge
-                        if not edge_idx in visited_edges:
-                            transition = (
-                                self.geom_node.roomlinks[edge_idx]
-                                if edge_idx in self.geom_node.roomlinks
-                                else -1
-                            )
-                            self.outer_edges.append((edge_idx, transition))
-                            visited_edges.add(edge_idx)
-                            next_edge = (next_edge + 1) % 3
-                        else:
-                            next_face = -1
-                            self.perimeters.append(len(self.outer_edges))
-                    else:
-                        next_face = adj_edge_idx // 3
-                        next_edge = ((adj_edge_idx % 3) + 1) % 3
+        walkable_faces = self.facelist.vertices[: self.num_walkable_faces]
+        self.adjacent_edges = compute_edge_adjacency(walkable_faces.tolist())
+        outer_edges, self.perimeters = compute_perimeters(self.adjacent_edges)
+        self.outer_edges = np.zeros(len(outer_edges), OUTER_EDGE_RECORD)
+        self.outer_edges["index"] = outer_edges
+        self.outer_edges["transition"] = [
+            self.geom_node.roomlinks.get(edge_idx, -1) for edge_idx in outer_edges
+        ]
 
     def save_header(self):
         rel_use_vec1 = self.use_node1.position if self.use_node1 else [0.0] * 3
@@ -369,52 +272,32 @@ class BwmWriter:
         self.bwm.write_uint32(off_perimeters)
 
     def save_vertices(self):
-        for vert in self.verts:
-            for val in vert:
-                self.bwm.write_float(val)
+        self.bwm.write_array(np.asarray(self.verts, np.float32))
 
     def save_faces(self):
         # Vertex Indices
-        for face in self.facelist.vertices:
-            for val in face:
-                self.bwm.write_uint32(val)
+        self.bwm.write_array(self.facelist.vertices.astype(np.uint32))
 
         # Material Ids
-        for mat_id in self.facelist.materials:
-            self.bwm.write_uint32(mat_id)
+        self.bwm.write_array(self.facelist.materials)
 
         # Normals
-        for normal in self.facelist.normals:
-            for val in normal:
-                self.bwm.write_float(val)
+        self.bwm.write_array(self.facelist.normals.astype(np.float32))
 
         # Distances
-        for face_idx, face in enumerate(self.facelist.vertices):
-            vert1 = Vector(self.verts[face[0]])
-            normal = Vector(self.facelist.normals[face_idx])
-            distance = -1.0 * (normal @ vert1)
-            self.bwm.write_float(distance)
+        distances = compute_plane_distances(
+            self.verts, self.facelist.vertices, self.facelist.normals
+        )
+        self.bwm.write_array(distances.astype(np.float32))
 
     def save_aabbs(self):
-        for aabb in self.aabbs:
-            for val in aabb.bounding_box:
-                self.bwm.write_float(val)
-            self.bwm.write_int32(aabb.face_idx)
-            self.bwm.write_uint32(4)  # unknown
-            self.bwm.write_uint32(aabb.most_significant_plane)
-            self.bwm.write_int32(aabb.child_idx1)
-            self.bwm.write_int32(aabb.child_idx2)
+        self.bwm.write_array(self.aabbs)
 
     def save_adjacent_edges(self):
-        for edges in self.adjacent_edges:
-            for val in edges:
-                self.bwm.write_int32(val)
+        self.bwm.write_array(np.asarray(self.adjacent_edges, np.int32))
 
     def save_outer_edges(self):
-        for edge_idx, transition in self.outer_edges:
-            self.bwm.write_uint32(edge_idx)
-            self.bwm.write_int32(transition)
+        self.bwm.write_array(self.outer_edges)
 
     def save_perimeters(self):
-        for perimeter in self.perimeters:
-            self.bwm.write_uint32(perimeter)
+        self.bwm.write_array(np.asarray(self.perimeters, np.uint32))
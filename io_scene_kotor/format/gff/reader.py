@@ -67,26 +67,14 @@ class GffReader:
         return self.new_tree_struct(0)
 
     def load_structs(self):
-        self.structs = []
         self.reader.seek(self.off_structs)
-        for _ in range(self.num_structs):
-            struct = GffStruct(
-                self.reader.read_uint32(),
-                self.reader.read_uint32(),
-                self.reader.read_uint32(),
-            )
-            self.structs.append(struct)
+        records = self.reader.read_records(STRUCT_RECORD, self.num_structs)
+        self.structs = [GffStruct(*record) for record in records.tolist()]
 
     def load_fields(self):
-        self.fields = []
         self.reader.seek(self.off_fields)
-        for _ in range(self.num_fields):
-            field = GffField(
-                self.reader.read_uint32(),
-                self.reader.read_uint32(),
-                self.reader.read_uint32(),
-            )
-            self.fields.append(field)
+        records = self.reader.read_records(FIELD_RECORD, self.num_fields)
+        self.fields = [GffField(*record) for record in records.tolist()]
 
     def load_labels(self):
         self.reader.seek(self.off_labels)
@@ -100,15 +88,15 @@ class GffReader:
 
     def load_field_indices(self):
         self.reader.seek(self.off_field_indices)
-        self.field_indices = [
-            self.reader.read_uint32() for _ in range(self.num_field_indices // 4)
-        ]
+        self.field_indices = self.reader.read_uint32s(
+            self.num_field_indices // 4
+        ).tolist()
 
     def load_list_indices(self):
         self.reader.seek(self.off_list_indices)
-        self.list_indices = [
-            self.reader.read_uint32() for _ in range(self.num_list_indices // 4)
-        ]
+        self.list_indices = self.reader.read_uint32s(
+            self.num_list_indices // 4
+        ).tolist()
 
     def new_tree_struct(self, structIdx):
         tree = dict()
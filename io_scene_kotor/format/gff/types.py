@@ -16,6 +16,8 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import numpy as np
+
 FILE_VERSION = "V3.2"
 
 FIELD_TYPE_DWORD = 4
@@ -23,6 +25,13 @@ FIELD_TYPE_FLOAT = 8
 FIELD_TYPE_STRUCT = 14
 FIELD_TYPE_LIST = 15
 
+STRUCT_RECORD = np.dtype(
+    [("type", "u4"), ("data_or_data_offset", "u4"), ("num_fields", "u4")]
+)
+FIELD_RECORD = np.dtype(
+    [("type", "u4"), ("label_idx", "u4"), ("data_or_data_offset", "u4")]
+)
+
 
 class KeyValue:
     def __init__(self, key, value):
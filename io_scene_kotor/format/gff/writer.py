@@ -83,6 +83,8 @@ class GffWriter:
         for idx in self.list_indices:
             self.writer.write_uint32(idx)
 
+        self.writer.flush()
+
     def decompose_tree(self):
         num_structs = 0
         queue = [self.tree]
@@ -0,0 +1,174 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import os
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Attributes referencing other nodes, which are accounted for separately
+EXCLUDED_ATTRIBUTES = {"parent", "children"}
+
+
+class NodeCacheEntry:
+    def __init__(
+        self,
+        mdl_data,
+        mdx_data,
+        mdl_base,
+        mdx_base,
+        offset_positions,
+        mdx_offset_positions,
+        node_references,
+    ):
+        self.mdl_data = mdl_data
+        self.mdx_data = mdx_data
+        self.mdl_base = mdl_base
+        self.mdx_base = mdx_base
+        self.offset_positions = offset_positions  # positions of MDL offsets
+        self.mdx_offset_positions = mdx_offset_positions  # positions of MDX offsets
+        self.node_references = node_references  # (position, node index) pairs
+
+    def size(self):
+        return len(self.mdl_data) + len(self.mdx_data)
+
+    def relocate(self, mdl_base, mdx_base, node_offsets):
+        mdl_data = bytearray(self.mdl_data)
+        add_to_uint32s(mdl_data, self.offset_positions, mdl_base - self.mdl_base)
+        add_to_uint32s(mdl_data, self.mdx_offset_positions, mdx_base - self.mdx_base)
+        for position, node_idx in self.node_references:
+            mdl_data[position : position + 4] = int(node_offsets[node_idx]).to_bytes(
+                4, "little"
+            )
+        return mdl_data, self.mdx_data
+
+
+class NodeCache:
+    def __init__(self, path=None, max_size=256 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size  # in bytes, of entries kept in memory
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry:
+            self.entries.move_to_end(key)
+            return entry
+
+        if not self.path:
+            return None
+        entry_path = os.path.join(self.path, key + ".npz")
+        if not os.path.exists(entry_path):
+            return None
+        with np.load(entry_path) as data:
+            mdl_base, mdx_base = data["bases"].tolist()
+            entry = NodeCacheEntry(
+                data["mdl"].tobytes(),
+                data["mdx"].tobytes(),
+                mdl_base,
+                mdx_base,
+                data["offsets"].tolist(),
+                data["mdx_offsets"].tolist(),
+                [tuple(ref) for ref in data["node_references"].tolist()],
+            )
+        self.add_entry(key, entry)
+
+        return entry
+
+    def put(self, key, entry):
+        self.add_entry(key, entry)
+
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        entry_path = os.path.join(self.path, key + ".npz")
+        tmp_path = entry_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            np.savez(
+                file,
+                mdl=np.frombuffer(entry.mdl_data, dtype=np.uint8),
+                mdx=np.frombuffer(entry.mdx_data, dtype=np.uint8),
+                bases=np.array([entry.mdl_base, entry.mdx_base], dtype=np.int64),
+                offsets=np.array(entry.offset_positions, dtype=np.int64),
+                mdx_offsets=np.array(entry.mdx_offset_positions, dtype=np.int64),
+                node_references=np.array(entry.node_references, dtype=np.int64).reshape(
+                    -1, 2
+                ),
+            )
+        os.replace(tmp_path, entry_path)
+
+    def add_entry(self, key, entry):
+        if key in self.entries:
+            return
+        self.entries[key] = entry
+        self.size += entry.size()
+        while self.size > self.max_size and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size()
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+def add_to_uint32s(data, positions, delta):
+    if not delta or not len(positions):
+        return
+    byte_indices = np.asarray(positions, dtype=np.int64)[:, None] + np.arange(4)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    values = buffer[byte_indices].copy().view("<u4")
+    values += np.uint32(delta % (1 << 32))
+    buffer[byte_indices] = values.view(np.uint8).reshape(-1, 4)
+
+
+def update_hash(digest, value):
+    if isinstance(value, np.ndarray):
+        digest.update(repr((value.dtype.str, value.shape)).encode("utf-8"))
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        try:
+            arr = np.asarray(value)
+        except ValueError:
+            arr = None
+        if arr is not None and arr.dtype.kind in "biuf":
+            update_hash(digest, arr)
+            return
+        digest.update(b"[")
+        for item in value:
+            update_hash(digest, item)
+        digest.update(b"]")
+    elif isinstance(value, dict):
+        digest.update(b"{")
+        for key, item in value.items():
+            update_hash(digest, key)
+            update_hash(digest, item)
+        digest.update(b"}")
+    elif hasattr(value, "__dict__"):
+        digest.update(type(value).__name__.encode("utf-8"))
+        update_hash(
+            digest,
+            {
+                key: item
+                for key, item in vars(value).items()
+                if key not in EXCLUDED_ATTRIBUTES
+            },
+        )
+    else:
+        digest.update(repr(value).encode("utf-8"))
@@ -17,12 +17,14 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import os
-
-from math import sqrt
+import weakref
 
 from mathutils import Matrix, Quaternion, Vector
 
-from ...constants import NodeType, NULL
+import numpy as np
+
+from ...aabb import compute_faces_hash
+from ...constants import Classification, NodeType, NULL
 from ...scene.animation import Animation
 from ...scene.animnode import AnimationNode
 from ...scene.model import Model
@@ -64,38 +66,146 @@ class ArrayDefinition:
         self.count = count
 
 
+class MdlSummary:
+    def __init__(self):
+        self.name = "UNNAMED"
+        self.classification = Classification.OTHER
+        self.supermodel = NULL
+        self.animroot = NULL
+        self.node_names = []
+        self.node_types = []
+        self.animations = []  # (name, length) tuples
+        self.textures = dict()  # mesh name to texture names
+
+    def num_nodes(self):
+        return len(self.node_names)
+
+
+class LazyAnimation(Animation):
+    def __init__(self, reader, name, off_root_node):
+        # Weak reference, so that the model does not keep the reader and its
+        # files alive
+        self.reader = weakref.ref(reader)
+        self.off_root_node = off_root_node
+        self.loaded_root_node = None
+
+        Animation.__init__(self, name)
+
+    @property
+    def root_node(self):
+        if self.loaded_root_node is None:
+            reader = self.reader()
+            if reader is None or reader.closed:
+                raise RuntimeError(
+                    "MDL reader closed before loading animation '{}'".format(self.name)
+                )
+            self.loaded_root_node = reader.load_anim_root_node(self)
+        return self.loaded_root_node
+
+    @root_node.setter
+    def root_node(self, root_node):
+        self.loaded_root_node = root_node
+
+
 class MdlReader:
-    def __init__(self, path):
+    def __init__(self, path, load_aabb_trees=True):
         self.path = path
+        self.load_aabb_trees = load_aabb_trees
         self.mdl = BinaryReader(path, "little")
-
-        base, _ = os.path.splitext(path)
-        mdx_path = base + ".mdx"
-        if not os.path.exists(mdx_path):
-            raise RuntimeError("MDX file '{}' not found".format(mdx_path))
-
-        self.mdx = BinaryReader(mdx_path, "little")
+        self.mdx = None
+        self.closed = False
 
         self.tsl = False
         self.xbox = False
         self.node_names = []
         self.node_by_number = dict()
+        self.skins = []
+        self.anim_root_nodes = dict()
 
     def load(self):
+        base, _ = os.path.splitext(self.path)
+        mdx_path = base + ".mdx"
+        if not os.path.exists(mdx_path):
+            raise RuntimeError("MDX file '{}' not found".format(mdx_path))
+
+        self.mdx = BinaryReader(mdx_path, "little")
+
         self.model = Model()
 
         self.load_file_header()
         self.load_geometry_header()
         self.load_model_header()
         self.load_names()
-        self.peek_nodes(self.off_root_node)
-
-        self.model.root_node = self.load_nodes(self.off_root_node, 0)
+        self.model.root_node = self.load_nodes()
 
         self.load_animations()
 
         return self.model
 
+    def close(self):
+        self.mdl.close()
+        if self.mdx:
+            self.mdx.close()
+        self.closed = True
+
+    def scan(self):
+        self.model = Model()
+
+        self.load_file_header()
+        self.load_geometry_header()
+        self.load_model_header()
+        self.load_names()
+
+        summary = MdlSummary()
+        summary.name = self.model.name
+        summary.classification = self.model.classification
+        summary.supermodel = self.model.supermodel
+
+        offsets = [self.off_root_node]
+        while offsets:
+            offset = offsets.pop()
+            self.mdl.seek(MDL_OFFSET + offset)
+            type_flags = self.mdl.read_uint16()
+            self.mdl.skip(2)  # node number
+            name_index = self.mdl.read_uint16()
+            self.mdl.skip(38)
+            children_arr = self.get_array_def()
+            self.mdl.skip(2 * 12)  # controller arrays
+
+            name = self.names[name_index]
+            summary.node_names.append(name)
+            summary.node_types.append(self.get_node_type(type_flags))
+            if offset == self.off_anim_root:
+                summary.animroot = name
+
+            if type_flags & NODE_MESH:
+                if type_flags & NODE_LIGHT:
+                    self.mdl.skip(92)  # light header
+                if type_flags & NODE_EMITTER:
+                    self.mdl.skip(224)  # emitter header
+                if type_flags & NODE_REFERENCE:
+                    self.mdl.skip(36)  # reference header
+                self.mdl.skip(88)  # mesh header up to textures
+                textures = []
+                for max_len in [32, 32, 12, 12]:
+                    texture = self.mdl.read_c_string_up_to(max_len)
+                    if len(texture) > 0 and texture.lower() != "null":
+                        textures.append(texture)
+                summary.textures[name] = textures
+
+            self.mdl.seek(MDL_OFFSET + children_arr.offset)
+            child_offsets = self.mdl.read_uint32s(children_arr.count).tolist()
+            offsets.extend(reversed(child_offsets))
+
+        if self.animation_arr.count > 0:
+            self.mdl.seek(MDL_OFFSET + self.animation_arr.offset)
+            offsets = self.mdl.read_uint32s(self.animation_arr.count).tolist()
+            for offset in offsets:
+                anim = self.load_animation_header(offset)
+                summary.animations.append((anim.name, anim.length))
+
+        return summary
+
     def load_file_header(self):
         if self.mdl.read_uint32() != 0:
             raise RuntimeError("Invalid MDL signature")
@@ -165,27 +275,31 @@ class MdlReader:
     def load_names(self):
         self.names = []
         self.mdl.seek(MDL_OFFSET + self.name_arr.offset)
-        offsets = [self.mdl.read_uint32() for _ in range(self.name_arr.count)]
+        offsets = self.mdl.read_uint32s(self.name_arr.count).tolist()
         for off in offsets:
             self.mdl.seek(MDL_OFFSET + off)
             self.names.append(self.mdl.read_c_string())
 
-    def peek_nodes(self, offset):
-        self.mdl.seek(MDL_OFFSET + offset)
-        self.mdl.skip(4)
-        name_index = self.mdl.read_uint16()
-        self.mdl.skip(38)
-        children_arr = self.get_array_def()
+    def load_nodes(self):
+        root_node = None
+        stack = [(self.off_root_node, 0, None)]
+        while stack:
+            offset, export_order, parent = stack.pop()
+            node, child_offsets = self.load_node(offset, export_order, parent)
+            if parent:
+                parent.children.append(node)
+            else:
+                root_node = node
+            for child_idx in reversed(range(len(child_offsets))):
+                stack.append((child_offsets[child_idx], child_idx, node))
 
-        name = self.names[name_index]
-        self.node_names.append(name)
+        # Bone indices refer to nodes anywhere in the tree, so names can only be
+        # resolved once all nodes are known
+        self.load_skin_weights()
 
-        self.mdl.seek(MDL_OFFSET + children_arr.offset)
-        child_offsets = [self.mdl.read_uint32() for _ in range(children_arr.count)]
-        for off_child in child_offsets:
-            self.peek_nodes(off_child)
+        return root_node
 
-    def load_nodes(self, offset, export_order, parent=None):
+    def load_node(self, offset, export_order, parent=None):
         self.mdl.seek(MDL_OFFSET + offset)
 
         type_flags = self.mdl.read_uint16()
@@ -201,6 +315,7 @@ class MdlReader:
         controller_data_arr = self.get_array_def()
 
         name = self.names[name_index]
+        self.node_names.append(name)
         node_type = self.get_node_type(type_flags)
         node = self.new_node(name, node_type)
 
@@ -428,7 +543,8 @@ class MdlReader:
 
         if type_flags & NODE_AABB:
             off_root_aabb = self.mdl.read_uint32()
-            self.load_aabb(off_root_aabb)
+            if self.load_aabb_trees:
+                node.aabb_tree = self.load_aabb(off_root_aabb)
 
         if type_flags & NODE_SABER:
             off_saber_verts = self.mdl.read_uint32()
@@ -439,67 +555,70 @@ class MdlReader:
 
         if controller_arr.count > 0:
             controllers = self.load_controllers(controller_arr, controller_data_arr)
+            first_rows = {
+                ctrl_type: values[0].tolist()
+                for ctrl_type, (_, values) in controllers.items()
+                if len(values) > 0
+            }
             if type_flags & NODE_MESH:
                 node.alpha = (
-                    controllers[CTRL_MESH_ALPHA][0][1]
-                    if CTRL_MESH_ALPHA in controllers
+                    first_rows[CTRL_MESH_ALPHA][0]
+                    if CTRL_MESH_ALPHA in first_rows
                     else 1.0
                 )
                 node.scale = (
-                    controllers[CTRL_MESH_SCALE][0][1]
-                    if CTRL_MESH_SCALE in controllers
+                    first_rows[CTRL_MESH_SCALE][0]
+                    if CTRL_MESH_SCALE in first_rows
                     else 1.0
                 )
                 node.selfillumcolor = (
-                    controllers[CTRL_MESH_SELFILLUMCOLOR][0][1:]
-                    if CTRL_MESH_SELFILLUMCOLOR in controllers
+                    first_rows[CTRL_MESH_SELFILLUMCOLOR]
+                    if CTRL_MESH_SELFILLUMCOLOR in first_rows
                     else [0.0] * 3
                 )
             elif type_flags & NODE_LIGHT:
                 node.radius = (
-                    controllers[CTRL_LIGHT_RADIUS][0][1]
-                    if CTRL_LIGHT_RADIUS in controllers
+                    first_rows[CTRL_LIGHT_RADIUS][0]
+                    if CTRL_LIGHT_RADIUS in first_rows
                     else 1.0
                 )
                 node.multiplier = (
-                    controllers[CTRL_LIGHT_MULTIPLIER][0][1]
-                    if CTRL_LIGHT_MULTIPLIER in controllers
+                    first_rows[CTRL_LIGHT_MULTIPLIER][0]
+                    if CTRL_LIGHT_MULTIPLIER in first_rows
                     else 1.0
                 )
                 node.color = (
-                    controllers[CTRL_LIGHT_COLOR][0][1:]
-                    if CTRL_LIGHT_COLOR in controllers
+                    first_rows[CTRL_LIGHT_COLOR]
+                    if CTRL_LIGHT_COLOR in first_rows
                     else [1.0] * 3
                 )
             elif type_flags & NODE_EMITTER:
                 for val, key, dim in EMITTER_CONTROLLER_KEYS:
-                    if val not in controllers:
+                    if val not in first_rows:
                         continue
                     if dim == 1:
-                        setattr(node, key, controllers[val][0][1])
+                        setattr(node, key, first_rows[val][0])
                     else:
-                        setattr(node, key, controllers[val][0][1 : dim + 1])
+                        setattr(node, key, first_rows[val][0:dim])
 
         if type_flags & NODE_LIGHT:
             self.mdl.seek(MDL_OFFSET + flare_size_arr.offset)
-            node.flare_list.sizes = [
-                self.mdl.read_float() for _ in range(flare_size_arr.count)
-            ]
+            node.flare_list.sizes = self.mdl.read_floats(flare_size_arr.count).tolist()
 
             self.mdl.seek(MDL_OFFSET + flare_position_arr.offset)
-            node.flare_list.positions = [
-                self.mdl.read_float() for _ in range(flare_position_arr.count)
-            ]
+            node.flare_list.positions = self.mdl.read_floats(
+                flare_position_arr.count
+            ).tolist()
 
             self.mdl.seek(MDL_OFFSET + flare_color_shift_arr.offset)
-            for _ in range(flare_color_shift_arr.count):
-                color_shift = [self.mdl.read_float() for _ in range(3)]
-                node.flare_list.colorshifts.append(color_shift)
+            node.flare_list.colorshifts = (
+                self.mdl.read_floats(3 * flare_color_shift_arr.count)
+                .reshape(-1, 3)
+                .tolist()
+            )
 
             self.mdl.seek(MDL_OFFSET + flare_tex_name_arr.offset)
-            tex_name_offsets = [
-                self.mdl.read_uint32() for _ in range(flare_tex_name_arr.count)
-            ]
+            tex_name_offsets = self.mdl.read_uint32s(flare_tex_name_arr.count).tolist()
             for tex_name_offset in tex_name_offsets:
                 self.mdl.seek(MDL_OFFSET + tex_name_offset)
                 node.flare_list.textures.append(self.mdl.read_c_string())
@@ -508,9 +627,9 @@ class MdlReader:
             if num_bonemap > 0:
                 self.mdl.seek(MDL_OFFSET + off_bonemap)
                 if self.xbox:
-                    bonemap = [self.mdl.read_uint16() for _ in range(num_bonemap)]
+                    bonemap = self.mdl.read_uint16s(num_bonemap).tolist()
                 else:
-                    bonemap = [int(self.mdl.read_float()) for _ in range(num_bonemap)]
+                    bonemap = self.mdl.read_floats(num_bonemap).astype(int).tolist()
             else:
                 bonemap = []
             node_by_bone = dict()
@@ -528,15 +647,12 @@ class MdlReader:
                     node.facelist.materials.append(0)
             elif face_arr.count > 0:
                 self.mdl.seek(MDL_OFFSET + face_arr.offset)
-                for _ in range(face_arr.count):
-                    normal = [self.mdl.read_float() for _ in range(3)]
-                    plane_distance = self.mdl.read_float()
-                    material_id = self.mdl.read_uint32()
-                    adjacent_faces = [self.mdl.read_uint16() for _ in range(3)]
-                    vert_indices = [self.mdl.read_uint16() for _ in range(3)]
-                    node.facelist.vertices.append(tuple(vert_indices))
-                    node.facelist.uv.append(tuple(vert_indices))
-                    node.facelist.materials.append(material_id)
+                faces = self.mdl.read_records(FACE_RECORD, face_arr.count)
+                node.facelist.vertices = faces["vert_indices"].astype(np.int32)
+                node.facelist.uv = node.facelist.vertices
+                node.facelist.materials = faces["material"]
+                node.facelist.normals = faces["normal"].astype(np.float64)
+                node.facelist.adjacent_faces = faces["adjacent_faces"]
                 if index_count_arr.count > 0:
                     self.mdl.seek(MDL_OFFSET + index_count_arr.offset)
                     num_indices = self.mdl.read_uint32()
@@ -547,7 +663,6 @@ class MdlReader:
             node.verts = []
             node.uv1 = []
             node.uv2 = []
-            node.weights = []
 
             if type_flags & NODE_SABER:
                 saber_verts = []
@@ -573,88 +688,141 @@ class MdlReader:
                     node.uv1.append(saber_tverts[i])
 
             elif mdx_data_size > 0:
-                for i in range(num_verts):
-                    self.mdx.seek(mdx_offset + i * mdx_data_size + off_mdx_verts)
-                    node.verts.append(tuple([self.mdx.read_float() for _ in range(3)]))
-                    if mdx_data_bitmap & MDX_FLAG_NORMAL:
-                        self.mdx.seek(mdx_offset + i * mdx_data_size + off_mdx_normals)
-                        if self.xbox:
-                            comp = self.mdx.read_uint32()
-                            node.normals.append(self.decompress_vector_xbox(comp))
-                        else:
-                            node.normals.append(
-                                tuple([self.mdx.read_float() for _ in range(3)])
-                            )
-                    if mdx_data_bitmap & MDX_FLAG_UV1:
-                        self.mdx.seek(mdx_offset + i * mdx_data_size + off_mdx_uv1)
-                        node.uv1.append(
-                            tuple([self.mdx.read_float() for _ in range(2)])
-                        )
-                    if mdx_data_bitmap & MDX_FLAG_UV2:
-                        self.mdx.seek(mdx_offset + i * mdx_data_size + off_mdx_uv2)
-                        node.uv2.append(
-                            tuple([self.mdx.read_float() for _ in range(2)])
-                        )
-                    if type_flags & NODE_SKIN:
-                        self.mdx.seek(
-                            mdx_offset + i * mdx_data_size + off_mdx_bone_weights
-                        )
-                        bone_weights = [self.mdx.read_float() for _ in range(4)]
-                        self.mdx.seek(
-                            mdx_offset + i * mdx_data_size + off_mdx_bone_indices
-                        )
-                        if self.xbox:
-                            bone_indices = [self.mdx.read_uint16() for _ in range(4)]
-                        else:
-                            bone_indices = [
-                                int(self.mdx.read_float()) for _ in range(4)
-                            ]
-                        vert_weights = []
-                        for i in range(4):
-                            bone_idx = bone_indices[i]
-                            if bone_idx == -1:
-                                continue
-                            node_idx = node_by_bone[bone_idx]
-                            node_name = self.node_names[node_idx]
-                            vert_weights.append([node_name, bone_weights[i]])
-                        node.weights.append(vert_weights)
+                fields = [("verts", "3f4", off_mdx_verts)]
+                if mdx_data_bitmap & MDX_FLAG_NORMAL:
+                    normal_format = "u4" if self.xbox else "3f4"
+                    fields.append(("normals", normal_format, off_mdx_normals))
+                if mdx_data_bitmap & MDX_FLAG_UV1:
+                    fields.append(("uv1", "2f4", off_mdx_uv1))
+                if mdx_data_bitmap & MDX_FLAG_UV2:
+                    fields.append(("uv2", "2f4", off_mdx_uv2))
+                if type_flags & NODE_SKIN:
+                    bone_index_format = "4u2" if self.xbox else "4f4"
+                    fields.append(("bone_weights", "4f4", off_mdx_bone_weights))
+                    fields.append(
+                        ("bone_indices", bone_index_format, off_mdx_bone_indices)
+                    )
+                names, formats, offsets = zip(*fields)
+                vert_dtype = np.dtype(
+                    dict(
+                        names=names,
+                        formats=formats,
+                        offsets=offsets,
+                        itemsize=mdx_data_size,
+                    )
+                )
+                self.mdx.seek(mdx_offset)
+                verts = self.mdx.read_records(vert_dtype, num_verts)
+
+                node.verts = verts["verts"].astype(np.float64)
+                if mdx_data_bitmap & MDX_FLAG_NORMAL:
+                    if self.xbox:
+                        node.normals = self.decompress_vectors_xbox(verts["normals"])
+                    else:
+                        node.normals = verts["normals"].astype(np.float64)
+                if mdx_data_bitmap & MDX_FLAG_UV1:
+                    node.uv1 = verts["uv1"].astype(np.float64)
+                if mdx_data_bitmap & MDX_FLAG_UV2:
+                    node.uv2 = verts["uv2"].astype(np.float64)
+                if type_flags & NODE_SKIN:
+                    bone_weights = verts["bone_weights"].astype(np.float64)
+                    bone_indices = verts["bone_indices"].astype(np.int32)
+                    if self.xbox:
+                        bone_indices[bone_indices == 0xFFFF] = -1
+                    self.skins.append((node, node_by_bone, bone_indices, bone_weights))
+
+        if type_flags & NODE_MESH and len(node.facelist.adjacent_faces) > 0:
+            node.face_adjacency_hash = compute_faces_hash(
+                node.verts, node.facelist.vertices
+            )
+        if type_flags & NODE_AABB and node.aabb_tree:
+            node.aabb_tree_hash = compute_faces_hash(node.verts, node.facelist.vertices)
 
         if type_flags & NODE_DANGLY:
             self.mdl.seek(MDL_OFFSET + constraint_arr.offset)
-            node.constraints = [
-                self.mdl.read_float() for _ in range(constraint_arr.count)
-            ]
+            node.constraints = self.mdl.read_floats(constraint_arr.count).tolist()
 
         self.mdl.seek(MDL_OFFSET + children_arr.offset)
-        child_offsets = [self.mdl.read_uint32() for _ in range(children_arr.count)]
-        for child_idx, off_child in enumerate(child_offsets):
-            child = self.load_nodes(off_child, child_idx, node)
-            node.children.append(child)
+        child_offsets = self.mdl.read_uint32s(children_arr.count).tolist()
 
-        return node
+        return node, child_offsets
 
-    def load_aabb(self, offset):
-        self.mdl.seek(MDL_OFFSET + offset)
-        bounding_box = [self.mdl.read_float() for _ in range(6)]
-        off_child1 = self.mdl.read_uint32()
-        off_child2 = self.mdl.read_uint32()
-        face_idx = self.mdl.read_int32()
-        most_significant_plane = self.mdl.read_uint32()
+    def load_skin_weights(self):
+        for node, node_by_bone, bone_indices, bone_weights in self.skins:
+            # Number bones of this node in order of first use
+            used = bone_indices != -1
+            bones, first_uses = np.unique(bone_indices[used], return_index=True)
+            bones = bones[np.argsort(first_uses)]
+            bone_lookup = np.full(bones.max() + 1 if len(bones) else 1, -1)
+            bone_lookup[bones] = np.arange(len(bones))
 
-        if off_child1 > 0:
-            self.load_aabb(off_child1)
-        if off_child2 > 0:
-            self.load_aabb(off_child2)
+            node.bone_names = [
+                self.node_names[node_by_bone[bone_idx]] for bone_idx in bones.tolist()
+            ]
+            node.bone_indices = np.where(
+                used, bone_lookup[np.where(used, bone_indices, 0)], -1
+            )
+            node.bone_weights = bone_weights
+
+    def load_aabb(self, offset):
+        split_axis_by_plane = {
+            AABB_NO_CHILDREN: 0,
+            AABB_POSITIVE_X: 1,
+            AABB_POSITIVE_Y: 2,
+            AABB_POSITIVE_Z: 3,
+            AABB_NEGATIVE_X: -1,
+            AABB_NEGATIVE_Y: -2,
+            AABB_NEGATIVE_Z: -3,
+        }
+        aabbs = []
+        stack = [(offset, None, 0)]
+        while stack:
+            offset, parent, child_slot = stack.pop()
+            if parent:
+                parent[child_slot] = len(aabbs)
+
+            self.mdl.seek(MDL_OFFSET + offset)
+            bounding_box = self.mdl.read_floats(6).tolist()
+            off_child1 = self.mdl.read_uint32()
+            off_child2 = self.mdl.read_uint32()
+            face_idx = self.mdl.read_int32()
+            most_significant_plane = self.mdl.read_uint32()
+
+            split_axis = split_axis_by_plane[most_significant_plane]
+            aabb = bounding_box + [-1, -1, face_idx, split_axis]
+            aabbs.append(aabb)
+
+            # Children are stored in pre-order, left subtree first
+            if off_child2 > 0:
+                stack.append((off_child2, aabb, 7))
+            if off_child1 > 0:
+                stack.append((off_child1, aabb, 6))
+
+        return aabbs
 
     def load_animations(self):
         if self.animation_arr.count == 0:
             return
         self.mdl.seek(MDL_OFFSET + self.animation_arr.offset)
-        offsets = [self.mdl.read_uint32() for _ in range(self.animation_arr.count)]
+        offsets = self.mdl.read_uint32s(self.animation_arr.count).tolist()
         for offset in offsets:
             self.load_animation(offset)
 
     def load_animation(self, offset):
+        anim = self.load_animation_header(offset)
+        self.model.animations.append(anim)
+
+    def load_animation_nodes(self):
+        for anim in self.model.animations:
+            anim.root_node = self.load_anim_root_node(anim)
+
+    def load_anim_root_node(self, anim):
+        if anim.off_root_node not in self.anim_root_nodes:
+            root_node = self.load_anim_nodes(anim.off_root_node, anim)
+            self.anim_root_nodes[anim.off_root_node] = root_node
+        return self.anim_root_nodes[anim.off_root_node]
+
+    def load_animation_header(self, offset):
         self.mdl.seek(MDL_OFFSET + offset)
 
         fn_ptr1 = self.mdl.read_uint32()
@@ -673,7 +841,7 @@ class MdlReader:
         event_arr = self.get_array_def()
         self.mdl.skip(4)  # padding
 
-        anim = Animation(name)
+        anim = LazyAnimation(self, name, off_root_node)
         anim.length = length
         anim.transtime = transition
         anim.animroot = anim_root
@@ -685,8 +853,7 @@ class MdlReader:
                 event_name = self.mdl.read_c_string_up_to(32)
                 anim.events.append((time, event_name))
 
-        anim.root_node = self.load_anim_nodes(off_root_node, anim)
-        self.model.animations.append(anim)
+        return anim
 
     def load_anim_nodes(self, offset, anim, parent=None):
         self.mdl.seek(MDL_OFFSET + offset)
@@ -717,52 +884,51 @@ class MdlReader:
             supernode = self.node_by_number[node_number]
             controllers = self.load_controllers(controller_arr, controller_data_arr)
             if CTRL_BASE_POSITION in controllers:
-                node.keyframes["position"] = [
-                    row for row in controllers[CTRL_BASE_POSITION]
-                ]
+                node.keyframes["position"] = self.controller_to_keyframes(
+                    controllers[CTRL_BASE_POSITION]
+                )
             if CTRL_BASE_ORIENTATION in controllers:
-                orientations = [
-                    self.orientation_controller_to_quaternion(row[1:])
-                    for row in controllers[CTRL_BASE_ORIENTATION]
-                ]
-                node.keyframes["orientation"] = [
-                    [row[0]] + orientations[i]
-                    for i, row in enumerate(controllers[CTRL_BASE_ORIENTATION])
-                ]
+                times, values = controllers[CTRL_BASE_ORIENTATION]
+                orientations = self.orientation_controller_to_quaternion(values)
+                node.keyframes["orientation"] = self.controller_to_keyframes(
+                    (times, orientations)
+                )
             if isinstance(supernode, TrimeshNode):
                 if CTRL_MESH_ALPHA in controllers:
-                    node.keyframes["alpha"] = [
-                        row for row in controllers[CTRL_MESH_ALPHA]
-                    ]
+                    node.keyframes["alpha"] = self.controller_to_keyframes(
+                        controllers[CTRL_MESH_ALPHA]
+                    )
                 if CTRL_MESH_SCALE in controllers:
-                    node.keyframes["scale"] = [
-                        row for row in controllers[CTRL_MESH_SCALE]
-                    ]
+                    node.keyframes["scale"] = self.controller_to_keyframes(
+                        controllers[CTRL_MESH_SCALE]
+                    )
                 if CTRL_MESH_SELFILLUMCOLOR in controllers:
-                    node.keyframes["selfillumcolor"] = [
-                        row for row in controllers[CTRL_MESH_SELFILLUMCOLOR]
-                    ]
+                    node.keyframes["selfillumcolor"] = self.controller_to_keyframes(
+                        controllers[CTRL_MESH_SELFILLUMCOLOR]
+                    )
             if isinstance(supernode, LightNode):
                 if CTRL_LIGHT_RADIUS in controllers:
-                    node.keyframes["radius"] = [
-                        row for row in controllers[CTRL_LIGHT_RADIUS]
-                    ]
+                    node.keyframes["radius"] = self.controller_to_keyframes(
+                        controllers[CTRL_LIGHT_RADIUS]
+                    )
                 if CTRL_LIGHT_MULTIPLIER in controllers:
-                    node.keyframes["multiplier"] = [
-                        row for row in controllers[CTRL_LIGHT_MULTIPLIER]
-                    ]
+                    node.keyframes["multiplier"] = self.controller_to_keyframes(
+                        controllers[CTRL_LIGHT_MULTIPLIER]
+                    )
                 if CTRL_LIGHT_COLOR in controllers:
-                    node.keyframes["color"] = [
-                        row for row in controllers[CTRL_LIGHT_COLOR]
-                    ]
+                    node.keyframes["color"] = self.controller_to_keyframes(
+                        controllers[CTRL_LIGHT_COLOR]
+                    )
             if isinstance(supernode, EmitterNode):
                 for key in EMITTER_CONTROLLER_KEYS:
                     if not key[0] in controllers:
                         continue
-                    node.keyframes[key[1]] = [row for row in controllers[key[0]]]
+                    node.keyframes[key[1]] = self.controller_to_keyframes(
+                        controllers[key[0]]
+                    )
 
         self.mdl.seek(MDL_OFFSET + children_arr.offset)
-        child_offsets = [self.mdl.read_uint32() for _ in range(children_arr.count)]
+        child_offsets = self.mdl.read_uint32s(children_arr.count).tolist()
         for off_child in child_offsets:
             child = self.load_anim_nodes(off_child, anim, node)
             node.children.append(child)
@@ -771,48 +937,39 @@ class MdlReader:
 
     def load_controllers(self, controller_arr, controller_data_arr):
         self.mdl.seek(MDL_OFFSET + controller_arr.offset)
-        keys = []
-        for _ in range(controller_arr.count):
-            ctrl_type = self.mdl.read_uint32()
-            self.mdl.skip(2)  # unknown
-            num_rows = self.mdl.read_uint16()
-            timekeys_start = self.mdl.read_uint16()
-            values_start = self.mdl.read_uint16()
-            num_columns = self.mdl.read_uint8()
-            self.mdl.skip(3)  # padding
-            keys.append(
-                ControllerKey(
-                    ctrl_type, num_rows, timekeys_start, values_start, num_columns
-                )
+        records = self.mdl.read_records(CONTROLLER_KEY_RECORD, controller_arr.count)
+        keys = [
+            ControllerKey(ctrl_type, num_rows, timekeys_start, values_start, columns)
+            for ctrl_type, num_rows, timekeys_start, values_start, columns in zip(
+                records["ctrl_type"].tolist(),
+                records["num_rows"].tolist(),
+                records["timekeys_start"].tolist(),
+                records["values_start"].tolist(),
+                records["num_columns"].tolist(),
             )
+        ]
+        self.mdl.seek(MDL_OFFSET + controller_data_arr.offset)
+        data = self.mdl.read_floats(controller_data_arr.count)
         controllers = dict()
         for key in keys:
-            self.mdl.seek(
-                MDL_OFFSET + controller_data_arr.offset + 4 * key.timekeys_start
-            )
-            timekeys = [self.mdl.read_float() for _ in range(key.num_rows)]
-            self.mdl.seek(
-                MDL_OFFSET + controller_data_arr.offset + 4 * key.values_start
-            )
+            times = data[key.timekeys_start : key.timekeys_start + key.num_rows]
             if key.ctrl_type == CTRL_BASE_ORIENTATION and key.num_columns == 2:
-                integral = True
-                num_columns = 1
+                values = data[key.values_start : key.values_start + key.num_rows]
+                values = values.view(self.mdl.uint32_dtype).reshape(-1, 1)
             else:
-                integral = False
                 num_columns = key.num_columns & 0xF
                 bezier = key.num_columns & CTRL_FLAG_BEZIER
                 if bezier:
                     num_columns *= 3
-            values = [
-                self.mdl.read_uint32() if integral else self.mdl.read_float()
-                for _ in range(num_columns * key.num_rows)
-            ]
-            controllers[key.ctrl_type] = [
-                [timekeys[i]] + values[i * num_columns : i * num_columns + num_columns]
-                for i in range(key.num_rows)
-            ]
+                values_stop = key.values_start + num_columns * key.num_rows
+                values = data[key.values_start : values_stop].reshape(-1, num_columns)
+            controllers[key.ctrl_type] = (times, values)
         return controllers
 
+    def controller_to_keyframes(self, controller):
+        times, values = controller
+        return np.column_stack((times, values)).tolist()
+
     def get_node_type(self, flags):
         if flags & NODE_SABER:
             return NodeType.LIGHTSABER
@@ -850,20 +1007,17 @@ class MdlReader:
             raise RuntimeError("Invalid node type")
 
     def orientation_controller_to_quaternion(self, values):
-        num_columns = len(values)
+        num_columns = values.shape[1]
         if num_columns == 4:
             return values
         elif num_columns == 1:
-            comp = values[0]
+            comp = values[:, 0].astype(np.int64)
             x = ((comp & 0x7FF) / 1023.0) - 1.0
             y = (((comp >> 11) & 0x7FF) / 1023.0) - 1.0
             z = ((comp >> 22) / 511.0) - 1.0
             mag2 = x * x + y * y + z * z
-            if mag2 < 1.0:
-                w = sqrt(1.0 - mag2)
-            else:
-                w = 0.0
-            return [x, y, z, w]
+            w = np.sqrt(1.0 - np.minimum(mag2, 1.0))
+            return np.stack((x, y, z, w), axis=1)
         else:
             raise RuntimeError(
                 "Unsupported number of orientation columns: " + str(num_columns)
@@ -880,23 +1034,12 @@ class MdlReader:
 
         return ArrayDefinition(offset, count1)
 
-    def decompress_vector_xbox(self, comp):
-        tmp = comp & 0x7FF
-        if tmp < 1024:
-            x = tmp / 1023.0
-        else:
-            x = (tmp - 2047) / 1023.0
-
-        tmp = (comp >> 11) & 0x7FF
-        if tmp < 1024:
-            y = tmp / 1023.0
-        else:
-            y = (tmp - 2047) / 1023.0
-
-        tmp = comp >> 22
-        if tmp < 512:
-            z = tmp / 511.0
-        else:
-            z = (tmp - 1023) / 511.0
-
-        return (x, y, z)
+    def decompress_vectors_xbox(self, comp):
+        comp = comp.astype(np.int64)
+        x = comp & 0x7FF
+        x = np.where(x < 1024, x, x - 2047) / 1023.0
+        y = (comp >> 11) & 0x7FF
+        y = np.where(y < 1024, y, y - 2047) / 1023.0
+        z = comp >> 22
+        z = np.where(z < 512, z, z - 1023) / 511.0
+        return np.stack((x, y, z), axis=1)
@@ -16,6 +16,8 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import numpy as np
+
 from ...constants import Classification
 
 # BEGIN Function Pointers
@@ -112,6 +114,16 @@ MDX_FLAG_TANGENT2 = 0x0100
 MDX_FLAG_TANGENT3 = 0x0200
 MDX_FLAG_TANGENT4 = 0x0400
 
+FACE_RECORD = np.dtype(
+    [
+        ("normal", "3f4"),
+        ("plane_distance", "f4"),
+        ("material", "u4"),
+        ("adjacent_faces", "3i2"),
+        ("vert_indices", "3u2"),
+    ]
+)
+
 EMITTER_FLAG_P2P = 0x0001
 EMITTER_FLAG_P2P_SEL = 0x0002
 EMITTER_FLAG_AFFECTED_WIND = 0x0004
@@ -246,6 +258,18 @@ EMITTER_CONTROLLER_KEYS = [
     (CTRL_EMITTER_COLORSTART, "colorstart", 3),
 ]
 
+CONTROLLER_KEY_RECORD = np.dtype(
+    [
+        ("ctrl_type", "u4"),
+        ("unknown", "u2"),
+        ("num_rows", "u2"),
+        ("timekeys_start", "u2"),
+        ("values_start", "u2"),
+        ("num_columns", "u1"),
+        ("padding", "3u1"),
+    ]
+)
+
 
 class ControllerKey:
     def __init__(self, ctrl_type, num_rows, timekeys_start, values_start, num_columns):
@@ -16,20 +16,58 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-import math
+import hashlib
 import os
 
-from mathutils import Vector
+import numpy as np
 
 from ...constants import NodeType
 from ...utils import is_not_null
-from ...aabb import generate_tree
-from ..binwriter import BinaryWriter
+from ...aabb import compute_faces_hash, generate_tree
+from ...meshgeometry import compute_mesh_statistics, compute_plane_distances
+from ...meshtopology import compute_face_adjacency
+from ..binwriter import BinaryWriter, flush_writers
+from .nodecache import NodeCacheEntry, update_hash
 from .types import *
 
 
+class NodeWriter(BinaryWriter):
+    def __init__(self):
+        super().__init__(None, "little")
+        self.offset_positions = []
+        self.mdx_offset_positions = []
+        self.node_references = []
+
+    def write_offset(self, val):
+        if val:
+            self.offset_positions.append(self.tell())
+        self.write_uint32(val)
+
+    def write_mdx_offset(self, val):
+        self.mdx_offset_positions.append(self.tell())
+        self.write_uint32(val)
+
+    def write_node_offset(self, val, node_idx):
+        if node_idx is not None:
+            self.node_references.append((self.tell(), node_idx))
+        self.write_uint32(val)
+
+    def write_array_def(self, offset, count):
+        self.write_offset(offset)
+        self.write_uint32(count)
+        self.write_uint32(count)
+
+
 class MdlWriter:
-    def __init__(self, path, model, tsl, xbox, compress_quaternions=False):
+    def __init__(
+        self,
+        path,
+        model,
+        tsl,
+        xbox,
+        compress_quaternions=False,
+        node_cache=None,
+    ):
         self.path = path
         self.mdl = BinaryWriter(path, "little")
 
@@ -41,6 +79,7 @@ class MdlWriter:
         self.tsl = tsl
         self.xbox = xbox
         self.compress_quaternions = compress_quaternions
+        self.node_cache = node_cache
 
         # Model
         self.mdl_pos = 0
@@ -69,10 +108,7 @@ class MdlWriter:
         self.flare_textures_offsets = dict()
 
         # Meshes
-        self.mesh_bounding_boxes = dict()
-        self.mesh_averages = dict()
-        self.mesh_radii = dict()
-        self.mesh_total_areas = dict()
+        self.mesh_stats = dict()
         self.verts_offsets = dict()
         self.faces_offsets = dict()
         self.index_count_offsets = dict()
@@ -82,6 +118,7 @@ class MdlWriter:
         self.mdx_offsets = dict()
 
         # Skinmeshes
+        self.skin_hash = None
         self.bonemap_offsets = dict()
         self.qbone_offsets = dict()
         self.tbone_offsets = dict()
@@ -133,6 +170,8 @@ class MdlWriter:
         self.save_animations()
         self.save_nodes()
 
+        flush_writers(self.mdl, self.mdx)
+
     def peek_model(self):
         self.mdl_pos = 80 + 116  # geometry header + model header
         self.off_name_offsets = self.mdl_pos
@@ -227,8 +266,9 @@ class MdlWriter:
 
                 # Controllers
                 ctrl_keys = []
-                ctrl_data = []
-                self.peek_anim_controllers(node, type_flags, ctrl_keys, ctrl_data)
+                ctrl_chunks = []
+                self.peek_anim_controllers(node, type_flags, ctrl_keys, ctrl_chunks)
+                ctrl_data = self.concat_controller_data(ctrl_chunks)
                 ctrl_count = len(ctrl_keys)
                 ctrl_data_count = len(ctrl_data)
                 self.anim_controller_keys[anim_idx].append(ctrl_keys)
@@ -371,39 +411,10 @@ class MdlWriter:
                         else:
                             self.mdx_pos += 4 * 8 * (num_verts + 1)
 
-                # Bounding Box, Average, Total Area
-                bb_min = Vector()
-                bb_max = Vector()
-                average = Vector()
-                total_area = 0.0
-                for face in node.facelist.vertices:
-                    verts = [Vector(node.verts[i]) for i in face]
-                    for vert in verts:
-                        bb_min.x = min(bb_min.x, vert.x)
-                        bb_min.y = min(bb_min.y, vert.y)
-                        bb_min.z = min(bb_min.z, vert.z)
-                        bb_max.x = max(bb_max.x, vert.x)
-                        bb_max.y = max(bb_max.y, vert.y)
-                        bb_max.z = max(bb_max.z, vert.z)
-                        average += vert
-                    edge1 = verts[1] - verts[0]
-                    edge2 = verts[2] - verts[0]
-                    edge3 = verts[2] - verts[1]
-                    area = self.calculate_face_area(edge1, edge2, edge3)
-                    if area != 1.0:
-                        total_area += area
-                average /= 3 * len(node.facelist.vertices)
-                self.mesh_bounding_boxes[node_idx] = [*bb_min, *bb_max]
-                self.mesh_averages[node_idx] = [*average]
-                self.mesh_total_areas[node_idx] = total_area
-
-                # Radius
-                radius = 0.0
-                for face in node.facelist.vertices:
-                    verts = [Vector(node.verts[i]) for i in face]
-                    for vert in verts:
-                        radius = max(radius, (vert - average).length)
-                self.mesh_radii[node_idx] = radius
+                # Bounding Box, Average, Total Area, Radius
+                self.mesh_stats[node_idx] = compute_mesh_statistics(
+                    node.verts, node.facelist.vertices
+                )
 
             # Skin Data
             if type_flags & NODE_SKIN:
@@ -464,8 +475,9 @@ class MdlWriter:
 
             # Controllers
             ctrl_keys = []
-            ctrl_data = []
-            self.peek_controllers(node, type_flags, ctrl_keys, ctrl_data)
+            ctrl_chunks = []
+            self.peek_controllers(node, type_flags, ctrl_keys, ctrl_chunks)
+            ctrl_data = self.concat_controller_data(ctrl_chunks)
             ctrl_count = len(ctrl_keys)
             ctrl_data_count = len(ctrl_data)
             self.controller_keys.append(ctrl_keys)
@@ -490,18 +502,15 @@ class MdlWriter:
         out_keys.append(
             ControllerKey(CTRL_BASE_POSITION, 1, data_count, data_count + 1, 3)
         )
-        out_data.append(0.0)  # timekey
-        for val in node.position:
-            out_data.append(val)
+        out_data.append(self.controller_floats([0.0, *node.position]))
         data_count += 4
 
         out_keys.append(
             ControllerKey(CTRL_BASE_ORIENTATION, 1, data_count, data_count + 1, 4)
         )
-        out_data.append(0.0)  # timekey
-        for val in node.orientation[1:4]:
-            out_data.append(val)
-        out_data.append(node.orientation[0])
+        out_data.append(
+            self.controller_floats([0.0, *node.orientation[1:4], node.orientation[0]])
+        )
         data_count += 5
 
         # Mesh Controllers
@@ -510,15 +519,13 @@ class MdlWriter:
             out_keys.append(
                 ControllerKey(CTRL_MESH_ALPHA, 1, data_count, data_count + 1, 1)
             )
-            out_data.append(0.0)  # timekey
-            out_data.append(node.alpha)
+            out_data.append(self.controller_floats([0.0, node.alpha]))
             data_count += 2
 
             out_keys.append(
                 ControllerKey(CTRL_MESH_SCALE, 1, data_count, data_count + 1, 1)
             )
-            out_data.append(0.0)  # timekey
-            out_data.append(node.scale)
+            out_data.append(self.controller_floats([0.0, node.scale]))
             data_count += 2
 
             out_keys.append(
@@ -526,9 +533,7 @@ class MdlWriter:
                     CTRL_MESH_SELFILLUMCOLOR, 1, data_count, data_count + 1, 3
                 )
             )
-            out_data.append(0.0)  # timekey
-            for val in node.selfillumcolor:
-                out_data.append(val)
+            out_data.append(self.controller_floats([0.0, *node.selfillumcolor]))
             data_count += 4
 
         # Light Controllers
@@ -537,23 +542,19 @@ class MdlWriter:
             out_keys.append(
                 ControllerKey(CTRL_LIGHT_RADIUS, 1, data_count, data_count + 1, 1)
             )
-            out_data.append(0.0)  # timekey
-            out_data.append(node.radius)
+            out_data.append(self.controller_floats([0.0, node.radius]))
             data_count += 2
 
             out_keys.append(
                 ControllerKey(CTRL_LIGHT_MULTIPLIER, 1, data_count, data_count + 1, 1)
             )
-            out_data.append(0.0)  # timekey
-            out_data.append(node.multiplier)
+            out_data.append(self.controller_floats([0.0, node.multiplier]))
             data_count += 2
 
             out_keys.append(
                 ControllerKey(CTRL_LIGHT_COLOR, 1, data_count, data_count + 1, 3)
             )
-            out_data.append(0.0)  # timekey
-            for val in node.color:
-                out_data.append(val)
+            out_data.append(self.controller_floats([0.0, *node.color]))
             data_count += 4
 
         # Emitter Controllers
@@ -566,12 +567,10 @@ class MdlWriter:
                 out_keys.append(
                     ControllerKey(ctrl_val, 1, data_count, data_count + 1, dim)
                 )
-                out_data.append(0.0)  # timekey
                 if dim == 1:
-                    out_data.append(value)
+                    out_data.append(self.controller_floats([0.0, value]))
                 else:
-                    for val in value:
-                        out_data.append(val)
+                    out_data.append(self.controller_floats([0.0, *value]))
                 data_count += 1 + dim
 
     def peek_anim_controllers(self, node, type_flags, out_keys, out_data):
@@ -598,14 +597,10 @@ class MdlWriter:
                     (dim | CTRL_FLAG_BEZIER) if bezier else dim,
                 )
             )
-            for i in range(num_rows):
-                out_data.append(keyframes[i][0])  # timekey
-            num_columns = 3 * dim if bezier else dim
-            for i in range(num_rows):
-                values = keyframes[i][1 : 1 + num_columns]
-                for val in values:
-                    out_data.append(val)
-            return data_count + (1 + num_columns) * num_rows
+            rows = np.asarray(keyframes, np.float64)
+            out_data.append(self.controller_floats(rows[:, 0]))  # timekeys
+            out_data.append(self.controller_floats(rows[:, 1:]))
+            return data_count + (1 + num_values) * num_rows
 
         def append_orientation_keyframes(data_count):
             if not self.compress_quaternions:
@@ -628,19 +623,9 @@ class MdlWriter:
                     2,
                 )
             )
-            for i in range(num_rows):
-                out_data.append(keyframes[i][0])  # timekey
-            for i in range(num_rows):
-                x, y, z, w = keyframes[i][1:]
-                if w < 0.0:
-                    x *= -1.0
-                    y *= -1.0
-                    z *= -1.0
-                ix = int((x + 1.0) * 1023.0)
-                iy = int((y + 1.0) * 1023.0)
-                iz = int((z + 1.0) * 511.0)
-                comp = ix | (iy << 11) | (iz << 22)
-                out_data.append(comp)
+            rows = np.asarray(keyframes, np.float64)
+            out_data.append(self.controller_floats(rows[:, 0]))  # timekeys
+            out_data.append(self.compress_quaternions_array(rows[:, 1:5]))
             return data_count + 2 * num_rows
 
         if not node.parent:
@@ -850,7 +835,8 @@ class MdlWriter:
             for val in orientation:
                 self.mdl.write_float(val)
             self.put_array_def(
-                self.anim_children_offsets[anim_idx][node_idx], len(child_indices)
+                self.anim_children_offsets[anim_idx][node_idx],
+                len(child_indices),
             )
             self.put_array_def(
                 self.anim_controller_offsets[anim_idx][node_idx],
@@ -868,757 +854,732 @@ class MdlWriter:
 
             # Controllers
 
-            for key in self.anim_controller_keys[anim_idx][node_idx]:
-                if key.ctrl_type in [CTRL_BASE_POSITION, CTRL_BASE_ORIENTATION]:
-                    unk1 = key.ctrl_type + 8
-                else:
-                    unk1 = 0xFFFF
-
-                self.mdl.write_uint32(key.ctrl_type)
-                self.mdl.write_uint16(unk1)
-                self.mdl.write_uint16(key.num_rows)
-                self.mdl.write_uint16(key.timekeys_start)
-                self.mdl.write_uint16(key.values_start)
-                self.mdl.write_uint8(key.num_columns)
-
-                for _ in range(3):
-                    self.mdl.write_uint8(0)  # padding
+            self.mdl.write_array(
+                self.controller_key_array(
+                    self.anim_controller_keys[anim_idx][node_idx], True
+                )
+            )
 
             # Controller Data
 
-            for val in self.anim_controller_data[anim_idx][node_idx]:
-                if type(val) is int:
-                    self.mdl.write_uint32(val)
-                else:
-                    self.mdl.write_float(val)
+            self.mdl.write_array(self.anim_controller_data[anim_idx][node_idx])
 
     def save_nodes(self):
+        if self.node_cache is not None:
+            # Skin data depends on names and transforms of all nodes
+            digest = hashlib.sha1()
+            update_hash(digest, self.node_names)
+            update_hash(digest, [node.from_root for node in self.nodes])
+            self.skin_hash = digest.digest()
+
+        # Node blocks only depend on offsets computed by the peek pass, so they
+        # can be serialized, or taken from the node cache, independently
         num_meshes = 0
-
         for node_idx, node in enumerate(self.nodes):
-            # Geometry Header
+            mdl_data, mdx_data = self.save_node(node_idx, num_meshes)
+            self.mdl.write_bytes(mdl_data)
+            self.mdx.write_bytes(mdx_data)
 
             type_flags = self.get_node_flags(node)
-            node_number = node.node_number
-            name_index = node_idx
-            off_root = 0
-            parent_idx = self.parent_indices[node_idx]
-            off_parent = self.node_offsets[parent_idx] if parent_idx is not None else 0
-            position = node.position
-            orientation = node.orientation
-            child_indices = self.child_indices[node_idx]
-
-            self.mdl.write_uint16(type_flags)
-            self.mdl.write_uint16(node_number)
-            self.mdl.write_uint16(name_index)
-            self.mdl.write_uint16(0)  # padding
-            self.mdl.write_uint32(off_root)
-            self.mdl.write_uint32(off_parent)
-            for val in position:
-                self.mdl.write_float(val)
-            for val in orientation:
-                self.mdl.write_float(val)
-            self.put_array_def(self.children_offsets[node_idx], len(child_indices))
-            self.put_array_def(
-                self.controller_offsets[node_idx], self.controller_counts[node_idx]
-            )
-            self.put_array_def(
-                self.controller_data_offsets[node_idx],
-                self.controller_data_counts[node_idx],
-            )
-
-            # Light Header
-
-            if type_flags & NODE_LIGHT:
-                shadow = node.shadow
-                light_priority = node.lightpriority
-                ambient_only = node.ambientonly
-                dynamic_type = node.dynamictype
-                affect_dynamic = node.affectdynamic
-                fading_light = node.fadinglight
-                flare = 0  # always 0
-                flare_radius = node.flareradius
-
-                self.mdl.write_float(flare_radius)
-                self.put_array_def(0, 0)  # unknown
-                self.put_array_def(
-                    self.flare_sizes_offsets[node_idx] if node.lensflares else 0,
-                    len(node.flare_list.sizes),
-                )
-                self.put_array_def(
-                    self.flare_positions_offsets[node_idx] if node.lensflares else 0,
-                    len(node.flare_list.positions),
-                )
-                self.put_array_def(
-                    self.flare_colorshifts_offsets[node_idx] if node.lensflares else 0,
-                    len(node.flare_list.colorshifts),
-                )
-                self.put_array_def(
-                    self.flare_texture_offset_offsets[node_idx]
-                    if node.lensflares
-                    else 0,
-                    len(node.flare_list.textures),
+            if type_flags & NODE_SABER:
+                num_meshes += 2
+            elif type_flags & NODE_MESH:
+                num_meshes += 1
+
+    def save_node(self, node_idx, num_meshes):
+        if self.node_cache is not None:
+            cache_key = self.get_node_cache_key(node_idx, num_meshes)
+            entry = self.node_cache.get(cache_key)
+            if entry:
+                return entry.relocate(
+                    self.node_offsets[node_idx],
+                    self.mdx_offsets.get(node_idx, 0),
+                    self.node_offsets,
                 )
-                self.mdl.write_int32(light_priority)
-                self.mdl.write_uint32(ambient_only)
-                self.mdl.write_uint32(dynamic_type)
-                self.mdl.write_uint32(affect_dynamic)
-                self.mdl.write_uint32(shadow)
-                self.mdl.write_uint32(flare)
-                self.mdl.write_uint32(fading_light)
 
-                # Lens Flares
-                if node.lensflares:
-                    for size in node.flare_list.sizes:
-                        self.mdl.write_float(size)
-                    for position in node.flare_list.positions:
-                        self.mdl.write_float(position)
-                    for colorshift in node.flare_list.colorshifts:
-                        for val in colorshift:
-                            self.mdl.write_float(val)
-                    for i in range(len(node.flare_list.textures)):
-                        off_tex = self.flare_textures_offsets[node_idx][i]
-                        self.mdl.write_uint32(off_tex)
-                    for tex in node.flare_list.textures:
-                        self.mdl.write_c_string(tex)
-
-            # Emitter Header
-
-            if type_flags & NODE_EMITTER:
-                update = node.update.ljust(32, "\0")
-                render = node.emitter_render.ljust(32, "\0")
-                blend = node.blend.ljust(32, "\0")
-                texture = node.texture.ljust(32, "\0")
-                chunk_name = node.chunk_name.ljust(16, "\0")
-                twosided_tex = 1 if node.twosidedtex else 0
-                loop = 1 if node.loop else 0
-                frame_blending = 1 if node.frame_blending else 0
-                depth_texture_name = node.depth_texture_name.ljust(32, "\0")
-
-                flags = 0
-                if node.p2p:
-                    flags |= EMITTER_FLAG_P2P
-                if node.p2p_sel:
-                    flags |= EMITTER_FLAG_P2P_SEL
-                if node.affected_by_wind:
-                    flags |= EMITTER_FLAG_AFFECTED_WIND
-                if node.tinted:
-                    flags |= EMITTER_FLAG_TINTED
-                if node.bounce:
-                    flags |= EMITTER_FLAG_BOUNCE
-                if node.random:
-                    flags |= EMITTER_FLAG_RANDOM
-                if node.inherit:
-                    flags |= EMITTER_FLAG_INHERIT
-                if node.inheritvel:
-                    flags |= EMITTER_FLAG_INHERIT_VEL
-                if node.inherit_local:
-                    flags |= EMITTER_FLAG_INHERIT_LOCAL
-                if node.splat:
-                    flags |= EMITTER_FLAG_SPLAT
-                if node.inherit_part:
-                    flags |= EMITTER_FLAG_INHERIT_PART
-                if node.depth_texture:
-                    flags |= EMITTER_FLAG_DEPTH_TEXTURE
-
-                self.mdl.write_float(node.deadspace)
-                self.mdl.write_float(node.blastradius)
-                self.mdl.write_float(node.blastlength)
-                self.mdl.write_uint32(node.num_branches)
-                self.mdl.write_float(node.controlptsmoothing)
-                self.mdl.write_uint32(node.xgrid)
-                self.mdl.write_uint32(node.ygrid)
-                self.mdl.write_uint32(node.spawntype)
-                self.mdl.write_string(update)
-                self.mdl.write_string(render)
-                self.mdl.write_string(blend)
-                self.mdl.write_string(texture)
-                self.mdl.write_string(chunk_name)
-                self.mdl.write_uint32(twosided_tex)
-                self.mdl.write_uint32(loop)
-                self.mdl.write_uint16(node.renderorder)
-                self.mdl.write_uint8(frame_blending)
-                self.mdl.write_string(depth_texture_name)
-                self.mdl.write_uint8(0)  # padding
-                self.mdl.write_uint32(flags)
-
-            # Reference Header
+        node = self.nodes[node_idx]
+        mdl = NodeWriter()
+        mdx = BinaryWriter(None, "little")
+
+        # Geometry Header
+
+        type_flags = self.get_node_flags(node)
+        node_number = node.node_number
+        name_index = node_idx
+        off_root = 0
+        parent_idx = self.parent_indices[node_idx]
+        off_parent = self.node_offsets[parent_idx] if parent_idx is not None else 0
+        position = node.position
+        orientation = node.orientation
+        child_indices = self.child_indices[node_idx]
+
+        mdl.write_uint16(type_flags)
+        mdl.write_uint16(node_number)
+        mdl.write_uint16(name_index)
+        mdl.write_uint16(0)  # padding
+        mdl.write_uint32(off_root)
+        mdl.write_node_offset(off_parent, parent_idx)
+        for val in position:
+            mdl.write_float(val)
+        for val in orientation:
+            mdl.write_float(val)
+        mdl.write_array_def(self.children_offsets[node_idx], len(child_indices))
+        mdl.write_array_def(
+            self.controller_offsets[node_idx], self.controller_counts[node_idx]
+        )
+        mdl.write_array_def(
+            self.controller_data_offsets[node_idx],
+            self.controller_data_counts[node_idx],
+        )
 
-            if type_flags & NODE_REFERENCE:
-                ref_model = node.refmodel.ljust(32, "\0")
-                reattachable = node.reattachable
+        # Light Header
 
-                self.mdl.write_string(ref_model)
-                self.mdl.write_uint32(reattachable)
+        if type_flags & NODE_LIGHT:
+            shadow = node.shadow
+            light_priority = node.lightpriority
+            ambient_only = node.ambientonly
+            dynamic_type = node.dynamictype
+            affect_dynamic = node.affectdynamic
+            fading_light = node.fadinglight
+            flare = 0  # always 0
+            flare_radius = node.flareradius
+
+            mdl.write_float(flare_radius)
+            mdl.write_array_def(0, 0)  # unknown
+            mdl.write_array_def(
+                self.flare_sizes_offsets[node_idx] if node.lensflares else 0,
+                len(node.flare_list.sizes),
+            )
+            mdl.write_array_def(
+                self.flare_positions_offsets[node_idx] if node.lensflares else 0,
+                len(node.flare_list.positions),
+            )
+            mdl.write_array_def(
+                self.flare_colorshifts_offsets[node_idx] if node.lensflares else 0,
+                len(node.flare_list.colorshifts),
+            )
+            mdl.write_array_def(
+                self.flare_texture_offset_offsets[node_idx] if node.lensflares else 0,
+                len(node.flare_list.textures),
+            )
+            mdl.write_int32(light_priority)
+            mdl.write_uint32(ambient_only)
+            mdl.write_uint32(dynamic_type)
+            mdl.write_uint32(affect_dynamic)
+            mdl.write_uint32(shadow)
+            mdl.write_uint32(flare)
+            mdl.write_uint32(fading_light)
+
+            # Lens Flares
+            if node.lensflares:
+                for size in node.flare_list.sizes:
+                    mdl.write_float(size)
+                for position in node.flare_list.positions:
+                    mdl.write_float(position)
+                for colorshift in node.flare_list.colorshifts:
+                    for val in colorshift:
+                        mdl.write_float(val)
+                for i in range(len(node.flare_list.textures)):
+                    off_tex = self.flare_textures_offsets[node_idx][i]
+                    mdl.write_offset(off_tex)
+                for tex in node.flare_list.textures:
+                    mdl.write_c_string(tex)
+
+        # Emitter Header
 
-            # Mesh Header
+        if type_flags & NODE_EMITTER:
+            update = node.update.ljust(32, "\0")
+            render = node.emitter_render.ljust(32, "\0")
+            blend = node.blend.ljust(32, "\0")
+            texture = node.texture.ljust(32, "\0")
+            chunk_name = node.chunk_name.ljust(16, "\0")
+            twosided_tex = 1 if node.twosidedtex else 0
+            loop = 1 if node.loop else 0
+            frame_blending = 1 if node.frame_blending else 0
+            depth_texture_name = node.depth_texture_name.ljust(32, "\0")
+
+            flags = 0
+            if node.p2p:
+                flags |= EMITTER_FLAG_P2P
+            if node.p2p_sel:
+                flags |= EMITTER_FLAG_P2P_SEL
+            if node.affected_by_wind:
+                flags |= EMITTER_FLAG_AFFECTED_WIND
+            if node.tinted:
+                flags |= EMITTER_FLAG_TINTED
+            if node.bounce:
+                flags |= EMITTER_FLAG_BOUNCE
+            if node.random:
+                flags |= EMITTER_FLAG_RANDOM
+            if node.inherit:
+                flags |= EMITTER_FLAG_INHERIT
+            if node.inheritvel:
+                flags |= EMITTER_FLAG_INHERIT_VEL
+            if node.inherit_local:
+                flags |= EMITTER_FLAG_INHERIT_LOCAL
+            if node.splat:
+                flags |= EMITTER_FLAG_SPLAT
+            if node.inherit_part:
+                flags |= EMITTER_FLAG_INHERIT_PART
+            if node.depth_texture:
+                flags |= EMITTER_FLAG_DEPTH_TEXTURE
+
+            mdl.write_float(node.deadspace)
+            mdl.write_float(node.blastradius)
+            mdl.write_float(node.blastlength)
+            mdl.write_uint32(node.num_branches)
+            mdl.write_float(node.controlptsmoothing)
+            mdl.write_uint32(node.xgrid)
+            mdl.write_uint32(node.ygrid)
+            mdl.write_uint32(node.spawntype)
+            mdl.write_string(update)
+            mdl.write_string(render)
+            mdl.write_string(blend)
+            mdl.write_string(texture)
+            mdl.write_string(chunk_name)
+            mdl.write_uint32(twosided_tex)
+            mdl.write_uint32(loop)
+            mdl.write_uint16(node.renderorder)
+            mdl.write_uint8(frame_blending)
+            mdl.write_string(depth_texture_name)
+            mdl.write_uint8(0)  # padding
+            mdl.write_uint32(flags)
+
+        # Reference Header
+
+        if type_flags & NODE_REFERENCE:
+            ref_model = node.refmodel.ljust(32, "\0")
+            reattachable = node.reattachable
+
+            mdl.write_string(ref_model)
+            mdl.write_uint32(reattachable)
+
+        # Mesh Header
 
-            if type_flags & NODE_MESH:
-                fn_ptr1, fn_ptr2 = self.get_mesh_fn_ptr(type_flags)
-
-                bounding_box = self.mesh_bounding_boxes[node_idx]
-                radius = self.mesh_radii[node_idx]
-                average = self.mesh_averages[node_idx]
-                diffuse = node.diffuse
-                ambient = node.ambient
-                transparency_hint = node.transparencyhint
-                bitmap = node.bitmap.ljust(32, "\0")
-                bitmap2 = node.bitmap2.ljust(32, "\0")
-                bitmap3 = "".ljust(12, "\0")
-                bitmap4 = "".ljust(12, "\0")
-                animate_uv = node.animateuv
-                uv_dir_x = node.uvdirectionx
-                uv_dir_y = node.uvdirectiony
-                uv_jitter = node.uvjitter
-                uv_jitter_speed = node.uvjitterspeed
-
-                mdx_data_size = 0
-                mdx_data_bitmap = 0
-                off_mdx_verts = 0xFFFFFFFF
-                off_mdx_normals = 0xFFFFFFFF
-                off_mdx_colors = 0xFFFFFFFF
-                off_mdx_uv1 = 0xFFFFFFFF
-                off_mdx_uv2 = 0xFFFFFFFF
-                off_mdx_uv3 = 0xFFFFFFFF
-                off_mdx_uv4 = 0xFFFFFFFF
-                off_mdx_tan_space1 = 0xFFFFFFFF
-                off_mdx_tan_space2 = 0xFFFFFFFF
-                off_mdx_tan_space3 = 0xFFFFFFFF
-                off_mdx_tan_space4 = 0xFFFFFFFF
-                if not type_flags & NODE_SABER:
-                    # Vertex Coordinates
-                    mdx_data_bitmap = MDX_FLAG_VERTEX
-                    off_mdx_verts = 0
+        if type_flags & NODE_MESH:
+            fn_ptr1, fn_ptr2 = self.get_mesh_fn_ptr(type_flags)
+
+            mesh_stats = self.mesh_stats[node_idx]
+            bounding_box = mesh_stats.bounding_box
+            radius = mesh_stats.radius
+            average = mesh_stats.average
+            diffuse = node.diffuse
+            ambient = node.ambient
+            transparency_hint = node.transparencyhint
+            bitmap = node.bitmap.ljust(32, "\0")
+            bitmap2 = node.bitmap2.ljust(32, "\0")
+            bitmap3 = "".ljust(12, "\0")
+            bitmap4 = "".ljust(12, "\0")
+            animate_uv = node.animateuv
+            uv_dir_x = node.uvdirectionx
+            uv_dir_y = node.uvdirectiony
+            uv_jitter = node.uvjitter
+            uv_jitter_speed = node.uvjitterspeed
+
+            mdx_data_size = 0
+            mdx_data_bitmap = 0
+            off_mdx_verts = 0xFFFFFFFF
+            off_mdx_normals = 0xFFFFFFFF
+            off_mdx_colors = 0xFFFFFFFF
+            off_mdx_uv1 = 0xFFFFFFFF
+            off_mdx_uv2 = 0xFFFFFFFF
+            off_mdx_uv3 = 0xFFFFFFFF
+            off_mdx_uv4 = 0xFFFFFFFF
+            off_mdx_tan_space1 = 0xFFFFFFFF
+            off_mdx_tan_space2 = 0xFFFFFFFF
+            off_mdx_tan_space3 = 0xFFFFFFFF
+            off_mdx_tan_space4 = 0xFFFFFFFF
+            if not type_flags & NODE_SABER:
+                # Vertex Coordinates
+                mdx_data_bitmap = MDX_FLAG_VERTEX
+                off_mdx_verts = 0
+                mdx_data_size += 4 * 3
+                # Normal
+                mdx_data_bitmap |= MDX_FLAG_NORMAL
+                off_mdx_normals = 4 * 3
+                if self.xbox:
+                    mdx_data_size += 4
+                else:
                     mdx_data_size += 4 * 3
-                    # Normal
-                    mdx_data_bitmap |= MDX_FLAG_NORMAL
-                    off_mdx_normals = 4 * 3
+                # UV1
+                if node.uv1:
+                    mdx_data_bitmap |= MDX_FLAG_UV1
+                    off_mdx_uv1 = mdx_data_size
+                    mdx_data_size += 4 * 2
+                # UV2
+                if node.uv2:
+                    mdx_data_bitmap |= MDX_FLAG_UV2
+                    off_mdx_uv2 = mdx_data_size
+                    mdx_data_size += 4 * 2
+                # Tangent Space
+                if node.tangentspace:
+                    mdx_data_bitmap |= MDX_FLAG_TANGENT1
+                    off_mdx_tan_space1 = mdx_data_size
                     if self.xbox:
-                        mdx_data_size += 4
-                    else:
                         mdx_data_size += 4 * 3
-                    # UV1
-                    if node.uv1:
-                        mdx_data_bitmap |= MDX_FLAG_UV1
-                        off_mdx_uv1 = mdx_data_size
-                        mdx_data_size += 4 * 2
-                    # UV2
-                    if node.uv2:
-                        mdx_data_bitmap |= MDX_FLAG_UV2
-                        off_mdx_uv2 = mdx_data_size
+                    else:
+                        mdx_data_size += 4 * 9
+                # Bone Weights + Bone Indices
+                if type_flags & NODE_SKIN:
+                    mdx_data_size += 4 * 4
+                    if self.xbox:
                         mdx_data_size += 4 * 2
-                    # Tangent Space
-                    if node.tangentspace:
-                        mdx_data_bitmap |= MDX_FLAG_TANGENT1
-                        off_mdx_tan_space1 = mdx_data_size
-                        if self.xbox:
-                            mdx_data_size += 4 * 3
-                        else:
-                            mdx_data_size += 4 * 9
-                    # Bone Weights + Bone Indices
-                    if type_flags & NODE_SKIN:
+                    else:
                         mdx_data_size += 4 * 4
-                        if self.xbox:
-                            mdx_data_size += 4 * 2
-                        else:
-                            mdx_data_size += 4 * 4
 
-                if type_flags & NODE_SABER:
-                    saber_vert_indices = []
-                    for i in range(8):
-                        saber_vert_indices.append(i)
-                    for i in range(20):
-                        for j in range(4):
-                            saber_vert_indices.append(j)
-                    for i in range(8, 16):
-                        saber_vert_indices.append(i)
-                    for i in range(20):
-                        for j in range(8, 12):
-                            saber_vert_indices.append(j)
-                    num_verts = NUM_SABER_VERTS
-                else:
-                    num_verts = len(node.verts)
-
-                num_faces = len(node.facelist.vertices)
-
-                num_textures = 0
-                if node.uv1:
-                    num_textures += 1
-                if node.uv2:
-                    num_textures += 1
-
-                has_lightmap = node.lightmapped
-                rotate_texture = node.rotatetexture
-                background_geometry = node.background_geometry
-                shadow = node.shadow
-                beaming = node.beaming
-                render = node.render
-                dirt_enabled = node.dirt_enabled
-                dirt_texture = node.dirt_texture
-                dirt_coord_space = node.dirt_worldspace
-                hide_in_holograms = node.hologram_donotdraw
-                total_area = self.mesh_total_areas[node_idx]
-                mdx_offset = self.mdx_offsets[node_idx]
-                if not self.xbox:
-                    off_vert_array = self.verts_offsets[node_idx]
-
-                self.mdl.write_uint32(fn_ptr1)
-                self.mdl.write_uint32(fn_ptr2)
-                self.put_array_def(self.faces_offsets[node_idx], num_faces)  # faces
-                for val in bounding_box:
-                    self.mdl.write_float(val)
-                self.mdl.write_float(radius)
-                for val in average:
-                    self.mdl.write_float(val)
-                for val in diffuse:
-                    self.mdl.write_float(val)
-                for val in ambient:
-                    self.mdl.write_float(val)
-                self.mdl.write_uint32(transparency_hint)
-                self.mdl.write_string(bitmap)
-                self.mdl.write_string(bitmap2)
-                self.mdl.write_string(bitmap3)
-                self.mdl.write_string(bitmap4)
+            if type_flags & NODE_SABER:
+                saber_vert_indices = []
+                for i in range(8):
+                    saber_vert_indices.append(i)
+                for i in range(20):
+                    for j in range(4):
+                        saber_vert_indices.append(j)
+                for i in range(8, 16):
+                    saber_vert_indices.append(i)
+                for i in range(20):
+                    for j in range(8, 12):
+                        saber_vert_indices.append(j)
+                num_verts = NUM_SABER_VERTS
+            else:
+                num_verts = len(node.verts)
+
+            num_faces = len(node.facelist.vertices)
+
+            num_textures = 0
+            if node.uv1:
+                num_textures += 1
+            if node.uv2:
+                num_textures += 1
+
+            has_lightmap = node.lightmapped
+            rotate_texture = node.rotatetexture
+            background_geometry = node.background_geometry
+            shadow = node.shadow
+            beaming = node.beaming
+            render = node.render
+            dirt_enabled = node.dirt_enabled
+            dirt_texture = node.dirt_texture
+            dirt_coord_space = node.dirt_worldspace
+            hide_in_holograms = node.hologram_donotdraw
+            total_area = mesh_stats.total_area
+            mdx_offset = self.mdx_offsets[node_idx]
+            if not self.xbox:
+                off_vert_array = self.verts_offsets[node_idx]
+
+            mdl.write_uint32(fn_ptr1)
+            mdl.write_uint32(fn_ptr2)
+            mdl.write_array_def(self.faces_offsets[node_idx], num_faces)  # faces
+            for val in bounding_box:
+                mdl.write_float(val)
+            mdl.write_float(radius)
+            for val in average:
+                mdl.write_float(val)
+            for val in diffuse:
+                mdl.write_float(val)
+            for val in ambient:
+                mdl.write_float(val)
+            mdl.write_uint32(transparency_hint)
+            mdl.write_string(bitmap)
+            mdl.write_string(bitmap2)
+            mdl.write_string(bitmap3)
+            mdl.write_string(bitmap4)
 
-                if type_flags & NODE_SABER:
-                    self.put_array_def(
-                        self.index_count_offsets[node_idx], 0
-                    )  # indices count
-                    self.put_array_def(
-                        self.index_offset_offsets[node_idx], 0
-                    )  # indices offset
-                    self.put_array_def(
-                        self.inv_count_offsets[node_idx], 0
-                    )  # inverted counter
-                else:
-                    self.put_array_def(
-                        self.index_count_offsets[node_idx], 1
-                    )  # indices count
-                    self.put_array_def(
-                        self.index_offset_offsets[node_idx], 1
-                    )  # indices offset
-                    self.put_array_def(
-                        self.inv_count_offsets[node_idx], 1
-                    )  # inverted counter
-
-                self.mdl.write_uint32(0xFFFFFFFF)  # unknown
-                self.mdl.write_uint32(0xFFFFFFFF)  # unknown
-                self.mdl.write_uint32(0)  # unknown
-                self.mdl.write_uint8(3)  # saber unknown
-                for _ in range(7):
-                    self.mdl.write_uint8(0)  # saber unknown
-                self.mdl.write_uint32(animate_uv)
-                self.mdl.write_float(uv_dir_x)
-                self.mdl.write_float(uv_dir_y)
-                self.mdl.write_float(uv_jitter)
-                self.mdl.write_float(uv_jitter_speed)
-                self.mdl.write_uint32(mdx_data_size)
-                self.mdl.write_uint32(mdx_data_bitmap)
-                self.mdl.write_uint32(off_mdx_verts)
-                self.mdl.write_uint32(off_mdx_normals)
-                self.mdl.write_uint32(off_mdx_colors)
-                self.mdl.write_uint32(off_mdx_uv1)
-                self.mdl.write_uint32(off_mdx_uv2)
-                self.mdl.write_uint32(off_mdx_uv3)
-                self.mdl.write_uint32(off_mdx_uv4)
-                self.mdl.write_uint32(off_mdx_tan_space1)
-                self.mdl.write_uint32(off_mdx_tan_space2)
-                self.mdl.write_uint32(off_mdx_tan_space3)
-                self.mdl.write_uint32(off_mdx_tan_space4)
-                self.mdl.write_uint16(num_verts)
-                self.mdl.write_uint16(num_textures)
-                self.mdl.write_uint8(has_lightmap)
-                self.mdl.write_uint8(rotate_texture)
-                self.mdl.write_uint8(background_geometry)
-                self.mdl.write_uint8(shadow)
-                self.mdl.write_uint8(beaming)
-                self.mdl.write_uint8(render)
+            if type_flags & NODE_SABER:
+                mdl.write_array_def(
+                    self.index_count_offsets[node_idx], 0
+                )  # indices count
+                mdl.write_array_def(
+                    self.index_offset_offsets[node_idx], 0
+                )  # indices offset
+                mdl.write_array_def(
+                    self.inv_count_offsets[node_idx], 0
+                )  # inverted counter
+            else:
+                mdl.write_array_def(
+                    self.index_count_offsets[node_idx], 1
+                )  # indices count
+                mdl.write_array_def(
+                    self.index_offset_offsets[node_idx], 1
+                )  # indices offset
+                mdl.write_array_def(
+                    self.inv_count_offsets[node_idx], 1
+                )  # inverted counter
+
+            mdl.write_uint32(0xFFFFFFFF)  # unknown
+            mdl.write_uint32(0xFFFFFFFF)  # unknown
+            mdl.write_uint32(0)  # unknown
+            mdl.write_uint8(3)  # saber unknown
+            for _ in range(7):
+                mdl.write_uint8(0)  # saber unknown
+            mdl.write_uint32(animate_uv)
+            mdl.write_float(uv_dir_x)
+            mdl.write_float(uv_dir_y)
+            mdl.write_float(uv_jitter)
+            mdl.write_float(uv_jitter_speed)
+            mdl.write_uint32(mdx_data_size)
+            mdl.write_uint32(mdx_data_bitmap)
+            mdl.write_uint32(off_mdx_verts)
+            mdl.write_uint32(off_mdx_normals)
+            mdl.write_uint32(off_mdx_colors)
+            mdl.write_uint32(off_mdx_uv1)
+            mdl.write_uint32(off_mdx_uv2)
+            mdl.write_uint32(off_mdx_uv3)
+            mdl.write_uint32(off_mdx_uv4)
+            mdl.write_uint32(off_mdx_tan_space1)
+            mdl.write_uint32(off_mdx_tan_space2)
+            mdl.write_uint32(off_mdx_tan_space3)
+            mdl.write_uint32(off_mdx_tan_space4)
+            mdl.write_uint16(num_verts)
+            mdl.write_uint16(num_textures)
+            mdl.write_uint8(has_lightmap)
+            mdl.write_uint8(rotate_texture)
+            mdl.write_uint8(background_geometry)
+            mdl.write_uint8(shadow)
+            mdl.write_uint8(beaming)
+            mdl.write_uint8(render)
 
-                if self.tsl:
-                    self.mdl.write_uint8(dirt_enabled)
-                    self.mdl.write_uint8(0)  # padding
-                    self.mdl.write_uint16(dirt_texture)
-                    self.mdl.write_uint16(dirt_coord_space)
-                    self.mdl.write_uint8(hide_in_holograms)
-                    self.mdl.write_uint8(0)  # padding
-
-                self.mdl.write_uint16(0)  # padding
-                self.mdl.write_float(total_area)
-                self.mdl.write_uint32(0)  # padding
-                self.mdl.write_uint32(mdx_offset)
-                if not self.xbox:
-                    self.mdl.write_uint32(off_vert_array)
+            if self.tsl:
+                mdl.write_uint8(dirt_enabled)
+                mdl.write_uint8(0)  # padding
+                mdl.write_uint16(dirt_texture)
+                mdl.write_uint16(dirt_coord_space)
+                mdl.write_uint8(hide_in_holograms)
+                mdl.write_uint8(0)  # padding
+
+            mdl.write_uint16(0)  # padding
+            mdl.write_float(total_area)
+            mdl.write_uint32(0)  # padding
+            if type_flags & NODE_SABER:
+                mdl.write_uint32(mdx_offset)
+            else:
+                mdl.write_mdx_offset(mdx_offset)
+            if not self.xbox:
+                mdl.write_offset(off_vert_array)
 
-            # Skin Header
+        # Skin Header
 
-            if type_flags & NODE_SKIN:
-                bone_names = set()
-                for vert_weights in node.weights:
-                    for bone_name, _ in vert_weights:
-                        bone_names.add(bone_name)
-                bone_indices = []
-                for bone_name in bone_names:
-                    bone_indices.append(self.node_idx_by_name[bone_name])
-                bonemap = [-1] * len(self.nodes)
-                for bone_idx, bone_node_idx in enumerate(bone_indices):
-                    bonemap[bone_node_idx] = bone_idx
+        if type_flags & NODE_SKIN:
+            used_bones = np.unique(node.bone_indices)
+            bone_indices = []
+            for bone_idx in used_bones[used_bones != -1].tolist():
+                bone_name = node.bone_names[bone_idx]
+                bone_indices.append(self.node_idx_by_name[bone_name])
+            bonemap = [-1] * len(self.nodes)
+            for bone_idx, bone_node_idx in enumerate(bone_indices):
+                bonemap[bone_node_idx] = bone_idx
 
-                if self.xbox:
-                    off_mdx_bone_indices = mdx_data_size - 2 * 4
-                    off_mdx_bone_weights = off_mdx_bone_indices - 4 * 4
+            if self.xbox:
+                off_mdx_bone_indices = mdx_data_size - 2 * 4
+                off_mdx_bone_weights = off_mdx_bone_indices - 4 * 4
+            else:
+                off_mdx_bone_indices = mdx_data_size - 4 * 4
+                off_mdx_bone_weights = off_mdx_bone_indices - 4 * 4
+            off_bonemap = self.bonemap_offsets[node_idx]
+            num_bones = len(self.nodes)
+
+            mdl.write_array_def(0, 0)  # unknown
+            mdl.write_uint32(off_mdx_bone_weights)
+            mdl.write_uint32(off_mdx_bone_indices)
+            mdl.write_offset(off_bonemap)
+            mdl.write_uint32(num_bones)
+            mdl.write_array_def(self.qbone_offsets[node_idx], num_bones)  # QBones
+            mdl.write_array_def(self.tbone_offsets[node_idx], num_bones)  # TBones
+            mdl.write_array_def(
+                self.skin_garbage_offsets[node_idx], num_bones
+            )  # garbage
+            for i in range(16):
+                if i < len(bone_indices):
+                    mdl.write_uint16(bone_indices[i])
                 else:
-                    off_mdx_bone_indices = mdx_data_size - 4 * 4
-                    off_mdx_bone_weights = off_mdx_bone_indices - 4 * 4
-                off_bonemap = self.bonemap_offsets[node_idx]
-                num_bones = len(self.nodes)
-
-                self.put_array_def(0, 0)  # unknown
-                self.mdl.write_uint32(off_mdx_bone_weights)
-                self.mdl.write_uint32(off_mdx_bone_indices)
-                self.mdl.write_uint32(off_bonemap)
-                self.mdl.write_uint32(num_bones)
-                self.put_array_def(self.qbone_offsets[node_idx], num_bones)  # QBones
-                self.put_array_def(self.tbone_offsets[node_idx], num_bones)  # TBones
-                self.put_array_def(
-                    self.skin_garbage_offsets[node_idx], num_bones
-                )  # garbage
-                for i in range(16):
-                    if i < len(bone_indices):
-                        self.mdl.write_uint16(bone_indices[i])
-                    else:
-                        self.mdl.write_uint16(0xFFFF)
-                self.mdl.write_uint32(0)  # padding
+                    mdl.write_uint16(0xFFFF)
+            mdl.write_uint32(0)  # padding
 
-            # Dangly Header
-
-            if type_flags & NODE_DANGLY:
-                displacement = node.displacement
-                tightness = node.tightness
-                period = node.period
-                off_vert_data = self.dangly_verts_offsets[node_idx]
+        # Dangly Header
 
-                self.put_array_def(
-                    self.constraints_offsets[node_idx], len(node.constraints)
-                )
-                self.mdl.write_float(displacement)
-                self.mdl.write_float(tightness)
-                self.mdl.write_float(period)
-                self.mdl.write_uint32(off_vert_data)
+        if type_flags & NODE_DANGLY:
+            displacement = node.displacement
+            tightness = node.tightness
+            period = node.period
+            off_vert_data = self.dangly_verts_offsets[node_idx]
 
-            # AABB Header
-
-            if type_flags & NODE_AABB:
-                self.mdl.write_uint32(self.aabb_offsets[node_idx][0])
+            mdl.write_array_def(
+                self.constraints_offsets[node_idx], len(node.constraints)
+            )
+            mdl.write_float(displacement)
+            mdl.write_float(tightness)
+            mdl.write_float(period)
+            mdl.write_offset(off_vert_data)
 
-            # Saber Header
+        # AABB Header
 
-            if type_flags & NODE_SABER:
-                saber_inv_count1 = self.get_inverted_counter(num_meshes + 1)
-                saber_inv_count2 = self.get_inverted_counter(num_meshes + 2)
-                num_meshes += 2
+        if type_flags & NODE_AABB:
+            mdl.write_offset(self.aabb_offsets[node_idx][0])
 
-                self.mdl.write_uint32(self.saber_verts_offsets[node_idx])
-                self.mdl.write_uint32(self.saber_uv_offsets[node_idx])
-                self.mdl.write_uint32(self.saber_normals_offsets[node_idx])
-                self.mdl.write_uint32(saber_inv_count1)
-                self.mdl.write_uint32(saber_inv_count2)
+        # Saber Header
 
-            # Mesh Data
+        if type_flags & NODE_SABER:
+            saber_inv_count1 = self.get_inverted_counter(num_meshes + 1)
+            saber_inv_count2 = self.get_inverted_counter(num_meshes + 2)
+            num_meshes += 2
 
-            if type_flags & NODE_MESH:
-                # Face Adjacencies
-                face_adjacencies = []
-                for face_idx in range(num_faces):
-                    face_adjacencies.append([-1, -1, -1])
-                for face_idx, face in enumerate(node.facelist.vertices):
-                    edges = [
-                        tuple(sorted(edge))
-                        for edge in [
-                            (face[0], face[1]),
-                            (face[1], face[2]),
-                            (face[2], face[0]),
-                        ]
-                    ]
-                    for other_face_idx in range(face_idx + 1, num_faces):
-                        other_face = node.facelist.vertices[other_face_idx]
-                        other_edges = [
-                            tuple(sorted(edge))
-                            for edge in [
-                                (other_face[0], other_face[1]),
-                                (other_face[1], other_face[2]),
-                                (other_face[2], other_face[0]),
-                            ]
-                        ]
-                        num_adj_faces = 0
-                        for i in range(3):
-                            if face_adjacencies[face_idx][i] != -1:
-                                num_adj_faces += 1
-                                continue
-                            for j in range(3):
-                                if edges[i] == other_edges[j]:
-                                    face_adjacencies[face_idx][i] = other_face_idx
-                                    face_adjacencies[other_face_idx][j] = face_idx
-                                    num_adj_faces += 1
-                                    break
-                        if num_adj_faces == 3:
-                            break
+            mdl.write_offset(self.saber_verts_offsets[node_idx])
+            mdl.write_offset(self.saber_uv_offsets[node_idx])
+            mdl.write_offset(self.saber_normals_offsets[node_idx])
+            mdl.write_uint32(saber_inv_count1)
+            mdl.write_uint32(saber_inv_count2)
 
-                # Faces
-                for face_idx, face in enumerate(node.facelist.vertices):
-                    vert1 = Vector(node.verts[face[0]])
-                    normal = Vector(node.facelist.normals[face_idx])
-                    distance = -1.0 * (normal @ vert1)
-                    material_id = node.facelist.materials[face_idx]
-
-                    for val in normal:
-                        self.mdl.write_float(val)
-                    self.mdl.write_float(distance)
-                    self.mdl.write_uint32(material_id)
-                    for val in face_adjacencies[face_idx]:
-                        self.mdl.write_int16(val)
-                    for val in face:
-                        self.mdl.write_uint16(val)
-
-                # Vertex Indices Offset
-                if not type_flags & NODE_SABER:
-                    self.mdl.write_uint32(self.indices_offsets[node_idx])
+        # Mesh Data
 
-                # Vertices
-                if not self.xbox:
-                    if type_flags & NODE_SABER:
-                        for vert_idx in saber_vert_indices:
-                            for val in node.verts[vert_idx]:
-                                self.mdl.write_float(val)
-                    else:
-                        for vert in node.verts:
-                            for val in vert:
-                                self.mdl.write_float(val)
-
-                # Vertex Indices Count, Inverted Mesh Counter, Vertex Indices
-                if not type_flags & NODE_SABER:
-                    num_meshes += 1
-                    mesh_inv_count = self.get_inverted_counter(num_meshes)
-
-                    self.mdl.write_uint32(
-                        3 * len(node.facelist.vertices)
-                    )  # vertex index count
-                    self.mdl.write_uint32(mesh_inv_count)  # inverted mesh counter
-
-                    # Vertex Indices
-                    for face in node.facelist.vertices:
-                        for val in face:
-                            self.mdl.write_uint16(val)
-
-                # MDX data
-                if not type_flags & NODE_SABER:
-                    for vert_idx, vert in enumerate(node.verts):
+        if type_flags & NODE_MESH:
+            # Face Adjacencies
+            face_adjacencies = self.get_face_adjacency(node)
+
+            # Faces
+            distances = compute_plane_distances(
+                node.verts, node.facelist.vertices, node.facelist.normals
+            ).tolist()
+            for face_idx, face in enumerate(node.facelist.vertices):
+                normal = node.facelist.normals[face_idx]
+                distance = distances[face_idx]
+                material_id = node.facelist.materials[face_idx]
+
+                for val in normal:
+                    mdl.write_float(val)
+                mdl.write_float(distance)
+                mdl.write_uint32(material_id)
+                for val in face_adjacencies[face_idx]:
+                    mdl.write_int16(val)
+                for val in face:
+                    mdl.write_uint16(val)
+
+            # Vertex Indices Offset
+            if not type_flags & NODE_SABER:
+                mdl.write_offset(self.indices_offsets[node_idx])
+
+            # Vertices
+            if not self.xbox:
+                if type_flags & NODE_SABER:
+                    for vert_idx in saber_vert_indices:
+                        for val in node.verts[vert_idx]:
+                            mdl.write_float(val)
+                else:
+                    for vert in node.verts:
                         for val in vert:
-                            self.mdx.write_float(val)
-                        if self.xbox:
-                            comp = self.compress_vector_xbox(node.normals[vert_idx])
-                            self.mdx.write_uint32(comp)
-                        else:
-                            for val in node.normals[vert_idx]:
-                                self.mdx.write_float(val)
-                        if node.uv1:
-                            for val in node.uv1[vert_idx]:
-                                self.mdx.write_float(val)
-                        if node.uv2:
-                            for val in node.uv2[vert_idx]:
-                                self.mdx.write_float(val)
-                        if node.tangentspace:
-                            if self.xbox:
-                                comp = self.compress_vector_xbox(
-                                    node.bitangents[vert_idx]
-                                )
-                                self.mdx.write_uint32(comp)
-                                comp = self.compress_vector_xbox(
-                                    node.tangents[vert_idx]
-                                )
-                                self.mdx.write_uint32(comp)
-                                comp = self.compress_vector_xbox(
-                                    node.tangentspacenormals[vert_idx]
-                                )
-                                self.mdx.write_uint32(comp)
-                            else:
-                                for val in node.bitangents[vert_idx]:
-                                    self.mdx.write_float(val)
-                                for val in node.tangents[vert_idx]:
-                                    self.mdx.write_float(val)
-                                for val in node.tangentspacenormals[vert_idx]:
-                                    self.mdx.write_float(val)
-                        if type_flags & NODE_SKIN:
-                            vert_weights = node.weights[vert_idx]
-                            bone_weights = []
-                            for bone_name, weight in vert_weights:
-                                bone_node_idx = self.node_idx_by_name[bone_name]
-                                bone_idx = bonemap[bone_node_idx]
-                                bone_weights.append((bone_idx, weight))
-                            for i in range(4):
-                                if i < len(bone_weights):
-                                    self.mdx.write_float(bone_weights[i][1])
-                                else:
-                                    self.mdx.write_float(0.0)
-                            if self.xbox:
-                                for i in range(4):
-                                    if i < len(bone_weights):
-                                        self.mdx.write_uint16(bone_weights[i][0])
-                                    else:
-                                        self.mdx.write_uint16(0xFFFF)
-                            else:
-                                for i in range(4):
-                                    if i < len(bone_weights):
-                                        self.mdx.write_float(float(bone_weights[i][0]))
-                                    else:
-                                        self.mdx.write_float(-1.0)
-                    # Extra MDX data
-                    for _ in range(3):
-                        self.mdx.write_float(1e7)
-                    if self.xbox:
-                        self.mdx.write_uint32(0)
-                    else:
-                        for _ in range(3):
-                            self.mdx.write_float(0.0)
-                    if node.uv1:
-                        for _ in range(2):
-                            self.mdx.write_float(0.0)
-                    if node.uv2:
-                        for _ in range(2):
-                            self.mdx.write_float(0.0)
-                    if node.tangentspace:
-                        if self.xbox:
-                            for _ in range(3):
-                                self.mdx.write_uint32(0)
-                        else:
-                            for _ in range(9):
-                                self.mdx.write_float(0.0)
-                    if type_flags & NODE_SKIN:
-                        weights = (1.0, 0.0, 0.0, 0.0)
-                        for val in weights:
-                            self.mdx.write_float(val)
-                        if self.xbox:
-                            for _ in range(4):
-                                self.mdx.write_uint16(0)
-                        else:
-                            for _ in range(4):
-                                self.mdx.write_float(0.0)
-
-            # Skin Data
-
-            if type_flags & NODE_SKIN:
-                # Bonemap
-                for bone_idx in bonemap:
-                    if self.xbox:
-                        self.mdl.write_uint16(bone_idx if bone_idx != -1 else 0xFFFF)
-                    else:
-                        self.mdl.write_float(float(bone_idx))
-
-                num_bones = len(bonemap)
-
-                # QBones, TBones
-                qbones = [None] * num_bones
-                tbones = [None] * num_bones
-                for i in range(num_bones):
-                    bone_trans = self.nodes[i].from_root.inverted() @ node.from_root
-                    tbones[i], qbones[i], _ = bone_trans.decompose()
-                for i in range(num_bones):
-                    qbone = qbones[i]
-                    self.mdl.write_float(qbone.w)
-                    self.mdl.write_float(qbone.x)
-                    self.mdl.write_float(qbone.y)
-                    self.mdl.write_float(qbone.z)
-                for i in range(num_bones):
-                    tbone = tbones[i]
-                    self.mdl.write_float(tbone.x)
-                    self.mdl.write_float(tbone.y)
-                    self.mdl.write_float(tbone.z)
-
-                # Garbage
-                for _ in range(num_bones):
-                    self.mdl.write_uint32(0)
-
-            # Dangly Data
+                            mdl.write_float(val)
 
-            if type_flags & NODE_DANGLY:
-                for val in node.constraints:
-                    self.mdl.write_float(val)
-                for vert in node.verts:
-                    for val in vert:
-                        self.mdl.write_float(val)
+            # Vertex Indices Count, Inverted Mesh Counter, Vertex Indices
+            if not type_flags & NODE_SABER:
+                num_meshes += 1
+                mesh_inv_count = self.get_inverted_counter(num_meshes)
 
-            # AABB Data
+                mdl.write_uint32(3 * len(node.facelist.vertices))  # vertex index count
+                mdl.write_uint32(mesh_inv_count)  # inverted mesh counter
 
-            if type_flags & NODE_AABB:
-                for aabb in self.aabbs[node_idx]:
-                    child_idx1 = aabb[6]
-                    child_idx2 = aabb[7]
-                    face_idx = aabb[8]
-                    split_axis = aabb[9]
-
-                    if face_idx == -1:
-                        off_child1 = self.aabb_offsets[node_idx][child_idx1]
-                        off_child2 = self.aabb_offsets[node_idx][child_idx2]
-                    else:
-                        off_child1 = 0
-                        off_child2 = 0
-
-                    switch = {
-                        -3: AABB_NEGATIVE_Z,
-                        -2: AABB_NEGATIVE_Y,
-                        -1: AABB_NEGATIVE_X,
-                        0: AABB_NO_CHILDREN,
-                        1: AABB_POSITIVE_X,
-                        2: AABB_POSITIVE_Y,
-                        3: AABB_POSITIVE_Z,
-                    }
-                    most_significant_plane = switch[split_axis]
-
-                    # Bounding Box
-                    for val in aabb[:6]:
-                        self.mdl.write_float(val)
-
-                    self.mdl.write_uint32(off_child1)
-                    self.mdl.write_uint32(off_child2)
-                    self.mdl.write_int32(face_idx)
-                    self.mdl.write_uint32(most_significant_plane)
-
-            # Saber Data
-
-            if type_flags & NODE_SABER:
-                for vert_idx in saber_vert_indices:
-                    for val in node.verts[vert_idx]:
-                        self.mdl.write_float(val)
-                for vert_idx in saber_vert_indices:
-                    for val in node.uv1[vert_idx]:
-                        self.mdl.write_float(val)
-                for vert_idx in saber_vert_indices:
-                    for val in node.normals[vert_idx]:
-                        self.mdl.write_float(val)
-
-            # Children
-
-            for child_idx in child_indices:
-                self.mdl.write_uint32(self.node_offsets[child_idx])
+                # Vertex Indices
+                for face in node.facelist.vertices:
+                    for val in face:
+                        mdl.write_uint16(val)
+
+            # MDX data
+            if not type_flags & NODE_SABER:
+                mdx.write_array(
+                    self.mdx_vertex_data(
+                        node,
+                        type_flags,
+                        bonemap if type_flags & NODE_SKIN else None,
+                    )
+                )
 
-            # Controllers
+        # Skin Data
 
-            for key in self.controller_keys[node_idx]:
-                unk1 = 0xFFFF
+        if type_flags & NODE_SKIN:
+            # Bonemap
+            for bone_idx in bonemap:
+                if self.xbox:
+                    mdl.write_uint16(bone_idx if bone_idx != -1 else 0xFFFF)
+                else:
+                    mdl.write_float(float(bone_idx))
+
+            num_bones = len(bonemap)
+
+            # QBones, TBones
+            qbones = [None] * num_bones
+            tbones = [None] * num_bones
+            for i in range(num_bones):
+                bone_trans = self.nodes[i].from_root.inverted() @ node.from_root
+                tbones[i], qbones[i], _ = bone_trans.decompose()
+            for i in range(num_bones):
+                qbone = qbones[i]
+                mdl.write_float(qbone.w)
+                mdl.write_float(qbone.x)
+                mdl.write_float(qbone.y)
+                mdl.write_float(qbone.z)
+            for i in range(num_bones):
+                tbone = tbones[i]
+                mdl.write_float(tbone.x)
+                mdl.write_float(tbone.y)
+                mdl.write_float(tbone.z)
+
+            # Garbage
+            for _ in range(num_bones):
+                mdl.write_uint32(0)
+
+        # Dangly Data
+
+        if type_flags & NODE_DANGLY:
+            for val in node.constraints:
+                mdl.write_float(val)
+            for vert in node.verts:
+                for val in vert:
+                    mdl.write_float(val)
+
+        # AABB Data
+
+        if type_flags & NODE_AABB:
+            for aabb in self.aabbs[node_idx]:
+                child_idx1 = aabb[6]
+                child_idx2 = aabb[7]
+                face_idx = aabb[8]
+                split_axis = aabb[9]
+
+                if face_idx == -1:
+                    off_child1 = self.aabb_offsets[node_idx][child_idx1]
+                    off_child2 = self.aabb_offsets[node_idx][child_idx2]
+                else:
+                    off_child1 = 0
+                    off_child2 = 0
+
+                switch = {
+                    -3: AABB_NEGATIVE_Z,
+                    -2: AABB_NEGATIVE_Y,
+                    -1: AABB_NEGATIVE_X,
+                    0: AABB_NO_CHILDREN,
+                    1: AABB_POSITIVE_X,
+                    2: AABB_POSITIVE_Y,
+                    3: AABB_POSITIVE_Z,
+                }
+                most_significant_plane = switch[split_axis]
+
+                # Bounding Box
+                for val in aabb[:6]:
+                    mdl.write_float(val)
+
+                mdl.write_offset(off_child1)
+                mdl.write_offset(off_child2)
+                mdl.write_int32(face_idx)
+                mdl.write_uint32(most_significant_plane)
+
+        # Saber Data
+
+        if type_flags & NODE_SABER:
+            for vert_idx in saber_vert_indices:
+                for val in node.verts[vert_idx]:
+                    mdl.write_float(val)
+            for vert_idx in saber_vert_indices:
+                for val in node.uv1[vert_idx]:
+                    mdl.write_float(val)
+            for vert_idx in saber_vert_indices:
+                for val in node.normals[vert_idx]:
+                    mdl.write_float(val)
+
+        # Children
+
+        for child_idx in child_indices:
+            mdl.write_node_offset(self.node_offsets[child_idx], child_idx)
 
-                self.mdl.write_uint32(key.ctrl_type)
-                self.mdl.write_uint16(unk1)
-                self.mdl.write_uint16(key.num_rows)
-                self.mdl.write_uint16(key.timekeys_start)
-                self.mdl.write_uint16(key.values_start)
-                self.mdl.write_uint8(key.num_columns)
+        # Controllers
 
-                for _ in range(3):
-                    self.mdl.write_uint8(0)  # padding
+        mdl.write_array(
+            self.controller_key_array(self.controller_keys[node_idx], False)
+        )
 
-            # Controller Data
+        # Controller Data
+
+        mdl.write_array(self.controller_data[node_idx])
+
+        if self.node_cache is not None:
+            self.node_cache.put(
+                cache_key,
+                NodeCacheEntry(
+                    bytes(mdl.buffer),
+                    bytes(mdx.buffer),
+                    self.node_offsets[node_idx],
+                    self.mdx_offsets.get(node_idx, 0),
+                    mdl.offset_positions,
+                    mdl.mdx_offset_positions,
+                    mdl.node_references,
+                ),
+            )
 
-            for val in self.controller_data[node_idx]:
-                self.mdl.write_float(val)
+        return mdl.buffer, mdx.buffer
+
+    def get_node_cache_key(self, node_idx, num_meshes):
+        node = self.nodes[node_idx]
+        digest = hashlib.sha1()
+        update_hash(
+            digest,
+            (
+                self.tsl,
+                self.xbox,
+                self.compress_quaternions,
+                node_idx,
+                num_meshes,
+                self.parent_indices[node_idx],
+                self.child_indices[node_idx],
+            ),
+        )
+        update_hash(digest, node)
+        update_hash(digest, self.controller_keys[node_idx])
+        update_hash(digest, self.controller_data[node_idx])
+        if self.get_node_flags(node) & NODE_SKIN:
+            digest.update(self.skin_hash)
+        return digest.hexdigest()
+
+    def controller_key_array(self, keys, anim):
+        data = np.zeros(
+            len(keys),
+            [
+                ("ctrl_type", np.uint32),
+                ("unk1", np.uint16),
+                ("num_rows", np.uint16),
+                ("timekeys_start", np.uint16),
+                ("values_start", np.uint16),
+                ("num_columns", np.uint8),
+                ("padding", np.uint8, 3),
+            ],
+        )
+        ctrl_types = np.array([key.ctrl_type for key in keys], np.uint32)
+        data["ctrl_type"] = ctrl_types
+        if anim:
+            data["unk1"] = np.where(
+                np.isin(ctrl_types, [CTRL_BASE_POSITION, CTRL_BASE_ORIENTATION]),
+                ctrl_types + 8,
+                0xFFFF,
+            )
+        else:
+            data["unk1"] = 0xFFFF
+        data["num_rows"] = [key.num_rows for key in keys]
+        data["timekeys_start"] = [key.timekeys_start for key in keys]
+        data["values_start"] = [key.values_start for key in keys]
+        data["num_columns"] = [key.num_columns for key in keys]
+        return data
+
+    def controller_floats(self, values):
+        # Controller data is kept as raw 32-bit words, so that floats and
+        # compressed quaternions can share one array
+        return np.ascontiguousarray(values, np.float32).reshape(-1).view(np.uint32)
+
+    def concat_controller_data(self, chunks):
+        if not chunks:
+            return np.zeros(0, np.uint32)
+        return np.concatenate(chunks)
+
+    def compress_quaternions_array(self, quats):
+        xyz = np.where(quats[:, 3:4] < 0.0, -quats[:, :3], quats[:, :3])
+        ix = ((xyz[:, 0] + 1.0) * 1023.0).astype(np.int64)
+        iy = ((xyz[:, 1] + 1.0) * 1023.0).astype(np.int64)
+        iz = ((xyz[:, 2] + 1.0) * 511.0).astype(np.int64)
+        return (ix | (iy << 11) | (iz << 22)).astype(np.uint32)
 
     def get_node_flags(self, node):
         switch = {
@@ -1685,34 +1646,22 @@ class MdlWriter:
 
         return (fn_ptr1, fn_ptr2)
 
-    def calculate_face_area(self, edge1, edge2, edge3):
-        a = edge1.length
-        b = edge2.length
-        c = edge3.length
-        s = (a + b + c) / 2.0
-        if a <= 0.0 or b <= 0.0 or c <= 0.0:
-            return -1.0
-        if a > b + c or b > a + c or c > a + b:
-            return -1.0
-        area2 = s * (s - a) * (s - b) * (s - c)
-        return math.sqrt(area2)
-
     def generate_aabb_tree(self, node):
-        face_list = []
-        face_idx = 0
+        if node.aabb_tree and node.aabb_tree_hash == compute_faces_hash(
+            node.verts, node.facelist.vertices
+        ):
+            return node.aabb_tree
 
-        for face in node.facelist.vertices:
-            v0 = Vector(node.verts[face[0]])
-            v1 = Vector(node.verts[face[1]])
-            v2 = Vector(node.verts[face[2]])
-            centroid = (v0 + v1 + v2) / 3
-            face_list.append((face_idx, [v0, v1, v2], centroid))
-            face_idx += 1
+        return generate_tree(node.verts, node.facelist.vertices)
 
-        aabbs = []
-        generate_tree(aabbs, face_list)
+    def get_face_adjacency(self, node):
+        stored = node.facelist.adjacent_faces
+        if len(stored) > 0 and node.face_adjacency_hash == compute_faces_hash(
+            node.verts, node.facelist.vertices
+        ):
+            return stored
 
-        return aabbs
+        return compute_face_adjacency(node.facelist.vertices)
 
     def get_inverted_counter(self, count):
         quo = count // 100
@@ -1726,24 +1675,90 @@ class MdlWriter:
         self.mdl.write_uint32(count)
         self.mdl.write_uint32(count)
 
-    def compress_vector_xbox(self, vec):
-        x, y, z = vec
-        if abs(x) > 1.0 or abs(y) > 1.0 or abs(z) > 1.0:
-            return 0
-
-        tmp = round(511.0 * z)
-        if z < 0.0:
-            tmp = 1023 + tmp
-        comp = tmp
+    def mdx_vertex_data(self, node, type_flags, bonemap):
+        num_verts = len(node.verts)
 
-        tmp = round(1023.0 * y)
-        if y < 0.0:
-            tmp = 2047 + tmp
-        comp = (comp << 11) | tmp
+        fields = [("verts", np.float32, 3)]
+        if self.xbox:
+            fields.append(("normals", np.uint32))
+        else:
+            fields.append(("normals", np.float32, 3))
+        if node.uv1:
+            fields.append(("uv1", np.float32, 2))
+        if node.uv2:
+            fields.append(("uv2", np.float32, 2))
+        if node.tangentspace:
+            if self.xbox:
+                fields.append(("tangentspace", np.uint32, 3))
+            else:
+                fields.append(("tangentspace", np.float32, (3, 3)))
+        if type_flags & NODE_SKIN:
+            fields.append(("bone_weights", np.float32, 4))
+            if self.xbox:
+                fields.append(("bone_indices", np.uint16, 4))
+            else:
+                fields.append(("bone_indices", np.float32, 4))
 
-        tmp = round(1023.0 * x)
-        if x < 0.0:
-            tmp = 2047 + tmp
-        comp = (comp << 11) | tmp
+        # Vertex rows are followed by an extra row of padding data
+        data = np.zeros(num_verts + 1, fields)
+        vert_data = data[:num_verts]
+        data["verts"][num_verts] = 1e7
 
-        return comp
+        vert_data["verts"] = np.reshape(node.verts, (num_verts, 3))
+        normals = np.reshape(node.normals, (num_verts, 3))
+        if self.xbox:
+            vert_data["normals"] = self.compress_vectors_xbox(normals)
+        else:
+            vert_data["normals"] = normals
+        if node.uv1:
+            vert_data["uv1"] = np.reshape(node.uv1, (num_verts, 2))
+        if node.uv2:
+            vert_data["uv2"] = np.reshape(node.uv2, (num_verts, 2))
+        if node.tangentspace:
+            tangentspace = np.stack(
+                (
+                    np.reshape(node.bitangents, (num_verts, 3)),
+                    np.reshape(node.tangents, (num_verts, 3)),
+                    np.reshape(node.tangentspacenormals, (num_verts, 3)),
+                ),
+                axis=1,
+            )
+            if self.xbox:
+                vert_data["tangentspace"] = self.compress_vectors_xbox(
+                    tangentspace.reshape(-1, 3)
+                ).reshape(num_verts, 3)
+            else:
+                vert_data["tangentspace"] = tangentspace
+        if type_flags & NODE_SKIN:
+            bone_indices = np.reshape(node.bone_indices, (num_verts, 4))
+            bone_weights = np.reshape(node.bone_weights, (num_verts, 4))
+
+            # Unused slots go last, their index -1 selects the last lookup entry
+            bone_lookup = np.full(len(node.bone_names) + 1, 0xFFFF if self.xbox else -1)
+            for bone_idx in np.unique(bone_indices[bone_indices != -1]).tolist():
+                bone_name = node.bone_names[bone_idx]
+                bone_lookup[bone_idx] = bonemap[self.node_idx_by_name[bone_name]]
+            slots = np.argsort(bone_indices == -1, axis=1, kind="stable")
+            bone_indices = np.take_along_axis(bone_indices, slots, axis=1)
+            bone_weights = np.take_along_axis(bone_weights, slots, axis=1)
+            vert_data["bone_weights"] = np.where(bone_indices != -1, bone_weights, 0.0)
+            vert_data["bone_indices"] = bone_lookup[bone_indices]
+            data["bone_weights"][num_verts, 0] = 1.0
+
+        return data
+
+    def compress_vectors_xbox(self, vecs):
+        vecs = np.asarray(vecs, np.float64)
+        x, y, z = vecs[:, 0], vecs[:, 1], vecs[:, 2]
+
+        comp_z = np.round(511.0 * z).astype(np.int64)
+        comp_z = np.where(z < 0.0, 1023 + comp_z, comp_z)
+        comp_y = np.round(1023.0 * y).astype(np.int64)
+        comp_y = np.where(y < 0.0, 2047 + comp_y, comp_y)
+        comp_x = np.round(1023.0 * x).astype(np.int64)
+        comp_x = np.where(x < 0.0, 2047 + comp_x, comp_x)
+        comp = (comp_z << 22) | (comp_y << 11) | comp_x
+
+        comp[np.any(np.abs(vecs) > 1.0, axis=1)] = 0
+
+        return comp.astype(np.uint32)
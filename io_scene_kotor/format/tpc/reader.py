@@ -17,7 +17,8 @@
 # ##### END GPL LICENSE BLOCK #####
 
 from enum import Enum
-from struct import unpack
+
+import numpy as np
 
 from ..binreader import BinaryReader, SeekOrigin
 
@@ -115,33 +116,25 @@ class TpcReader:
         raise RuntimeError("Unable to calculate size of pixel buffer")
 
     def merge_cubemap(self, w, h, sides):
-        pixels = []
-        for side in sides:
-            pixels.extend(side.pixels)
+        pixels = np.concatenate(
+            [np.frombuffer(side.pixels, dtype=np.uint8) for side in sides]
+        )
         return TpcMip(w, h, pixels)
 
     def mip_to_image(self, mip):
+        pixels = np.frombuffer(mip.pixels, dtype=np.uint8)
+        num_pixels = mip.w * mip.h
         if self.encoding == TpcEncoding.GRAYSCALE:
-            pixels = []
-            for i in range(0, mip.w * mip.h):
-                val = mip.pixels[i]
-                pixels.append(val / 255)
-                pixels.append(val / 255)
-                pixels.append(val / 255)
-                pixels.append(1.0)
+            rgba = np.ones((num_pixels, 4))
+            rgba[:, :3] = pixels[:num_pixels, np.newaxis] / 255
         elif self.encoding == TpcEncoding.RGB:
-            pixels = []
-            for i in range(0, mip.w * mip.h):
-                r, g, b = mip.pixels[(3 * i) : (3 * i + 3)]
-                pixels.append(r / 255)
-                pixels.append(g / 255)
-                pixels.append(b / 255)
-                pixels.append(1.0)
+            rgba = np.ones((num_pixels, 4))
+            rgba[:, :3] = pixels[: 3 * num_pixels].reshape(-1, 3) / 255
         elif self.encoding == TpcEncoding.RGBA:
-            pixels = [val / 255 for val in mip.pixels]
+            rgba = pixels / 255
         else:
             raise RuntimeError("Unable to convert mip to image")
-        return TpcImage(mip.w, mip.h, pixels)
+        return TpcImage(mip.w, mip.h, rgba.ravel().tolist())
 
     def decompress_mip_if_compressed(self, mip):
         if not self.compressed:
@@ -152,107 +145,83 @@ class TpcReader:
         raise RuntimeError("Unable to decompress mip")
 
     def decompress_mip_dxt15(self, mip, has_alpha):
+        # All blocks of the mip are decoded at once, into arrays indexed by
+        # block row, block column and pixel within block
         num_blocks_x = (mip.w + 3) // 4
         num_blocks_y = (mip.h + 3) // 4
-        pixels_idx = 0
-        out_pixels_size = mip.w * mip.h * (4 if has_alpha else 3)
-        out_pixels = [None] * out_pixels_size
-        for block_y in range(0, num_blocks_y):
-            for block_x in range(0, num_blocks_x):
-                self.decompress_dxt15_block(
-                    mip.w,
-                    mip.pixels,
-                    pixels_idx + (16 if has_alpha else 8) * block_x,
-                    has_alpha,
-                    4 * block_x,
-                    4 * block_y,
-                    out_pixels,
-                )
-            pixels_idx += (16 if has_alpha else 8) * num_blocks_x
-        return out_pixels
+        block_size = 16 if has_alpha else 8
+        blocks = np.frombuffer(
+            mip.pixels, np.uint8, num_blocks_x * num_blocks_y * block_size
+        ).reshape(num_blocks_y, num_blocks_x, block_size)
 
-    def decompress_dxt15_block(
-        self, mip_w, pixels, pixels_idx, has_alpha, pixel_x, pixel_y, out_pixels
-    ):
+        color_block = blocks[:, :, 8:] if has_alpha else blocks
+        rgb = self.decompress_dxt_colors(color_block, has_alpha)
         if has_alpha:
-            alphas = pixels[pixels_idx : pixels_idx + 2]
-            alpha_codes = unpack("<Q", pixels[pixels_idx + 2 : pixels_idx + 10])[0]
-            colors = unpack("<HH", pixels[pixels_idx + 8 : pixels_idx + 12])
-            color_codes = unpack("<L", pixels[pixels_idx + 12 : pixels_idx + 16])[0]
+            alpha = self.decompress_dxt5_alphas(blocks)
+            pixels = np.concatenate([rgb, alpha[..., np.newaxis]], axis=3)
         else:
-            colors = unpack("<HH", pixels[pixels_idx : pixels_idx + 4])
-            color_codes = unpack("<L", pixels[pixels_idx + 4 : pixels_idx + 8])[0]
-        r = []
-        g = []
-        b = []
-        for i in range(0, 2):
-            tmp = (colors[i] >> 11) * 255 + 16
-            r.append((tmp // 32 + tmp) // 32)
-            tmp = ((colors[i] & 0x07E0) >> 5) * 255 + 32
-            g.append((tmp // 64 + tmp) // 64)
-            tmp = (colors[i] & 0x001F) * 255 + 16
-            b.append((tmp // 32 + tmp) // 32)
-        for block_pixel_y in range(0, 4):
-            for block_pixel_x in range(0, 4):
-                if has_alpha:
-                    alpha_code_idx = 3 * (4 * block_pixel_y + block_pixel_x)
-                    alpha_code = (alpha_codes >> alpha_code_idx) & 0x07
-                    if alpha_code == 0:
-                        alpha = alphas[0]
-                    elif alpha_code == 1:
-                        alpha = alphas[1]
-                    elif alphas[0] > alphas[1]:
-                        alpha = (
-                            (8 - alpha_code) * alphas[0] + (alpha_code - 1) * alphas[1]
-                        ) // 7
-                    elif alpha_code == 6:
-                        alpha = 0
-                    elif alpha_code == 7:
-                        alpha = 255
-                    else:
-                        alpha = (
-                            (6 - alpha_code) * alphas[0] + (alpha_code - 1) * alphas[1]
-                        ) // 5
-                else:
-                    alpha = 255
-                color_code_idx = 2 * (4 * block_pixel_y + block_pixel_x)
-                color_code = (color_codes >> color_code_idx) & 0x03
-                if has_alpha or colors[0] > colors[1]:
-                    if color_code == 0:
-                        rgb = (r[0], g[0], b[0])
-                    elif color_code == 1:
-                        rgb = (r[1], g[1], b[1])
-                    elif color_code == 2:
-                        rgb = (
-                            (2 * r[0] + r[1]) // 3,
-                            (2 * g[0] + g[1]) // 3,
-                            (2 * b[0] + b[1]) // 3,
-                        )
-                    elif color_code == 3:
-                        rgb = (
-                            (r[0] + 2 * r[1]) // 3,
-                            (g[0] + 2 * g[1]) // 3,
-                            (b[0] + 2 * b[1]) // 3,
-                        )
-                else:
-                    if color_code == 0:
-                        rgb = (r[0], g[0], b[0])
-                    elif color_code == 1:
-                        rgb = (r[1], g[1], b[1])
-                    elif color_code == 2:
-                        rgb = (
-                            (r[0] + r[1]) // 2,
-                            (g[0] + g[1]) // 2,
-                            (b[0] + b[1]) // 2,
-                        )
-                    elif color_code == 3:
-                        rgb = (0, 0, 0)
-                if pixel_x + block_pixel_x < mip_w:
-                    out_pixels_idx = (pixel_y + block_pixel_y) * mip_w
-                    out_pixels_idx += pixel_x + block_pixel_x
-                    out_pixels_idx *= 4 if has_alpha else 3
-                    out_pixels[out_pixels_idx + 0] = rgb[0]
-                    out_pixels[out_pixels_idx + 1] = rgb[1]
-                    out_pixels[out_pixels_idx + 2] = rgb[2]
-                    if has_alpha:
-                        out_pixels[out_pixels_idx + 3] = alpha
+            pixels = rgb
+
+        # Blocks to rows of pixels, cropping blocks past the edges of the mip
+        num_channels = pixels.shape[3]
+        pixels = pixels.reshape(num_blocks_y, num_blocks_x, 4, 4, num_channels)
+        pixels = pixels.transpose(0, 2, 1, 3, 4)
+        pixels = pixels.reshape(4 * num_blocks_y, 4 * num_blocks_x, num_channels)
+        return pixels[: mip.h, : mip.w].ravel()
+
+    def decompress_dxt_colors(self, blocks, has_alpha):
+        colors = blocks[:, :, 0:4].astype(np.uint32)
+        colors = colors[:, :, 0::2] | (colors[:, :, 1::2] << 8)
+        r = (colors >> 11) * 255 + 16
+        r = (r // 32 + r) // 32
+        g = ((colors & 0x07E0) >> 5) * 255 + 32
+        g = (g // 64 + g) // 64
+        b = (colors & 0x001F) * 255 + 16
+        b = (b // 32 + b) // 32
+        endpoints = np.stack([r, g, b], axis=3)
+        c0 = endpoints[:, :, 0]
+        c1 = endpoints[:, :, 1]
+
+        # Blocks without alpha, where the first color is not greater than the
+        # second, have three colors and black
+        four_colors = has_alpha | (colors[:, :, 0] > colors[:, :, 1])
+        four_colors = four_colors[:, :, np.newaxis]
+        palette = np.stack(
+            [
+                c0,
+                c1,
+                np.where(four_colors, (2 * c0 + c1) // 3, (c0 + c1) // 2),
+                np.where(four_colors, (c0 + 2 * c1) // 3, 0),
+            ],
+            axis=2,
+        )
+
+        codes = blocks[:, :, 4:8].astype(np.uint32)
+        codes = codes[:, :, 0] | (codes[:, :, 1] << 8)
+        codes = codes | (blocks[:, :, 6].astype(np.uint32) << 16)
+        codes = codes | (blocks[:, :, 7].astype(np.uint32) << 24)
+        indices = (codes[:, :, np.newaxis] >> (2 * np.arange(16, dtype=np.uint32))) & 3
+        rgb = np.take_along_axis(palette, indices[..., np.newaxis].astype(np.intp), 2)
+        return rgb.astype(np.uint8)
+
+    def decompress_dxt5_alphas(self, blocks):
+        a0 = blocks[:, :, 0].astype(np.int32)[..., np.newaxis]
+        a1 = blocks[:, :, 1].astype(np.int32)[..., np.newaxis]
+
+        # Eight interpolated alphas, or six and fully transparent and opaque
+        code = np.arange(8, dtype=np.int32)
+        eight_alphas = ((8 - code) * a0 + (code - 1) * a1) // 7
+        six_alphas = ((6 - code) * a0 + (code - 1) * a1) // 5
+        six_alphas[:, :, 6] = 0
+        six_alphas[:, :, 7] = 255
+        palette = np.where(a0 > a1, eight_alphas, six_alphas)
+        palette[:, :, 0] = a0[:, :, 0]
+        palette[:, :, 1] = a1[:, :, 0]
+
+        codes = np.zeros(blocks.shape[:2], dtype=np.uint64)
+        for i in range(6):
+            codes |= blocks[:, :, 2 + i].astype(np.uint64) << np.uint64(8 * i)
+        shifts = 3 * np.arange(16, dtype=np.uint64)
+        indices = (codes[:, :, np.newaxis] >> shifts) & np.uint64(7)
+        alpha = np.take_along_axis(palette, indices.astype(np.intp), 2)
+        return alpha.astype(np.uint8)
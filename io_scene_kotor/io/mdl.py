@@ -23,6 +23,7 @@ import bpy
 from ..constants import ANIM_FPS
 from ..format.bwm.reader import BwmReader
 from ..format.bwm.writer import BwmWriter
+from ..format.mdl.nodecache import NodeCache
 from ..format.mdl.reader import MdlReader
 from ..format.mdl.writer import MdlWriter
 from ..scene.modelnode.aabb import AabbNode
@@ -30,11 +31,21 @@ from ..scene.model import Model
 from ..scene.walkmesh import Walkmesh
 from ..utils import is_mdl_root, is_pwk_root, is_dwk_root, find_objects
 
+# Serialized nodes of previously exported models, kept for the session
+node_cache = NodeCache()
+
 
 def load_mdl(operator, filepath, options, position=(0.0, 0.0, 0.0)):
     operator.report({"INFO"}, "Loading model from '{}'".format(filepath))
-    mdl = MdlReader(filepath)
-    model = mdl.load()
+    # Stored AABB trees are only reused when exporting imported walkmeshes
+    load_aabb_trees = options.import_geometry and options.import_walkmeshes
+    mdl = MdlReader(filepath, load_aabb_trees)
+    try:
+        model = mdl.load()
+        if options.import_animations:
+            mdl.load_animation_nodes()
+    finally:
+        mdl.close()
 
     pwk_walkmesh = None
     dwk_walkmesh1 = None
@@ -123,6 +134,7 @@ def save_mdl(operator, filepath, options):
         options.export_for_tsl,
         options.export_for_xbox,
         options.compress_quaternions,
+        node_cache if options.cache_nodes else None,
     )
     mdl.save()
 
@@ -0,0 +1,191 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import numpy as np
+
+# Vectors are stored in single precision, but dot products and lengths are
+# accumulated in double precision, last component first, to produce the same
+# values as mathutils.
+
+
+class MeshStatistics:
+    def __init__(self, bounding_box, average, face_areas, total_area, radius):
+        self.bounding_box = bounding_box
+        self.average = average
+        self.face_areas = face_areas
+        self.total_area = total_area
+        self.radius = radius
+
+
+def dot(a, b):
+    products = (a * b).astype(np.float64)
+    return (products[..., 2] + products[..., 1]) + products[..., 0]
+
+
+def length(vec):
+    return np.sqrt(dot(vec, vec))
+
+
+def face_vertices(verts, faces):
+    verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    return verts[faces]
+
+
+def compute_face_areas(corners):
+    # Heron's formula, degenerate faces have an area of -1
+    a = length(corners[:, 1] - corners[:, 0])
+    b = length(corners[:, 2] - corners[:, 0])
+    c = length(corners[:, 2] - corners[:, 1])
+    s = (a + b + c) / 2.0
+    area2 = s * (s - a) * (s - b) * (s - c)
+    degenerate = (a <= 0.0) | (b <= 0.0) | (c <= 0.0)
+    degenerate |= (a > b + c) | (b > a + c) | (c > a + b)
+    return np.where(degenerate, -1.0, np.sqrt(np.maximum(area2, 0.0)))
+
+
+def compute_mesh_statistics(verts, faces):
+    corners = face_vertices(verts, faces)
+    points = corners.reshape(-1, 3)
+
+    # Bounding box always includes the origin
+    bb_min = np.minimum(points.min(axis=0, initial=0.0), 0.0)
+    bb_max = np.maximum(points.max(axis=0, initial=0.0), 0.0)
+
+    # Sum sequentially, as rounding depends on the order of additions, and
+    # divide by multiplying with the reciprocal
+    average = np.cumsum(points, axis=0, dtype=np.float32)[-1]
+    average *= np.float32(1.0) / np.float32(len(points))
+
+    face_areas = compute_face_areas(corners)
+    total_area = np.cumsum(face_areas[face_areas != 1.0])
+    total_area = total_area[-1] if len(total_area) > 0 else 0.0
+
+    radius = length(points - average).max(initial=0.0)
+
+    return MeshStatistics(
+        [*bb_min.tolist(), *bb_max.tolist()],
+        average.tolist(),
+        face_areas,
+        float(total_area),
+        float(radius),
+    )
+
+
+def compute_plane_distances(verts, faces, normals):
+    corners = face_vertices(verts, faces)
+    normals = np.asarray(normals, dtype=np.float32).reshape(-1, 3)
+    return -1.0 * dot(normals, corners[:, 0])
+
+
+def weld_vertices(coords, tolerance=None):
+    # Rows are welded when they quantize to the same integers, or, given a
+    # tolerance, when they are connected by a chain of rows closer than the
+    # tolerance to each other. Welded rows are numbered in order of first
+    # occurrence, and represented by the first of them. Returns unique rows,
+    # indices of unique rows into coords and the remap from coords to unique
+    # rows.
+    coords = np.asarray(coords, dtype=np.float64)
+    if coords.ndim != 2:
+        coords = coords.reshape(-1, 3)
+    if tolerance:
+        first_indices = weld_within_distance(coords, tolerance)
+    else:
+        first_indices = weld_quantized(coords)
+    indices, remap = np.unique(first_indices, return_inverse=True)
+    return coords[indices], indices, remap.reshape(-1)
+
+
+def weld_quantized(rows):
+    keys = (rows * 10000.0).astype(np.int64)
+    order = np.lexsort(keys.T[::-1])
+    sorted_keys = keys[order]
+    starts = np.ones(len(rows), dtype=bool)
+    starts[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+
+    # Sorting is stable, so every run of equal keys starts with its lowest row
+    first_indices = np.empty(len(rows), dtype=np.int64)
+    first_indices[order] = order[starts][np.cumsum(starts) - 1]
+    return first_indices
+
+
+def weld_within_distance(rows, tolerance):
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Bucket rows into a grid of cells at least as large as the tolerance, so
+    # that rows closer than the tolerance are in the same or in neighbouring
+    # cells. Only the first three columns are bucketed, as those bound the
+    # distance too. Cells are limited in number, to be identified by a single
+    # integer.
+    points = rows[:, :3]
+    bb_min = points.min(axis=0)
+    cell_size = max(tolerance, (points.max(axis=0) - bb_min).max() / 2**20)
+    cells = np.floor((points - bb_min) / cell_size).astype(np.int64) + 1
+    strides = (2**20 + 3) ** np.arange(cells.shape[1])[::-1]
+    cell_keys = cells @ strides
+    unique_keys, cell_of_row = np.unique(cell_keys, return_inverse=True)
+    cell_of_row = cell_of_row.reshape(-1)
+    rows_by_cell = np.argsort(cell_of_row, kind="stable")
+    cell_counts = np.bincount(cell_of_row)
+    cell_starts = np.cumsum(cell_counts) - cell_counts
+
+    # Collect pairs of rows within the tolerance
+    dim = cells.shape[1]
+    offsets = np.stack(
+        np.meshgrid(*([[-1, 0, 1]] * dim), indexing="ij"), axis=-1
+    ).reshape(-1, dim)
+    first = []
+    second = []
+    for offset in offsets:
+        neighbour_keys = unique_keys + offset @ strides
+        found = np.searchsorted(unique_keys, neighbour_keys)
+        found = np.minimum(found, len(unique_keys) - 1)
+        valid = unique_keys[found] == neighbour_keys
+        cell_pairs = np.flatnonzero(valid)
+        neighbours = found[valid]
+
+        # Expand every pair of cells into pairs of their rows
+        counts = cell_counts[cell_pairs] * cell_counts[neighbours]
+        pair_cells = np.repeat(np.arange(len(cell_pairs)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        num_neighbour_rows = cell_counts[neighbours][pair_cells]
+        pair_first = rows_by_cell[
+            cell_starts[cell_pairs][pair_cells] + local // num_neighbour_rows
+        ]
+        pair_second = rows_by_cell[
+            cell_starts[neighbours][pair_cells] + local % num_neighbour_rows
+        ]
+        distances = np.square(rows[pair_first] - rows[pair_second]).sum(axis=1)
+        close = (pair_first < pair_second) & (distances <= tolerance * tolerance)
+        first.append(pair_first[close])
+        second.append(pair_second[close])
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+
+    # Label every row with the lowest row it is connected to
+    labels = np.arange(len(rows))
+    while True:
+        lowest = np.minimum(labels[first], labels[second])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, first, lowest)
+        np.minimum.at(new_labels, second, lowest)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
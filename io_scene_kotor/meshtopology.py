@@ -0,0 +1,98 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+def face_edges(face):
+    return [
+        tuple(sorted(edge))
+        for edge in [(face[0], face[1]), (face[1], face[2]), (face[2], face[0])]
+    ]
+
+
+def compute_edge_adjacency(faces):
+    # For every edge of every face, find the first face after it sharing that
+    # edge, unless the edge was already linked by an earlier face. Non-manifold
+    # edges are linked to the first matching face and edge only. Edges are
+    # identified as 3 * face index + edge index.
+    edges_by_face = [face_edges(face) for face in faces]
+    edge_faces = dict()  # edge to list of (face index, edge index) in face order
+    positions = []
+    for face_idx, edges in enumerate(edges_by_face):
+        face_positions = []
+        for edge_idx, edge in enumerate(edges):
+            if edge not in edge_faces:
+                edge_faces[edge] = []
+            face_positions.append(len(edge_faces[edge]))
+            edge_faces[edge].append((face_idx, edge_idx))
+        positions.append(face_positions)
+
+    adjacencies = [[-1, -1, -1] for _ in range(len(faces))]
+    for face_idx, edges in enumerate(edges_by_face):
+        for edge_idx, edge in enumerate(edges):
+            if adjacencies[face_idx][edge_idx] != -1:
+                continue
+            occurrences = edge_faces[edge]
+            for pos in range(positions[face_idx][edge_idx] + 1, len(occurrences)):
+                other_face_idx, other_edge_idx = occurrences[pos]
+                if other_face_idx != face_idx:
+                    adjacencies[face_idx][edge_idx] = (
+                        3 * other_face_idx + other_edge_idx
+                    )
+                    adjacencies[other_face_idx][other_edge_idx] = (
+                        3 * face_idx + edge_idx
+                    )
+                    break
+    return adjacencies
+
+
+def compute_face_adjacency(faces):
+    return [
+        [adj_edge_idx // 3 if adj_edge_idx != -1 else -1 for adj_edge_idx in edges]
+        for edges in compute_edge_adjacency(faces)
+    ]
+
+
+def compute_perimeters(adjacencies):
+    # Walk from every outer edge to the next one along the boundary, rotating
+    # around the shared vertex through adjacent edges
+    next_outer_edges = dict()
+    for face_idx, edges in enumerate(adjacencies):
+        for edge_idx, adj_edge_idx in enumerate(edges):
+            if adj_edge_idx != -1:
+                continue
+            next_face = face_idx
+            next_edge = (edge_idx + 1) % 3
+            adj_edge_idx = adjacencies[next_face][next_edge]
+            while adj_edge_idx != -1:
+                next_face = adj_edge_idx // 3
+                next_edge = ((adj_edge_idx % 3) + 1) % 3
+                adj_edge_idx = adjacencies[next_face][next_edge]
+            next_outer_edges[3 * face_idx + edge_idx] = 3 * next_face + next_edge
+
+    outer_edges = []
+    perimeters = []  # index one past the last outer edge of every perimeter
+    visited_edges = set()
+    for edge_idx in next_outer_edges:
+        if edge_idx in visited_edges:
+            continue
+        while edge_idx not in visited_edges:
+            outer_edges.append(edge_idx)
+            visited_edges.add(edge_idx)
+            edge_idx = next_outer_edges[edge_idx]
+        perimeters.append(len(outer_edges))
+    return outer_edges, perimeters
@@ -54,6 +54,12 @@ class KB_OT_export_mdl(bpy.types.Operator, ExportHelper):
         name="Compress Quaternions", default=False
     )
 
+    cache_nodes: bpy.props.BoolProperty(
+        name="Cache Nodes",
+        description="Reuse serialized data of nodes unchanged since previous export",
+        default=False,
+    )
+
     def execute(self, context):
         options = ExportOptions()
         options.export_for_tsl = self.export_for_tsl
@@ -61,6 +67,7 @@ class KB_OT_export_mdl(bpy.types.Operator, ExportHelper):
         options.export_animations = self.export_animations
         options.export_walkmeshes = self.export_walkmeshes
         options.compress_quaternions = self.compress_quaternions
+        options.cache_nodes = self.cache_nodes
 
         try:
             mdl.save_mdl(self, self.filepath, options)
@@ -172,7 +172,9 @@ class Model:
                 obj_stack.append(child)
 
     @classmethod
-    def model_node_from_object(cls, obj, options, parent=None, exclude_xwk=True):
+    def model_node_from_object(
+        cls, obj, options, parent=None, exclude_xwk=True, depsgraph=None
+    ):
         if exclude_xwk and (is_pwk_root(obj) or is_dwk_root(obj)):
             return None
 
@@ -216,7 +218,8 @@ class Model:
         node = switch[node_type](name)
         node.parent = parent
 
-        depsgraph = bpy.context.evaluated_depsgraph_get()
+        if not depsgraph:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
         eval_obj = obj.evaluated_get(depsgraph)
         node.load_object_data(obj, eval_obj, options)
 
@@ -227,7 +230,9 @@ class Model:
             node.from_root = Matrix()
 
         for child_obj in sorted(obj.children, key=lambda o: o.kb.export_order):
-            child = cls.model_node_from_object(child_obj, options, node, exclude_xwk)
+            child = cls.model_node_from_object(
+                child_obj, options, node, exclude_xwk, depsgraph
+            )
             if child:
                 node.children.append(child)
 
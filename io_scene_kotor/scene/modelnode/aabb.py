@@ -25,6 +25,8 @@ from ..material import rebuild_walkmesh_materials
 from .trimesh import TrimeshNode
 
 ROOM_LINKS_COLORS = "RoomLinks"
+AABB_TREE = "kb_aabb_tree"
+AABB_TREE_HASH = "kb_aabb_tree_hash"
 
 
 class AabbNode(TrimeshNode):
@@ -35,6 +37,8 @@ class AabbNode(TrimeshNode):
 
         self.lytposition = (0.0, 0.0, 0.0)
         self.roomlinks = dict()
+        self.aabb_tree = []  # stored AABB tree, as produced by aabb.generate_tree
+        self.aabb_tree_hash = None  # hash of faces the stored tree was built for
 
     def compute_lyt_position(self, wok_geom):
         wok_position = Vector(wok_geom.position)
@@ -105,9 +109,21 @@ class AabbNode(TrimeshNode):
 
         obj.kb.lytposition = self.lytposition
 
+        if self.aabb_tree:
+            obj[AABB_TREE] = [float(val) for aabb in self.aabb_tree for val in aabb]
+            obj[AABB_TREE_HASH] = self.aabb_tree_hash
+
     def load_object_data(self, obj, eval_obj, options):
         TrimeshNode.load_object_data(self, obj, eval_obj, options)
 
-        self.lytposition = obj.kb.lytposition
+        self.lytposition = tuple(obj.kb.lytposition)
+
+        if AABB_TREE in obj and AABB_TREE_HASH in obj:
+            values = list(obj[AABB_TREE])
+            self.aabb_tree = [
+                values[i : i + 6] + [int(val) for val in values[i + 6 : i + 10]]
+                for i in range(0, len(values), 10)
+            ]
+            self.aabb_tree_hash = obj[AABB_TREE_HASH]
 
         self.unapply_room_links(eval_obj)
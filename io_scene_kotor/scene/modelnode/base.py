@@ -58,15 +58,15 @@ class BaseNode:
             raise RuntimeError("Object '{}' node number is undefined".format(obj.name))
         self.node_number = obj.kb.node_number
         self.export_order = obj.kb.export_order
-        self.position = eval_obj.location
+        self.position = eval_obj.location.copy()
         if eval_obj.rotation_mode != "QUATERNION":
             raise RuntimeError(
                 "Object '{}' must have Quaternion rotation mode".format(eval_obj.name)
             )
-        self.orientation = eval_obj.rotation_quaternion
+        self.orientation = eval_obj.rotation_quaternion.copy()
         self.scale = eval_obj.scale[0]
 
-        self.from_root = eval_obj.matrix_local
+        self.from_root = eval_obj.matrix_local.copy()
         if self.parent:
             self.from_root = self.parent.from_root @ self.from_root
 
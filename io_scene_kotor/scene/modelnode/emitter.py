@@ -298,6 +298,8 @@ class EmitterNode(BaseNode):
                     value = "PunchThrough"
                 elif value not in ["Lighten", "Normal"]:
                     continue
+            elif attrname in ["colorstart", "colormid", "colorend"]:
+                value = tuple(value)
             elif attrname == "p2p_sel":
                 self.p2p_sel = obj.kb.p2p_type == "Bezier"
                 continue
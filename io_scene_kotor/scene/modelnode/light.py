@@ -114,7 +114,7 @@ class LightNode(BaseNode):
                 self.flare_list.textures.append(item.texture)
                 self.flare_list.sizes.append(item.size)
                 self.flare_list.positions.append(item.position)
-                self.flare_list.colorshifts.append(item.colorshift)
+                self.flare_list.colorshifts.append(tuple(item.colorshift))
 
     @classmethod
     def calc_light_power(cls, light):
@@ -16,6 +16,8 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+import numpy as np
+
 from ...constants import MeshType, NodeType
 from .trimesh import TrimeshNode
 
@@ -31,15 +33,41 @@ class SkinmeshNode(TrimeshNode):
         self.apply_bone_weights(mesh, obj)
 
     def apply_bone_weights(self, mesh, obj):
-        groups = dict()
-        for vert_idx, vert_weights in enumerate(mesh.weights):
-            for bone_name, weight in vert_weights:
-                if bone_name in groups:
-                    groups[bone_name].add([vert_idx], weight, "REPLACE")
-                else:
-                    group = obj.vertex_groups.new(name=bone_name)
-                    group.add([vert_idx], weight, "REPLACE")
-                    groups[bone_name] = group
+        bone_indices = np.asarray(mesh.bone_indices).reshape(-1, 4)
+        bone_weights = np.asarray(mesh.bone_weights).reshape(-1, 4)
+
+        # When a vertex references a bone more than once, its last weight wins
+        vert_indices = np.repeat(np.arange(len(bone_indices)), 4)[::-1]
+        bone_indices = bone_indices.ravel()[::-1]
+        bone_weights = bone_weights.ravel()[::-1]
+        used = bone_indices != -1
+        vert_indices = vert_indices[used]
+        bone_indices = bone_indices[used]
+        bone_weights = bone_weights[used]
+        _, unique = np.unique(
+            vert_indices * len(mesh.bone_names) + bone_indices, return_index=True
+        )
+        vert_indices = vert_indices[unique]
+        bone_indices = bone_indices[unique]
+        bone_weights = bone_weights[unique]
+
+        # Sort by bone, then by weight, so that vertices sharing a bone and a
+        # weight form runs that are added to a group at once
+        order = np.lexsort((bone_weights, bone_indices))
+        vert_indices = vert_indices[order]
+        bone_indices = bone_indices[order]
+        bone_weights = bone_weights[order]
+        bones, bone_starts = np.unique(bone_indices, return_index=True)
+        verts_by_bone = np.split(vert_indices, bone_starts[1:])
+        weights_by_bone = np.split(bone_weights, bone_starts[1:])
+        for bone_idx, group_verts, group_weights in zip(
+            bones.tolist(), verts_by_bone, weights_by_bone
+        ):
+            group = obj.vertex_groups.new(name=mesh.bone_names[bone_idx])
+            weights, weight_starts = np.unique(group_weights, return_index=True)
+            weight_verts = np.split(group_verts, weight_starts[1:])
+            for weight, verts in zip(weights.tolist(), weight_verts):
+                group.add(verts.tolist(), weight, "REPLACE")
 
     def unapply_edge_loop_mesh(self, obj):
         mesh = TrimeshNode.unapply_edge_loop_mesh(self, obj)
@@ -47,16 +75,55 @@ class SkinmeshNode(TrimeshNode):
         return mesh
 
     def unapply_bone_weights(self, obj, mesh):
-        mesh.weights = [[]] * len(mesh.verts)
-        for vert_idx in range(len(mesh.verts)):
-            vert = obj.data.vertices[vert_idx]
-            vert_weights = []
-            for group_weight in vert.groups:
-                if group_weight == 0.0:
-                    continue
-                group = obj.vertex_groups[group_weight.group]
-                vert_weights.append((group.name, group_weight.weight))
-            vert_weights.sort(key=lambda x: x[1], reverse=True)
-            if len(vert_weights) > 4:
-                vert_weights = vert_weights[0:3]
-            mesh.weights[vert_idx] = vert_weights
+        num_verts = len(mesh.verts)
+        vertices = obj.data.vertices[:num_verts]
+
+        # Blender only exposes vertex group weights per vertex, so they are
+        # gathered in one pass and processed as arrays from there on
+        num_groups = [len(vert.groups) for vert in vertices]
+        group_weights = [
+            (group_weight.group, group_weight.weight)
+            for vert in vertices
+            for group_weight in vert.groups
+        ]
+        group_weights = np.array(group_weights, dtype=np.float64).reshape(-1, 2)
+        vert_indices = np.repeat(np.arange(num_verts), num_groups)
+        group_indices = group_weights[:, 0].astype(np.int64)
+        weights = group_weights[:, 1]
+
+        nonzero = weights != 0.0
+        vert_indices = vert_indices[nonzero]
+        group_indices = group_indices[nonzero]
+        weights = weights[nonzero]
+
+        # Keep up to four greatest weights per vertex
+        order = np.lexsort((-weights, vert_indices))
+        vert_indices = vert_indices[order]
+        group_indices = group_indices[order]
+        weights = weights[order]
+        first_slots = np.searchsorted(vert_indices, vert_indices)
+        slots = np.arange(len(vert_indices)) - first_slots
+        top = slots < 4
+        vert_indices = vert_indices[top]
+        group_indices = group_indices[top]
+        weights = weights[top]
+        slots = slots[top]
+
+        # Bones are numbered in order of vertex groups
+        used_groups = np.unique(group_indices)
+        group_lookup = np.full(len(obj.vertex_groups), -1)
+        group_lookup[used_groups] = np.arange(len(used_groups))
+
+        mesh.bone_names = [obj.vertex_groups[idx].name for idx in used_groups.tolist()]
+        mesh.bone_indices = np.full((num_verts, 4), -1)
+        mesh.bone_indices[vert_indices, slots] = group_lookup[group_indices]
+        mesh.bone_weights = np.zeros((num_verts, 4))
+        mesh.bone_weights[vert_indices, slots] = weights
+
+        total_weights = mesh.bone_weights.sum(axis=1, keepdims=True)
+        np.divide(
+            mesh.bone_weights,
+            total_weights,
+            out=mesh.bone_weights,
+            where=total_weights > 0.0,
+        )
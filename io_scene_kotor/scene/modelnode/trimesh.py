@@ -21,6 +21,8 @@ import bpy
 from bpy_extras.io_utils import unpack_list
 from mathutils import Vector
 
+import numpy as np
+
 from ...constants import (
     NULL,
     UV_MAP_MAIN,
@@ -29,10 +31,14 @@ from ...constants import (
     RootType,
     MeshType,
 )
+from ...meshgeometry import weld_vertices
 from ...utils import is_not_null
 from .. import material
 from .base import BaseNode
 
+FACE_ADJACENCY = "kb_face_adjacency"
+FACE_ADJACENCY_HASH = "kb_face_adjacency_hash"
+
 
 class Compression:
     DISABLED = 0
@@ -45,12 +51,15 @@ class FaceList:
         self.uv = []  # UV indices
         self.materials = []
         self.normals = []
+        self.adjacent_faces = []
 
 
 class EdgeLoopMesh:
     def __init__(self):
         self.verts = []  # vertex coordinates
-        self.weights = []  # vertex bone weights
+        self.bone_names = []
+        self.bone_indices = []  # indices into bone_names, four per vertex
+        self.bone_weights = []  # four per vertex
         self.constraints = []  # vertex constraints (danglymesh)
 
         self.loop_verts = []  # vertex indices
@@ -73,36 +82,6 @@ class EdgeLoopMesh:
         return len(self.verts)
 
 
-class SimilarMdlVertex:
-    def __init__(self, coords):
-        self.coords = coords
-        self.value = tuple(int(val * 10000) for val in self.coords)
-
-    def __hash__(self):
-        return hash(self.value)
-
-    def __eq__(self, rhs):
-        return self.value == rhs.value
-
-
-class SimilarEdgeLoopMeshVertex:
-    def __init__(self, coords, normal, uv1, uv2):
-        self.coords = coords
-        self.normal = normal
-        self.uv1 = uv1
-        self.uv2 = uv2
-        self.value = tuple(
-            int(val * 10000)
-            for val in (*self.coords, *self.normal, *self.uv1, *self.uv2)
-        )
-
-    def __hash__(self):
-        return hash(self.value)
-
-    def __eq__(self, rhs):
-        return self.value == rhs.value
-
-
 class TrimeshNode(BaseNode):
     def __init__(self, name="UNNAMED"):
         BaseNode.__init__(self, name)
@@ -144,9 +123,12 @@ class TrimeshNode(BaseNode):
         self.tangents = []
         self.bitangents = []
         self.tangentspacenormals = []
-        self.weights = []
+        self.bone_names = []
+        self.bone_indices = []  # indices into bone_names, four per vertex
+        self.bone_weights = []  # four per vertex
         self.constraints = []
         self.facelist = FaceList()
+        self.face_adjacency_hash = None  # hash of faces the stored adjacency is for
 
     def add_to_collection(self, collection, options):
         mesh = self.mdl_to_edge_loop_mesh()
@@ -162,64 +144,48 @@ class TrimeshNode(BaseNode):
         return obj
 
     def mdl_to_edge_loop_mesh(self):
-        num_faces = len(self.facelist.vertices)
-        num_loops = 3 * num_faces
+        faces = np.asarray(self.facelist.vertices, np.int64).reshape(-1, 3)
+        loop_verts = faces.ravel()
+        num_loops = len(loop_verts)
         mesh = EdgeLoopMesh()
-        mesh.loop_verts = [-1] * num_loops
-        mesh.loop_normals = [(0, 0, 1)] * num_loops
-        mesh.loop_uv1 = [(0, 0)] * num_loops if self.uv1 else []
-        mesh.loop_uv2 = [(0, 0)] * num_loops if self.uv2 else []
         if self.compression != Compression.DISABLED:
-            attrs_to_vert_idx = dict()
-            for face_idx in range(num_faces):
-                face_verts = self.facelist.vertices[face_idx]
-                for i in range(3):
-                    loop_idx = 3 * face_idx + i
-                    vert_idx = face_verts[i]
-                    vert = self.verts[vert_idx]
-                    attrs = SimilarMdlVertex(vert)
-                    if attrs in attrs_to_vert_idx:
-                        mesh.loop_verts[loop_idx] = attrs_to_vert_idx[attrs]
-                    else:
-                        num_verts = len(mesh.verts)
-                        mesh.verts.append(vert)
-                        if self.weights:
-                            mesh.weights.append(self.weights[vert_idx])
-                        if self.constraints:
-                            mesh.constraints.append(self.constraints[vert_idx])
-                        attrs_to_vert_idx[attrs] = num_verts
-                        mesh.loop_verts[loop_idx] = num_verts
-                    if self.normals:
-                        mesh.loop_normals[loop_idx] = self.normals[vert_idx]
-                    if self.uv1:
-                        mesh.loop_uv1[loop_idx] = self.uv1[vert_idx]
-                    if self.uv2:
-                        mesh.loop_uv2[loop_idx] = self.uv2[vert_idx]
-                    if self.tangents and self.bitangents:
-                        mesh.loop_tangents[loop_idx] = self.tangents[vert_idx]
-                        mesh.loop_bitangents[loop_idx] = self.bitangents[vert_idx]
+            verts = np.asarray(self.verts, np.float64).reshape(-1, 3)
+            verts, first_loops, mesh_loop_verts = weld_vertices(verts[loop_verts])
+            mesh_vert_indices = loop_verts[first_loops]
+            mesh.verts = verts.tolist()
+            mesh.loop_verts = mesh_loop_verts.tolist()
+            if len(self.constraints) > 0:
+                mesh.constraints = np.asarray(self.constraints)[mesh_vert_indices]
+                mesh.constraints = mesh.constraints.tolist()
+            if len(self.bone_weights) > 0:
+                mesh.bone_names = self.bone_names
+                mesh.bone_indices = np.asarray(self.bone_indices)[mesh_vert_indices]
+                mesh.bone_weights = np.asarray(self.bone_weights)[mesh_vert_indices]
         else:
             mesh.verts = self.verts
-            mesh.weights = self.weights
+            mesh.loop_verts = loop_verts.tolist()
+            mesh.bone_names = self.bone_names
+            mesh.bone_indices = self.bone_indices
+            mesh.bone_weights = self.bone_weights
             mesh.constraints = self.constraints
-            for face_idx in range(num_faces):
-                face_verts = self.facelist.vertices[face_idx]
-                for i in range(3):
-                    loop_idx = 3 * face_idx + i
-                    vert_idx = face_verts[i]
-                    mesh.loop_verts[loop_idx] = vert_idx
-                    mesh.loop_normals[loop_idx] = self.normals[vert_idx]
-                    if self.uv1:
-                        mesh.loop_uv1[loop_idx] = self.uv1[vert_idx]
-                    if self.uv2:
-                        mesh.loop_uv2[loop_idx] = self.uv2[vert_idx]
-                    if self.tangents and self.bitangents:
-                        mesh.loop_tangents[loop_idx] = self.tangents[vert_idx]
-                        mesh.loop_bitangents[loop_idx] = self.bitangents[vert_idx]
+        if len(self.normals) > 0:
+            mesh.loop_normals = self.loop_values(self.normals, loop_verts, 3)
+        else:
+            mesh.loop_normals = [(0, 0, 1)] * num_loops
+        if len(self.uv1) > 0:
+            mesh.loop_uv1 = self.loop_values(self.uv1, loop_verts, 2)
+        if len(self.uv2) > 0:
+            mesh.loop_uv2 = self.loop_values(self.uv2, loop_verts, 2)
+        if len(self.tangents) > 0 and len(self.bitangents) > 0:
+            mesh.loop_tangents = self.loop_values(self.tangents, loop_verts, 3)
+            mesh.loop_bitangents = self.loop_values(self.bitangents, loop_verts, 3)
         mesh.face_materials = self.facelist.materials
         mesh.face_normals = self.facelist.normals
         return mesh
 
+    def loop_values(self, values, loop_verts, dim):
+        return np.asarray(values, np.float64).reshape(-1, dim)[loop_verts].tolist()
+
     def create_blender_mesh(self, name, mesh):
         bl_mesh = bpy.data.meshes.new(name)
         bl_mesh.vertices.add(mesh.num_verts())
@@ -273,6 +239,10 @@ class TrimeshNode(BaseNode):
         obj.kb.diffuse = self.diffuse
         obj.kb.ambient = self.ambient
 
+        if len(self.facelist.adjacent_faces) > 0:
+            obj[FACE_ADJACENCY] = np.ravel(self.facelist.adjacent_faces).tolist()
+            obj[FACE_ADJACENCY_HASH] = self.face_adjacency_hash
+
     def load_object_data(self, obj, eval_obj, options):
         BaseNode.load_object_data(self, obj, eval_obj, options)
 
@@ -297,46 +267,75 @@ class TrimeshNode(BaseNode):
         self.uvjitter = obj.kb.uvjitter
         self.uvjitterspeed = obj.kb.uvjitterspeed
         self.transparencyhint = obj.kb.transparencyhint
-        self.selfillumcolor = obj.kb.selfillumcolor
-        self.diffuse = obj.kb.diffuse
-        self.ambient = obj.kb.ambient
+        self.selfillumcolor = tuple(obj.kb.selfillumcolor)
+        self.diffuse = tuple(obj.kb.diffuse)
+        self.ambient = tuple(obj.kb.ambient)
 
         mesh = self.unapply_edge_loop_mesh(eval_obj)
         self.edge_loop_to_mdl_mesh(mesh)
 
+        if FACE_ADJACENCY in obj and FACE_ADJACENCY_HASH in obj:
+            values = list(obj[FACE_ADJACENCY])
+            self.facelist.adjacent_faces = [
+                values[i : i + 3] for i in range(0, len(values), 3)
+            ]
+            self.face_adjacency_hash = obj[FACE_ADJACENCY_HASH]
+
     def unapply_edge_loop_mesh(self, obj):
         bl_mesh = obj.data
         bl_mesh.calc_loop_triangles()
         bl_mesh.calc_normals_split()
         if self.tangentspace and bl_mesh.uv_layers:
             bl_mesh.calc_tangents(uvmap=bl_mesh.uv_layers[0].name)
+
+        num_faces = len(bl_mesh.loop_triangles)
+        if num_faces > 0 and self.lightmapped and len(bl_mesh.uv_layers) < 2:
+            raise RuntimeError(
+                "Lightmapped object '{}' is missing second UV map".format(obj.name)
+            )
+
+        verts = np.empty(3 * len(bl_mesh.vertices), np.float32)
+        bl_mesh.vertices.foreach_get("co", verts)
+        loop_verts = np.empty(3 * num_faces, np.int32)
+        bl_mesh.loop_triangles.foreach_get("vertices", loop_verts)
+        loop_indices = np.empty(3 * num_faces, np.int32)
+        bl_mesh.loop_triangles.foreach_get("loops", loop_indices)
+        loop_normals = np.empty(9 * num_faces, np.float32)
+        bl_mesh.loop_triangles.foreach_get("split_normals", loop_normals)
+        face_materials = np.empty(num_faces, np.int32)
+        bl_mesh.loop_triangles.foreach_get("material_index", face_materials)
+        face_normals = np.empty(3 * num_faces, np.float32)
+        bl_mesh.loop_triangles.foreach_get("normal", face_normals)
+
         mesh = EdgeLoopMesh()
-        for vert in bl_mesh.vertices:
-            mesh.verts.append(vert.co[:3])
-        for face in bl_mesh.loop_triangles:
-            for i in range(3):
-                mesh.loop_verts.append(face.vertices[i])
-                mesh.loop_normals.append(face.split_normals[i])
-                loop_idx = face.loops[i]
-                if len(bl_mesh.uv_layers) > 0:
-                    mesh.loop_uv1.append(bl_mesh.uv_layers[0].data[loop_idx].uv[:2])
-                if self.lightmapped:
-                    if len(bl_mesh.uv_layers) > 1:
-                        mesh.loop_uv2.append(bl_mesh.uv_layers[1].data[loop_idx].uv[:2])
-                    else:
-                        raise RuntimeError(
-                            "Lightmapped object '{}' is missing second UV map".format(
-                                obj.name
-                            )
-                        )
-                if self.tangentspace:
-                    loop = bl_mesh.loops[loop_idx]
-                    mesh.loop_tangents.append(loop.tangent)
-                    mesh.loop_bitangents.append(loop.bitangent)
-            mesh.face_materials.append(face.material_index)
-            mesh.face_normals.append(face.normal)
+        mesh.verts = verts.reshape(-1, 3).tolist()
+        mesh.loop_verts = loop_verts.tolist()
+        mesh.loop_normals = loop_normals.reshape(-1, 3).tolist()
+        if num_faces > 0:
+            if len(bl_mesh.uv_layers) > 0:
+                mesh.loop_uv1 = self.get_loop_values(
+                    bl_mesh.uv_layers[0].data, "uv", 2, loop_indices
+                )
+            if self.lightmapped:
+                mesh.loop_uv2 = self.get_loop_values(
+                    bl_mesh.uv_layers[1].data, "uv", 2, loop_indices
+                )
+            if self.tangentspace:
+                mesh.loop_tangents = self.get_loop_values(
+                    bl_mesh.loops, "tangent", 3, loop_indices
+                )
+                mesh.loop_bitangents = self.get_loop_values(
+                    bl_mesh.loops, "bitangent", 3, loop_indices
+                )
+        mesh.face_materials = face_materials.tolist()
+        mesh.face_normals = face_normals.reshape(-1, 3).tolist()
         return mesh
 
+    def get_loop_values(self, collection, attr, dim, loop_indices):
+        values = np.empty(dim * len(collection), np.float32)
+        collection.foreach_get(attr, values)
+        return values.reshape(-1, dim)[loop_indices].tolist()
+
     def edge_loop_to_mdl_mesh(self, mesh):
         self.verts = []
         self.normals = []
@@ -345,48 +344,55 @@ class TrimeshNode(BaseNode):
         self.tangents = []
         self.bitangents = []
         self.tangentspacenormals = []
-        self.weights = []
+        self.bone_names = []
+        self.bone_indices = []
+        self.bone_weights = []
         self.constraints = []
         self.facelist = FaceList()
 
         if self.compression != Compression.DISABLED:
-            attrs_to_vert_idx = dict()
-            for face_idx in range(mesh.num_faces()):
-                vert_indices = [0] * 3
-                for i in range(3):
-                    loop_idx = 3 * face_idx + i
-                    vert_idx = mesh.loop_verts[loop_idx]
-                    vert = mesh.verts[vert_idx]
-                    normal = mesh.loop_normals[loop_idx]
-                    uv1 = mesh.loop_uv1[loop_idx] if mesh.loop_uv1 else (0.0, 0.0)
-                    uv2 = mesh.loop_uv2[loop_idx] if mesh.loop_uv2 else (0.0, 0.0)
-                    attrs = SimilarEdgeLoopMeshVertex(vert, normal, uv1, uv2)
-                    if attrs in attrs_to_vert_idx:
-                        vert_indices[i] = attrs_to_vert_idx[attrs]
-                    else:
-                        num_verts = len(self.verts)
-                        attrs_to_vert_idx[attrs] = num_verts
-                        vert_indices[i] = num_verts
-                        self.verts.append(vert)
-                        self.normals.append(normal)
-                        if mesh.loop_uv1:
-                            self.uv1.append(uv1)
-                        if mesh.loop_uv2:
-                            self.uv2.append(uv2)
-                        if mesh.loop_tangents and mesh.loop_bitangents:
-                            self.tangents.append(mesh.loop_tangents[loop_idx])
-                            self.bitangents.append(mesh.loop_bitangents[loop_idx])
-                            self.tangentspacenormals.append(mesh.loop_normals[loop_idx])
-                        if mesh.weights:
-                            self.weights.append(mesh.weights[vert_idx])
-                        if mesh.constraints:
-                            self.constraints.append(mesh.constraints[vert_idx])
-                self.facelist.vertices.append(vert_indices)
-                self.facelist.uv.append(vert_indices)
+            num_loops = mesh.num_loops()
+            loop_verts = np.asarray(mesh.loop_verts, np.int64)
+            verts = np.asarray(mesh.verts, np.float64).reshape(-1, 3)[loop_verts]
+            normals = np.asarray(mesh.loop_normals, np.float64).reshape(-1, 3)
+            uv1 = np.zeros((num_loops, 2))
+            if mesh.loop_uv1:
+                uv1 = np.asarray(mesh.loop_uv1, np.float64)
+            uv2 = np.zeros((num_loops, 2))
+            if mesh.loop_uv2:
+                uv2 = np.asarray(mesh.loop_uv2, np.float64)
+            _, first_loops, vert_indices = weld_vertices(
+                np.concatenate([verts, normals, uv1, uv2], axis=1)
+            )
+            mesh_vert_indices = loop_verts[first_loops]
+            self.verts = verts[first_loops].tolist()
+            self.normals = normals[first_loops].tolist()
+            if mesh.loop_uv1:
+                self.uv1 = uv1[first_loops].tolist()
+            if mesh.loop_uv2:
+                self.uv2 = uv2[first_loops].tolist()
+            if mesh.loop_tangents and mesh.loop_bitangents:
+                tangents = np.asarray(mesh.loop_tangents, np.float64)
+                bitangents = np.asarray(mesh.loop_bitangents, np.float64)
+                self.tangents = tangents[first_loops].tolist()
+                self.bitangents = bitangents[first_loops].tolist()
+                self.tangentspacenormals = normals[first_loops].tolist()
+            if mesh.constraints:
+                constraints = np.asarray(mesh.constraints)[mesh_vert_indices]
+                self.constraints = constraints.tolist()
+            faces = vert_indices.reshape(-1, 3).tolist()
+            self.facelist.vertices = faces
+            self.facelist.uv = faces
+            if len(mesh.bone_weights) > 0:
+                self.bone_names = mesh.bone_names
+                self.bone_indices = np.asarray(mesh.bone_indices)[mesh_vert_indices]
+                self.bone_weights = np.asarray(mesh.bone_weights)[mesh_vert_indices]
         else:
             num_verts = len(mesh.verts)
             self.verts = mesh.verts
-            self.weights = mesh.weights
+            self.bone_names = mesh.bone_names
+            self.bone_indices = mesh.bone_indices
+            self.bone_weights = mesh.bone_weights
             self.constraints = mesh.constraints
             normals = [Vector((0, 0, 0))] * num_verts
             if mesh.loop_tangents and mesh.loop_bitangents:
@@ -0,0 +1,205 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import numpy as np
+
+from .aabb import generate_tree
+from .constants import NON_WALKABLE
+
+# Slack for bounding boxes stored in single precision and for rays crossing
+# shared edges of adjacent faces
+BOX_EPSILON = 1e-4
+FACE_EPSILON = 1e-7
+
+
+class WalkmeshIndex:
+    def __init__(self, verts, faces, materials, aabbs=None):
+        self.verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+        self.faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        self.materials = np.asarray(materials, dtype=np.int64)
+        self.walkable = ~np.isin(self.materials, NON_WALKABLE)
+
+        # Face planes
+        corners = self.verts[self.faces]
+        self.edges1 = corners[:, 1] - corners[:, 0]
+        self.edges2 = corners[:, 2] - corners[:, 0]
+        normals = np.cross(self.edges1, self.edges2)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        self.normals = np.divide(
+            normals, lengths, out=np.zeros_like(normals), where=lengths > 0.0
+        )
+        self.distances = -np.einsum("ij,ij->i", self.normals, corners[:, 0])
+
+        # Flattened AABB tree, as BWM records or as produced by generate_tree
+        if not len(self.faces):
+            aabbs = np.zeros((0, 10))
+        elif aabbs is None:
+            aabbs = generate_tree(self.verts, self.faces)
+        if isinstance(aabbs, np.ndarray) and aabbs.dtype.names:
+            boxes = aabbs["bounding_box"].astype(np.float64)
+            self.children = np.stack(
+                [aabbs["child_idx1"], aabbs["child_idx2"]], axis=1
+            ).astype(np.int64)
+            self.node_faces = aabbs["face_idx"].astype(np.int64)
+        else:
+            tree = np.asarray(aabbs, dtype=np.float64).reshape(-1, 10)
+            boxes = tree[:, :6]
+            self.children = tree[:, 6:8].astype(np.int64)
+            self.node_faces = tree[:, 8].astype(np.int64)
+        self.box_min = boxes[:, :3] - BOX_EPSILON
+        self.box_max = boxes[:, 3:] + BOX_EPSILON
+
+    @classmethod
+    def from_bwm_reader(cls, reader):
+        # Vertices of a loaded walkmesh are relative to its position, its AABB
+        # tree is not
+        return cls(
+            reader.verts + reader.position,
+            reader.facelist.vertices,
+            reader.facelist.materials,
+            reader.aabbs,
+        )
+
+    @classmethod
+    def from_aabb_node(cls, node):
+        offset = np.add(node.position, node.lytposition)
+        return cls(
+            np.asarray(node.verts, dtype=np.float64).reshape(-1, 3) + offset,
+            node.facelist.vertices,
+            node.facelist.materials,
+        )
+
+    def locate(self, points):
+        # Face under every point, looking straight down from it. Points given
+        # as XY look down from above the walkmesh.
+        points = np.asarray(points, dtype=np.float64)
+        points = points.reshape(-1, points.shape[-1])
+        origins = np.zeros((len(points), 3))
+        origins[:, :2] = points[:, :2]
+        if points.shape[1] > 2:
+            origins[:, 2] = points[:, 2]
+        else:
+            origins[:, 2] = self.box_max[:, 2].max(initial=0.0) + 1.0
+        directions = np.zeros_like(origins)
+        directions[:, 2] = -1.0
+        faces, _ = self.raycast(origins, directions)
+        return faces
+
+    def heights(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        points = points.reshape(-1, points.shape[-1])
+        faces = self.locate(points)
+        found = faces != -1
+        heights = np.full(len(points), np.nan)
+        normals = self.normals[faces[found]]
+        xy = points[found, :2]
+        heights[found] = (
+            -(normals[:, 0] * xy[:, 0] + normals[:, 1] * xy[:, 1])
+            - self.distances[faces[found]]
+        ) / normals[:, 2]
+        return heights
+
+    def is_walkable(self, points):
+        faces = self.locate(points)
+        return (faces != -1) & self.walkable[faces]
+
+    def raycast(self, origins, directions, max_distance=np.inf):
+        # Returns the first face hit by every ray and the distance to it, or -1
+        # and infinity for rays that miss
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        lengths = np.linalg.norm(directions, axis=1, keepdims=True)
+        directions = np.divide(
+            directions, lengths, out=np.zeros_like(directions), where=lengths > 0.0
+        )
+        directions += 0.0  # no negative zeros, for the slab test below
+        with np.errstate(divide="ignore"):
+            inv_directions = 1.0 / directions
+
+        num_rays = len(origins)
+        best_distances = np.full(num_rays, float(max_distance))
+        best_faces = np.full(num_rays, -1)
+        if not len(self.node_faces):
+            return best_faces, np.where(best_faces == -1, np.inf, best_distances)
+
+        # Traverse the tree for all rays at once, keeping a frontier of
+        # (ray, node) pairs, starting from the root
+        rays = np.flatnonzero(lengths[:, 0] > 0.0)
+        nodes = np.zeros(len(rays), dtype=np.int64)
+        while len(rays):
+            t_near, t_far = self.intersect_boxes(
+                origins[rays], inv_directions[rays], nodes
+            )
+            hit = (t_near <= t_far) & (t_far >= 0.0) & (t_near <= best_distances[rays])
+            rays = rays[hit]
+            nodes = nodes[hit]
+
+            node_faces = self.node_faces[nodes]
+            leaf = node_faces != -1
+            self.update_hits(
+                rays[leaf],
+                node_faces[leaf],
+                origins,
+                directions,
+                best_distances,
+                best_faces,
+            )
+
+            rays = np.repeat(rays[~leaf], 2)
+            nodes = self.children[nodes[~leaf]].ravel()
+
+        return best_faces, np.where(best_faces == -1, np.inf, best_distances)
+
+    def intersect_boxes(self, origins, inv_directions, nodes):
+        with np.errstate(invalid="ignore"):
+            t1 = (self.box_min[nodes] - origins) * inv_directions
+            t2 = (self.box_max[nodes] - origins) * inv_directions
+        # Rays parallel to a slab and starting on its boundary are inside it
+        t1 = np.where(np.isnan(t1), -np.inf, t1)
+        t2 = np.where(np.isnan(t2), np.inf, t2)
+        t_near = np.minimum(t1, t2).max(axis=1)
+        t_far = np.maximum(t1, t2).min(axis=1)
+        return t_near, t_far
+
+    def update_hits(self, rays, faces, origins, directions, distances, hit_faces):
+        # Moller-Trumbore intersection of rays with faces
+        ray_origins = origins[rays]
+        ray_directions = directions[rays]
+        edges1 = self.edges1[faces]
+        edges2 = self.edges2[faces]
+        p = np.cross(ray_directions, edges2)
+        det = np.einsum("ij,ij->i", edges1, p)
+        valid = np.abs(det) > 1e-12
+        inv_det = np.divide(1.0, det, out=np.zeros_like(det), where=valid)
+        s = ray_origins - self.verts[self.faces[faces, 0]]
+        u = np.einsum("ij,ij->i", s, p) * inv_det
+        q = np.cross(s, edges1)
+        v = np.einsum("ij,ij->i", ray_directions, q) * inv_det
+        t = np.einsum("ij,ij->i", edges2, q) * inv_det
+        valid &= (u >= -FACE_EPSILON) & (v >= -FACE_EPSILON)
+        valid &= (u + v <= 1.0 + FACE_EPSILON) & (t >= 0.0)
+        valid &= t < distances[rays]
+        rays = rays[valid]
+        faces = faces[valid]
+        t = t[valid]
+
+        # Closest hit per ray
+        np.minimum.at(distances, rays, t)
+        closest = t == distances[rays]
+        hit_faces[rays[closest]] = len(self.faces)
+        np.minimum.at(hit_faces, rays[closest], faces[closest])